@@ -0,0 +1,1290 @@
+import collections
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import random
+import subprocess
+import sys
+import threading
+from time import perf_counter, sleep
+
+import fsspec
+import humanize
+import numpy as np
+import polars as pl
+from fsspec.implementations.memory import MemoryFileSystem
+from rich import print as rprint
+
+from xft import (
+    analysis,
+    archive,
+    consolidate,
+    derived,
+    download,
+    fetch,
+    index,
+    misc,
+    scheduler,
+    scores,
+    tabulate,
+)
+from xft.download import write_parquet
+from xft.manifest import Manifest, PageWriter, page_name, read_manifest, scan_pages
+
+from . import standin
+
+
+def best_time(function, *args, repeats: int = 5, **kwargs) -> float:
+    """Returns the fastest of several timed calls, in seconds."""
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        function(*args, **kwargs)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def record_board(
+    path: str, competition: str, year: int, division: int, page: int
+) -> None:
+    """Saves a leaderboard page from the API as a json file, for benchmarks."""
+    board = fetch.fetch_leaderboard(competition, year, division, page)
+    with open(path, "w") as f:
+        json.dump(board, f)
+    return None
+
+
+def load_board(path: str | None = None) -> dict:
+    """Loads a board saved by record_board or, without a path, makes a synthetic
+    Open board with the same shape."""
+    if path is None:
+        return standin.make_board("open", 2024, 1, 1, last_page=1, workouts=3)
+    with open(path, "r") as f:
+        board = json.load(f)
+    return board
+
+
+def benchmark_tabulation(path: str | None = None, repeats: int = 5) -> dict:
+    """Compares the throughput, in table rows per second, of the columnar and the
+    row-wise leaderboard tabulation on a saved board."""
+    board = load_board(path)
+    rows = len(tabulate.tabulate_leaderboard(board))
+    results = {}
+    for name, function in [
+        ("rowwise", tabulate.tabulate_leaderboard_rowwise),
+        ("columnar", tabulate.tabulate_leaderboard),
+    ]:
+        seconds = best_time(function, board, repeats=repeats)
+        results[name] = rows / seconds
+        rprint(f"{name:>10}: {results[name]:,.0f} rows/s ({1e3 * seconds:.2f} ms/page)")
+    rprint(f"   speedup: {results['columnar'] / results['rowwise']:.1f}x")
+    return results
+
+
+def benchmark_decoding(path: str | None = None, repeats: int = 20) -> dict:
+    """Compares the time per page to decode a response body and tabulate it with
+    the standard json module and with fetch.decode_json, which uses orjson when
+    it's installed. Without a path, a full synthetic Open page is used."""
+    if path is None:
+        contents = json.dumps(
+            standin.make_board("open", 2024, 1, 1, last_page=1, workouts=5)
+        ).encode()
+    else:
+        with open(path, "rb") as f:
+            contents = f.read()
+    if fetch.orjson is None:
+        rprint("orjson isn't installed, so decode_json falls back to the json module")
+    results = {}
+    for name, decode in [("json", json.loads), ("decode_json", fetch.decode_json)]:
+        decoding = best_time(decode, contents, repeats=repeats)
+        total = best_time(
+            lambda: tabulate.tabulate_leaderboard(decode(contents)), repeats=repeats
+        )
+        results[name] = {"decode": decoding, "total": total}
+        rprint(
+            f"{name:>12}: decode {1e3 * decoding:.2f} ms/page, decode+tabulate {1e3 * total:.2f} ms/page"
+        )
+    rprint(
+        f"     speedup: decode {results['json']['decode'] / results['decode_json']['decode']:.1f}x, decode+tabulate {results['json']['total'] / results['decode_json']['total']:.2f}x"
+    )
+    return results
+
+
+def random_measurement(rng: random.Random, units: tuple[str, ...]) -> str | None:
+    """Makes a random height or weight string, mostly plausible but with the
+    kinds of oddities found in user-entered data."""
+    kind = rng.random()
+    if kind < 0.05:
+        return None
+    if kind < 0.1:
+        return rng.choice(["", "None", "abc", "5 ft", "cm", "in", "lb", "kg"])
+    number = rng.choice(
+        [
+            str(rng.randrange(0, 500)),
+            f"{rng.uniform(0, 400):.{rng.randrange(1, 8)}f}",
+            f"{rng.uniform(0, 4):.3e}",
+            f"-{rng.randrange(0, 200)}",
+            "nan",
+            "inf",
+        ]
+    )
+    space = rng.choice(["", " ", "  "])
+    return f"{rng.choice(['', ' '])}{number}{space}{rng.choice(units)}"
+
+
+def random_integer_string(rng: random.Random) -> str | None:
+    return rng.choice(
+        [
+            None,
+            "",
+            "--",
+            "None",
+            "5.0",
+            str(rng.randrange(-5, 5_000)),
+            f" {rng.randrange(0, 100)} ",
+        ]
+    )
+
+
+def cleaning_corpus(n: int, seed: int = 0) -> dict[str, list]:
+    """Makes n random raw values for each cleaning function."""
+    rng = random.Random(seed)
+    return {
+        "height": [random_measurement(rng, ("cm", "in", "CM", "ft")) for _ in range(n)],
+        "weight": [random_measurement(rng, ("lb", "kg", "KG", "st")) for _ in range(n)],
+        "age": [rng.choice([None, rng.randrange(-10, 150)]) for _ in range(n)],
+        "gender": [rng.choice(["M", "F", "", None, "m", "X"]) for _ in range(n)],
+        "workoutRank": [random_integer_string(rng) for _ in range(n)],
+        "workoutScore": [rng.choice(["", None, "4:32", "150 reps"]) for _ in range(n)],
+        "workoutValid": [rng.choice(["0", "1", "", None, " 1", "2"]) for _ in range(n)],
+        "workoutScaled": [rng.choice(["0", "1", "", None, "-1"]) for _ in range(n)],
+    }
+
+
+def clean_scalar(function, value):
+    # Errors from the scalar functions correspond to nulls from the expressions.
+    try:
+        return function(value)
+    except ValueError:
+        return None
+
+
+def compare_cleaning(n: int = 100_000, seed: int = 0) -> None:
+    """Checks that the vectorized cleaning expressions give bit-identical results to
+    the scalar cleaning functions on a random corpus, raising an AssertionError
+    with an example of any difference."""
+    corpus = cleaning_corpus(n, seed)
+    raw = pl.DataFrame(
+        {
+            key: pl.Series(values, dtype=pl.Int64 if key == "age" else pl.String)
+            for key, values in corpus.items()
+        }
+    )
+    vectorized = raw.select(
+        function(pl.col(key)).alias(key)
+        for key, function in tabulate.CLEANING_EXPRS.items()
+    )
+    for key, function in tabulate.CLEANING.items():
+        dtype = vectorized[key].dtype
+        scalar = pl.Series(
+            [clean_scalar(function, value) for value in corpus[key]],
+            dtype=dtype,
+            strict=False,
+        )
+        if dtype == pl.Float32:
+            # Compare bits, treating all NaNs alike.
+            a, b = scalar.fill_nan(None), vectorized[key].fill_nan(None)
+            a = a.to_numpy().view(np.int32) * a.is_not_null().to_numpy()
+            b = b.to_numpy().view(np.int32) * b.is_not_null().to_numpy()
+            same = pl.Series(a == b) & (
+                scalar.is_nan().fill_null(False)
+                == vectorized[key].is_nan().fill_null(False)
+            )
+            same &= scalar.is_null() == vectorized[key].is_null()
+        else:
+            same = scalar.eq_missing(vectorized[key])
+        if not same.all():
+            i = same.arg_min()
+            raise AssertionError(
+                f"Cleaning {key} value {corpus[key][i]!r} gave {scalar[i]!r} from the scalar function but {vectorized[key][i]!r} from the expression."
+            )
+        rprint(f"{key:>14}: {n:,} values identical")
+    return None
+
+
+def benchmark_cleaning(n: int = 1_000_000, seed: int = 0) -> dict:
+    """Compares the time taken by the scalar cleaning functions and the vectorized
+    expressions to clean n random values of each column."""
+    corpus = cleaning_corpus(n, seed)
+    raw = pl.DataFrame(
+        {
+            key: pl.Series(values, dtype=pl.Int64 if key == "age" else pl.String)
+            for key, values in corpus.items()
+        }
+    )
+
+    def scalar():
+        for key, function in tabulate.CLEANING.items():
+            [clean_scalar(function, value) for value in corpus[key]]
+
+    def vectorized():
+        # Collecting lazily lets polars share the subexpressions of the cleaning,
+        # which pays off for frames this large.
+        raw.lazy().select(
+            function(pl.col(key)).alias(key)
+            for key, function in tabulate.CLEANING_EXPRS.items()
+        ).collect()
+
+    results = {
+        "scalar": best_time(scalar, repeats=1),
+        "vectorized": best_time(vectorized, repeats=3),
+    }
+    for name, seconds in results.items():
+        rprint(f"{name:>10}: {seconds:.3f} s for {n:,} rows")
+    rprint(f"   speedup: {results['scalar'] / results['vectorized']:.0f}x")
+    return results
+
+
+def open_year_scores(athletes: int = 350_000, seed: int = 0) -> pl.DataFrame:
+    """Makes a frame of synthetic score displays the size of a full Open year, with
+    three workouts per athlete and a sprinkling of scaled and missing scores."""
+    rng = random.Random(seed)
+    kinds = ("time", "reps", "capped")
+    scores, numbers = [], []
+    for _ in range(athletes):
+        rank = rng.randrange(1, athletes)
+        for number, kind in enumerate(kinds, start=1):
+            score = standin.make_score_display(rng, kind, rank)
+            if rng.random() < 0.1:
+                score = f"{score} - s"
+            elif rng.random() < 0.02:
+                score = rng.choice([None, "--", "102"])
+            scores.append(score)
+            numbers.append(number)
+    return pl.DataFrame(
+        {
+            "competitionType": "open",
+            "year": pl.Series([2024] * len(scores), dtype=pl.Int16),
+            "workoutNumber": pl.Series(numbers, dtype=pl.Int8),
+            "workoutScore": pl.Series(scores, dtype=pl.String),
+        }
+    )
+
+
+def parse_scores_scalar(df: pl.DataFrame) -> pl.DataFrame:
+    kinds = scores.workout_kinds()
+    parsed = [
+        scores.parse_score(score, kinds.get(f"{competition}-{year}-{number}") == "reps")
+        for competition, year, number, score in df.select(
+            "competitionType", "year", "workoutNumber", "workoutScore"
+        ).iter_rows()
+    ]
+    return df.hstack(pl.DataFrame(parsed, schema=scores.SCORE_SCHEMA))
+
+
+def benchmark_score_parsing(athletes: int = 350_000, seed: int = 0) -> dict:
+    """Compares the time taken to parse the scores of a synthetic Open year one at a
+    time and with the vectorized expressions, checking that the results match."""
+    df = open_year_scores(athletes, seed)
+    rprint(f"Parsing {len(df):,} scores.")
+    expected = parse_scores_scalar(df)
+    parsed = scores.with_parsed_scores(df.lazy()).collect()
+    if not parsed.equals(expected):
+        same = pl.DataFrame(
+            [parsed[key].eq_missing(expected[key]) for key in scores.SCORE_SCHEMA]
+        )
+        i = same.select(pl.all_horizontal(pl.all())).to_series().arg_min()
+        raise AssertionError(
+            f"Parsing score {df['workoutScore'][i]!r} gave different results from the scalar and vectorized parsers."
+        )
+    results = {
+        "scalar": best_time(parse_scores_scalar, df, repeats=1),
+        "vectorized": best_time(
+            lambda df: scores.with_parsed_scores(df.lazy()).collect(), df, repeats=3
+        ),
+    }
+    for name, seconds in results.items():
+        rprint(f"{name:>10}: {seconds:.3f} s ({len(df) / seconds:,.0f} scores/s)")
+    rprint(f"   speedup: {results['scalar'] / results['vectorized']:.0f}x")
+    return results
+
+
+def write_synthetic_pages(
+    data_dir: str,
+    competition: str,
+    years: list[int],
+    divisions: list[int],
+    pages: int,
+    workouts: int = 5,
+) -> None:
+    """Writes synthetic leaderboard page files in the layout of download_boards,
+    for benchmarking consolidation and loading without downloading anything."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    for year, division in itertools.product(years, divisions):
+        output_subdir = fs.sep.join(
+            [url, "boards", competition, str(year), f"division-{division:02}"]
+        )
+        fs.mkdirs(output_subdir, exist_ok=True)
+        for page in range(1, pages + 1):
+            board = standin.make_board(
+                competition, year, division, page, last_page=pages, workouts=workouts
+            )
+            df = tabulate.tabulate_leaderboard(board)
+            write_parquet(fs, fs.sep.join([output_subdir, f"{page}.parquet"]), df)
+    return None
+
+
+def benchmark_dataset_query(data_dir: str, repeats: int = 3) -> dict:
+    """Compares loading the overall ranks of Games men from 2015 to 2024 out of the
+    consolidated files for each year, which are read in full, and out of the
+    partitioned dataset. Both must already have been written to data_dir."""
+    years = list(range(2015, 2025))
+    columns = ["competitorId", "competitorName", "year", "overallRank"]
+
+    def full():
+        df = consolidate.load_consolidated(data_dir)
+        return (
+            df.filter(
+                pl.col("competitionType") == "games",
+                pl.col("year").is_in(years),
+                pl.col("divisionId") == 1,
+            )
+            .select(columns)
+            .unique()
+        )
+
+    def partitioned():
+        df = consolidate.load_dataset(
+            data_dir,
+            competitions=["games"],
+            years=years,
+            divisions=[1],
+            columns=columns,
+        )
+        return df.unique()
+
+    # Keep load_consolidated from printing for every file it loads.
+    with contextlib.redirect_stdout(io.StringIO()):
+        key = ["year", "overallRank", "competitorId"]
+        expected = full().sort(key)
+        results = {
+            "full": best_time(full, repeats=repeats),
+            "partitioned": best_time(partitioned, repeats=repeats),
+        }
+    if not partitioned().sort(key).equals(expected):
+        raise AssertionError("The full and partitioned loads gave different results.")
+    for name in results:
+        rprint(f"{name:>12}: {results[name]:.3f} s")
+    rprint(f"     speedup: {results['full'] / results['partitioned']:.0f}x")
+    return results
+
+
+class SlowMemoryFileSystem(MemoryFileSystem):
+    """An in-memory file system that waits before every call, like object storage
+    does, and counts the calls. Calls made by other methods of the file system,
+    like pipe_file opening a file, are part of the outer call."""
+
+    protocol = "slowmemory"
+    cachable = False
+
+    def __init__(self, latency: float = 0.02, **kwargs):
+        super().__init__(**kwargs)
+        # Each instance gets its own files instead of sharing the class's.
+        self.store = {}
+        self.pseudo_dirs = [""]
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._depth = threading.local()
+
+    @contextlib.contextmanager
+    def _call(self, name: str):
+        depth = getattr(self._depth, "value", 0)
+        if depth == 0:
+            self.calls[name] += 1
+            sleep(self.latency)
+        self._depth.value = depth + 1
+        try:
+            yield
+        finally:
+            self._depth.value = depth
+
+    def pipe_file(self, path, value, **kwargs):
+        with self._call("pipe_file"):
+            return super().pipe_file(path, value, **kwargs)
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        with self._call("cat_file"):
+            return super().cat_file(path, start=start, end=end, **kwargs)
+
+    def info(self, path, **kwargs):
+        with self._call("info"):
+            return super().info(path, **kwargs)
+
+    def isfile(self, path):
+        with self._call("isfile"):
+            return super().isfile(path)
+
+    def ls(self, path, detail=True, **kwargs):
+        with self._call("ls"):
+            return super().ls(path, detail=detail, **kwargs)
+
+    def _open(self, path, mode="rb", **kwargs):
+        with self._call("open"):
+            return super()._open(path, mode=mode, **kwargs)
+
+    def rm_file(self, path):
+        with self._call("rm_file"):
+            return super().rm_file(path)
+
+
+def benchmark_chunking(
+    pages: int = 400, chunk_pages: int = 50, latency: float = 0.02
+) -> dict:
+    """Compares writing a division's pages to a file each and packed into chunks on
+    a memory file system with latency on every call, then consolidating them."""
+    tables = {
+        page: tabulate.tabulate_leaderboard(
+            standin.make_board("open", 2024, 1, page, last_page=pages, workouts=3)
+        )
+        for page in range(1, pages + 1)
+    }
+    results, frames = {}, []
+    for name, chunks in [("per-page", None), ("chunked", chunk_pages)]:
+        fs = SlowMemoryFileSystem(latency)
+        subdir = consolidate.division_subdir(fs, "/data", "open", 2024, 1)
+        writer = PageWriter(fs, subdir, Manifest(), chunk_pages=chunks)
+        start = perf_counter()
+        for page, table in tables.items():
+            writer.write(page, table)
+        writer.close()
+        write_seconds = perf_counter() - start
+        write_calls = sum(fs.calls.values())
+        fs.calls.clear()
+        start = perf_counter()
+        found = consolidate.list_divisions(fs, "/data", "open", 2024, [1])
+        df = consolidate.read_parts(fs, found[1].parts)
+        read_seconds = perf_counter() - start
+        read_calls = sum(fs.calls.values())
+        frames.append(df)
+        results[name] = {
+            "write": write_seconds,
+            "read": read_seconds,
+            "files": writer.files,
+        }
+        rprint(
+            f"{name:>9}: {writer.files} files, written in {write_seconds:.2f} s ({write_calls} calls), consolidated in {read_seconds:.2f} s ({read_calls} calls)"
+        )
+    assert frames[0].equals(frames[1])
+    return results
+
+
+def benchmark_retabulation(
+    data_dir: str, pages: int = 200, divisions: tuple[int, ...] = (1, 2, 3, 4)
+) -> dict:
+    """Archives synthetic boards for a few divisions, like downloads with an archive
+    do, then times rebuilding their pages from the archive with one worker process
+    and with one for each core."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    for division in divisions:
+        writer = archive.ArchiveWriter(
+            fs, archive.archive_subdir(fs, url, "open", 2024, division)
+        )
+        for page in range(1, pages + 1):
+            writer.write(
+                page,
+                standin.make_board("open", 2024, division, page, last_page=pages),
+            )
+        writer.close()
+    size = sum(fs.du(fs.sep.join([url, "archive"]), total=False).values())
+    rprint(f"archived {len(divisions) * pages} boards in {humanize.naturalsize(size)}")
+    results, frames = {}, []
+    for workers in [1, None]:
+        start = perf_counter()
+        archive.retabulate_boards(
+            data_dir, "open", [2024], list(divisions), workers=workers
+        )
+        results[workers] = perf_counter() - start
+        frames.append(consolidate.consolidate_boards(data_dir, "open", 2024, 1))
+        rprint(
+            f"retabulated with {workers or 'a worker per core'}: {results[workers]:.2f} s ({len(divisions) * pages / results[workers]:.0f} pages/s)"
+        )
+    assert frames[0].equals(frames[1])
+    return results
+
+
+def benchmark_download_modes(
+    data_dir: str,
+    pages: int = 200,
+    latency: float = 0.05,
+    workers: int | None = None,
+) -> dict:
+    """Times downloading a division from a local stand-in server with the given
+    latency in each download mode, checking that they all write the same table."""
+    config = standin.StandinConfig(last_page=pages, latency=latency)
+    fs, url = fsspec.url_to_fs(data_dir)
+    results, frames = {}, []
+    with standin.serve(config) as server:
+        for mode in download.DOWNLOAD_MODES:
+            output_directory = fs.sep.join([url, mode])
+            start = perf_counter()
+            download.download_boards(
+                output_directory,
+                "open",
+                [2024],
+                [1],
+                mode=mode,
+                api_root=server.root,
+                rate=1_000,
+                max_rate=1_000,
+                workers=workers,
+            )
+            results[mode] = perf_counter() - start
+            frames.append(
+                consolidate.consolidate_boards(output_directory, "open", 2024, 1)
+            )
+    for mode, seconds in results.items():
+        rprint(f"{mode:>9}: {seconds:.2f} s ({pages / seconds:.0f} pages/s)")
+    assert all(frame.equals(frames[0]) for frame in frames)
+    return results
+
+
+def kill_and_resume(
+    data_dir: str,
+    pages: int = 600,
+    kills: int = 3,
+    after: float = 4.0,
+    latency: float = 0.01,
+    mode: str = "serial",
+) -> list[int]:
+    """Starts downloads of a division from a stand-in server in another process and
+    kills them part way, several times, before letting one finish here. After each
+    kill, every page file must be readable and every page in the manifest must
+    match its file. The finished division must equal one downloaded without
+    interruption. Returns the number of pages in the manifest after each kill."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    output, reference = fs.sep.join([url, "killed"]), fs.sep.join([url, "reference"])
+    subdir = consolidate.division_subdir(fs, output, "open", 2024, 1)
+    config = standin.StandinConfig(last_page=pages, latency=latency)
+    checkpoints = []
+    with standin.serve(config) as server:
+        kwargs = dict(mode=mode, api_root=server.root, rate=1_000, max_rate=1_000)
+        code = (
+            "from xft.download import download_boards; "
+            f"download_boards({output!r}, 'open', [2024], [1], **{kwargs!r})"
+        )
+        for kill in range(kills):
+            requests = server.requests
+            process = subprocess.Popen(
+                [sys.executable, "-c", code],
+                cwd=misc.get_root_dir(),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            sleep(after)
+            process.kill()
+            process.wait()
+            for path in fs.glob(fs.sep.join([subdir, "*.parquet"])):
+                pl.scan_parquet(path).select(pl.len()).collect()
+            manifest = read_manifest(fs, subdir) or Manifest()
+            for record in manifest.pages.values():
+                data = fs.cat_file(fs.sep.join([subdir, record.name]))
+                assert hashlib.sha256(data).hexdigest() == record.sha256
+            checkpoints.append(len(manifest.pages))
+            rprint(
+                f"kill {kill + 1}: {server.requests - requests} request(s), {len(manifest.pages)} page(s) checkpointed, last page {manifest.last_page}"
+            )
+        requests = server.requests
+        with contextlib.redirect_stderr(io.StringIO()):
+            download.download_boards(output, "open", [2024], [1], **kwargs)
+        rprint(
+            f"finished with {server.requests - requests} request(s) for {pages - checkpoints[-1]} page(s) missing from the last checkpoint"
+        )
+        with contextlib.redirect_stderr(io.StringIO()):
+            download.download_boards(reference, "open", [2024], [1], **kwargs)
+    assert consolidate.consolidate_boards(output, "open", 2024, 1).equals(
+        consolidate.consolidate_boards(reference, "open", 2024, 1)
+    )
+    return checkpoints
+
+
+def benchmark_listing(pages: int = 400, latency: float = 0.02) -> dict:
+    """Counts the file system calls made, on a memory file system with latency on
+    every call, to write a division's pages and then to decide which pages are
+    present: checking each page file, reading the manifest, and listing the
+    directory once when there is no manifest."""
+    fs = SlowMemoryFileSystem(latency)
+    subdir = consolidate.division_subdir(fs, "/data", "open", 2024, 1)
+    table = tabulate.tabulate_leaderboard(load_board())
+    writer = PageWriter(fs, subdir, Manifest())
+    start = perf_counter()
+    for page in range(1, pages + 1):
+        writer.write(page, table)
+    writer.close()
+    rprint(
+        f"    write: {sum(fs.calls.values())} calls for {pages} pages ({perf_counter() - start:.2f} s)"
+    )
+    expected = set(writer.manifest.pages)
+    checks = {
+        "isfile": lambda: {
+            page
+            for page in range(1, pages + 1)
+            if fs.isfile(fs.sep.join([subdir, page_name(page)]))
+        },
+        "manifest": lambda: set(read_manifest(fs, subdir).pages),
+        "listing": lambda: set(scan_pages(fs, subdir).pages),
+    }
+    results = {}
+    for name, check in checks.items():
+        fs.calls.clear()
+        start = perf_counter()
+        assert check() == expected
+        results[name] = {
+            "calls": sum(fs.calls.values()),
+            "seconds": perf_counter() - start,
+        }
+        rprint(
+            f"{name:>9}: {results[name]['calls']} calls ({results[name]['seconds']:.2f} s)"
+        )
+    return results
+
+
+def benchmark_scheduler(
+    data_dir: str,
+    big_pages: int = 300,
+    small_pages: int = 20,
+    divisions: int = 6,
+    latency: float = 0.05,
+    max_in_flight: int = 8,
+    processes: int = 2,
+) -> dict:
+    """Times downloading one big division and several small ones from a stand-in
+    server, one division at a time with async downloads and then through the
+    scheduler's queue, and then with several scheduler processes sharing the output
+    directory. Every way must write the same tables. The requests made by the
+    processes are counted, which include each one finding every last page."""
+    config = standin.StandinConfig(
+        last_page=small_pages,
+        last_pages={("open", 2024, 1): big_pages},
+        latency=latency,
+    )
+    division_list = list(range(1, divisions + 1))
+    pages = big_pages + small_pages * (divisions - 1)
+    fs, url = fsspec.url_to_fs(data_dir)
+    outputs = {
+        name: fs.sep.join([url, name]) for name in ("async", "scheduled", "shared")
+    }
+    results = {}
+    with standin.serve(config) as server:
+        kwargs = dict(
+            api_root=server.root,
+            rate=1_000,
+            max_rate=1_000,
+            max_in_flight=max_in_flight,
+        )
+        with contextlib.redirect_stderr(io.StringIO()):
+            start = perf_counter()
+            download.download_boards(
+                outputs["async"], "open", [2024], division_list, mode="async", **kwargs
+            )
+            results["async"] = perf_counter() - start
+            conf = download.BoardsConfig(
+                output_directory=outputs["scheduled"],
+                competition="open",
+                years=[2024],
+                divisions=division_list,
+                **kwargs,
+            )
+            start = perf_counter()
+            scheduler.schedule_boards(conf)
+            results["scheduled"] = perf_counter() - start
+        conf.output_directory = outputs["shared"]
+        code = (
+            "from xft.download import BoardsConfig; "
+            "from xft.scheduler import schedule_boards; "
+            f"schedule_boards(BoardsConfig(**{vars(conf)!r}), lease_ttl=30, lease_poll=0.5)"
+        )
+        requests = server.requests
+        start = perf_counter()
+        running = [
+            subprocess.Popen(
+                [sys.executable, "-c", code],
+                cwd=misc.get_root_dir(),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            for _ in range(processes)
+        ]
+        assert all(process.wait() == 0 for process in running)
+        results["shared"] = perf_counter() - start
+        shared_requests = server.requests - requests
+    for name, seconds in results.items():
+        rprint(f"{name:>9}: {seconds:.2f} s ({pages / seconds:.0f} pages/s)")
+    rprint(f"{processes} processes made {shared_requests} request(s) for {pages} pages")
+    for division in division_list:
+        frames = [
+            consolidate.consolidate_boards(output, "open", 2024, division)
+            for output in outputs.values()
+        ]
+        assert all(frame.equals(frames[0]) for frame in frames)
+    return results
+
+
+def benchmark_http_cache(
+    data_dir: str, pages: int = 100, latency: float = 0.02, mode: str = "serial"
+) -> dict:
+    """Downloads a division from a stand-in server several times with forced
+    downloads, to count the requests and body bytes that an HTTP cache saves: with
+    no cache, into an empty cache, from fresh cached responses, from stale cached
+    responses that are revalidated, and into a cache too small to keep them all.
+    Every run must write the same table."""
+    config = standin.StandinConfig(last_page=pages, latency=latency)
+    fs, url = fsspec.url_to_fs(data_dir)
+    cache_dir = fs.sep.join([url, "http-cache"])
+    small_dir = fs.sep.join([url, "http-cache-small"])
+    runs = {
+        "no cache": {},
+        "empty": dict(http_cache=cache_dir),
+        "fresh": dict(http_cache=cache_dir),
+        "stale": dict(http_cache=cache_dir, http_cache_ttl=0.0),
+        "small": dict(http_cache=small_dir, http_cache_bytes=10**6),
+    }
+    results, frames = {}, []
+    with standin.serve(config) as server:
+        for name, kwargs in runs.items():
+            output_directory = fs.sep.join([url, "boards"])
+            requests, sent = server.requests, server.bytes_sent
+            start = perf_counter()
+            with contextlib.redirect_stderr(io.StringIO()):
+                download.download_boards(
+                    output_directory,
+                    "open",
+                    [2024],
+                    [1],
+                    force=True,
+                    mode=mode,
+                    api_root=server.root,
+                    rate=1_000,
+                    max_rate=1_000,
+                    **kwargs,
+                )
+            results[name] = {
+                "requests": server.requests - requests,
+                "bytes": server.bytes_sent - sent,
+                "seconds": perf_counter() - start,
+            }
+            frames.append(
+                consolidate.consolidate_boards(output_directory, "open", 2024, 1)
+            )
+            rprint(
+                f"{name:>9}: {results[name]['requests']} request(s), {humanize.naturalsize(results[name]['bytes'])} sent, {results[name]['seconds']:.2f} s"
+            )
+    assert all(frame.equals(frames[0]) for frame in frames)
+    return results
+
+
+def benchmark_categorical(
+    data_dir: str,
+    years: list[int] = [2023, 2024],
+    divisions: list[int] = [1, 2],
+    pages: int = 100,
+) -> dict:
+    """Consolidates synthetic Open years with plain strings, with categorical
+    columns, and with categorical columns and a separate athlete table, comparing
+    the bytes on disk and in memory. Loading the consolidated files must give the
+    same table every way."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    write_synthetic_pages(data_dir, "open", years, divisions, pages)
+    variants = {
+        "strings": dict(categorical=False),
+        "categorical": dict(categorical=True),
+        "split": dict(categorical=True, split_athletes=True),
+    }
+    results, frames = {}, []
+    for name, options in variants.items():
+        # Athlete tables left by another variant would be loaded too.
+        if fs.exists(fs.sep.join([url, "boards", "athletes"])):
+            fs.rm(fs.sep.join([url, "boards", "athletes"]), recursive=True)
+        paths = []
+        for year in years:
+            path = fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
+            consolidate.stream_consolidated_year(
+                data_dir, year, divisions, path, **options
+            )
+            paths.append(path)
+        paths += fs.glob(fs.sep.join([url, "boards", "athletes", "*.parquet"]))
+        with misc.string_cache():
+            stored = [consolidate.read_parquet(fs, path) for path in paths]
+        with contextlib.redirect_stdout(io.StringIO()):
+            loaded = consolidate.load_consolidated(data_dir)
+        results[name] = {
+            "disk": sum(fs.size(path) for path in paths),
+            "memory": sum(df.estimated_size() for df in stored),
+            "loaded": loaded.estimated_size(),
+        }
+        rprint(
+            f"{name:>11}: {humanize.naturalsize(results[name]['disk'])} on disk, {humanize.naturalsize(results[name]['memory'])} in memory as stored, {humanize.naturalsize(results[name]['loaded'])} loaded"
+        )
+        frames.append(
+            loaded.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.String)).sort(
+                "competitorId", "year", "workoutNumber"
+            )
+        )
+    ids = consistent_athletes(frames[0])
+    frames = [frame.filter(pl.col("competitorId").is_in(ids)) for frame in frames]
+    assert all(frame.equals(frames[0]) for frame in frames)
+    return results
+
+
+def consistent_athletes(df: pl.DataFrame) -> list[int]:
+    """The ids of a frame whose athlete attributes never change and which appear
+    only once in each division. Synthetic ids are random, so a few belong to
+    different athletes, whose attributes can't be kept once per id."""
+    key = [*consolidate.ENTRY_KEY, "workoutNumber"]
+    repeated = df.filter(pl.struct(key).is_duplicated())["competitorId"]
+    return (
+        df.filter(pl.col("competitorId").is_in(repeated.to_list()).not_())
+        .group_by("competitorId")
+        .agg(pl.struct(consolidate.ATHLETE_COLS).n_unique() == 1)
+        .filter(pl.col(consolidate.ATHLETE_COLS[0]))["competitorId"]
+        .to_list()
+    )
+
+
+def benchmark_star(
+    data_dir: str,
+    years: list[int] = [2023, 2024],
+    divisions: list[int] = [1, 2],
+    pages: int = 100,
+    repeats: int = 3,
+) -> dict:
+    """Consolidates synthetic Games and Open years both into a file for each year
+    and into the star schema, comparing their bytes on disk and the time to get
+    overall results, with analysis.overall_results on the loaded years and from
+    the entries table. Joining the star schema back together must give the
+    consolidated rows, and both ways must give the same overall results."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    for competition in ["games", "open"]:
+        write_synthetic_pages(data_dir, competition, years, divisions, pages)
+    flat = []
+    for year in years:
+        path = fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
+        consolidate.stream_consolidated_year(
+            data_dir, year, divisions, path, categorical=True
+        )
+        flat.append(path)
+    star = []
+    for year in years:
+        star += consolidate.consolidate_star(
+            data_dir, year, divisions, categorical=True, force=True
+        )
+    results = {
+        "flat disk": sum(fs.size(path) for path in flat),
+        "star disk": sum(fs.size(path) for path in star),
+    }
+
+    def loaded():
+        return analysis.overall_results(consolidate.load_consolidated(data_dir))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["overall_results"] = best_time(loaded, repeats=repeats)
+        results["entries"] = best_time(
+            analysis.load_overall_results, data_dir, repeats=repeats
+        )
+        df = consolidate.load_consolidated(data_dir)
+        expected, entries = loaded(), analysis.load_overall_results(data_dir)
+    rprint(
+        f"on disk: {humanize.naturalsize(results['flat disk'])} for yearly files, {humanize.naturalsize(results['star disk'])} for the star schema"
+    )
+    for name in ["overall_results", "entries"]:
+        rprint(f"{name:>15}: {results[name]:.3f} s")
+    ids = consistent_athletes(df)
+    key = [*consolidate.ENTRY_KEY, "workoutNumber"]
+    joined = consolidate.load_star(data_dir).filter(pl.col("competitorId").is_in(ids))
+    df = df.filter(
+        pl.col("competitorId").is_in(ids), pl.col("workoutNumber").is_not_null()
+    )
+    assert joined.sort(key).equals(df.sort(key))
+    entries, expected = [
+        frame.filter(pl.col("competitorId").is_in(ids)).sort(consolidate.ENTRY_KEY)
+        for frame in (entries, expected)
+    ]
+    assert entries.equals(expected)
+    return results
+
+
+def benchmark_index(
+    data_dir: str,
+    years: list[int] = [2022, 2023, 2024],
+    divisions: list[int] = [1, 2],
+    pages: int = 500,
+    athletes: int = 20,
+    repeats: int = 3,
+) -> dict:
+    """Builds the athlete index of synthetic consolidated years, then consolidates
+    one year again to time an incremental update. Reading the rows of a few
+    athletes through the index is compared to scanning the consolidated files with
+    a filter, and both must give the same rows."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    for competition in ["games", "open"]:
+        write_synthetic_pages(data_dir, competition, years, divisions, pages)
+    paths = {
+        year: fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
+        for year in years
+    }
+    for year, path in paths.items():
+        consolidate.stream_consolidated_year(
+            data_dir, year, divisions, path, categorical=True
+        )
+    results = {}
+    start = perf_counter()
+    index.update_index(data_dir, force=True)
+    results["build"] = perf_counter() - start
+    consolidate.stream_consolidated_year(
+        data_dir, years[-1], divisions, paths[years[-1]], categorical=True
+    )
+    start = perf_counter()
+    read = index.update_index(data_dir)
+    results["update"] = perf_counter() - start
+    assert read == [years[-1]]
+    athlete_index = index.AthleteIndex(data_dir)
+    rng = np.random.default_rng(0)
+    ids = rng.choice(np.asarray(athlete_index.ids), athletes, replace=False).tolist()
+
+    def scanned():
+        lf = consolidate.scan_parquets(fs, list(paths.values()))
+        return lf.filter(pl.col("competitorId").is_in(ids)).collect()
+
+    results["scan"] = best_time(scanned, repeats=repeats)
+    results["index"] = best_time(athlete_index.read, ids, repeats=repeats)
+    rprint(
+        f"index of {len(athlete_index):,} athletes built in {results['build']:.2f} s, updated for one year in {results['update']:.2f} s"
+    )
+    for name in ["scan", "index"]:
+        rprint(f"{name:>6}: {results[name]:.3f} s to read {athletes} athletes")
+    key = ["competitorId", "year", "competitionType", "divisionId", "workoutNumber"]
+    with misc.string_cache():
+        expected = scanned().sort(key)
+        found = athlete_index.read(ids).sort(key)
+    assert found.equals(expected)
+    return results
+
+
+def characteristics_map_groups(df: pl.DataFrame) -> pl.DataFrame:
+    """The transforms of analysis.prepare_overall_characteristics as they were done
+    before window expressions, one year and division at a time in Python."""
+    df = df.group_by("year", "divisionId").map_groups(
+        lambda g: g.with_columns(
+            inverseNormalTransform=analysis.inverse_normal_transform(
+                g["overallRank"].rank()
+            ),
+        )
+    )
+    return df.group_by("divisionId").map_groups(
+        lambda g: g.with_columns(
+            standardizedHeight=(pl.col("height") - pl.col("height").mean())
+            / pl.col("height").std(),
+            standardizedWeight=(pl.col("weight") - pl.col("weight").mean())
+            / pl.col("weight").std(),
+            standardizedAge=(pl.col("age") - pl.col("age").mean())
+            / pl.col("age").std(),
+        )
+    )
+
+
+def characteristics_windows(df: pl.DataFrame | pl.LazyFrame):
+    return df.with_columns(
+        inverseNormalTransform=analysis.invnt("overallRank", ["year", "divisionId"]),
+        standardizedHeight=analysis.standardized("height", ["divisionId"]),
+        standardizedWeight=analysis.standardized("weight", ["divisionId"]),
+        standardizedAge=analysis.standardized("age", ["divisionId"]),
+    )
+
+
+def benchmark_invnt(data_dir: str, repeats: int = 5) -> dict:
+    """Times the inverse normal transform and standardization of
+    analysis.prepare_overall_characteristics on the overall results of every
+    consolidated year in data_dir, with map_groups and with window expressions,
+    eagerly and lazily. The ways must agree."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = analysis.overall_results(consolidate.load_consolidated(data_dir))
+    df = df.select(
+        "competitorId", "year", "divisionId", "height", "weight", "age", "overallRank"
+    ).drop_nulls()
+    results = {
+        "map_groups": best_time(characteristics_map_groups, df, repeats=repeats),
+        "windows": best_time(characteristics_windows, df, repeats=repeats),
+        "lazy": best_time(
+            lambda: characteristics_windows(df.lazy()).collect(), repeats=repeats
+        ),
+    }
+    rprint(f"{len(df):,} overall results")
+    for name in ["map_groups", "windows", "lazy"]:
+        rprint(f"{name:>10}: {1e3 * results[name]:.1f} ms")
+    key = ["year", "divisionId", "competitorId", "overallRank"]
+    expected = characteristics_map_groups(df).sort(key)
+    for found in [characteristics_windows(df), characteristics_windows(df.lazy())]:
+        found = found.lazy().collect().sort(key)
+        for col in found.columns:
+            assert np.allclose(
+                found[col].to_numpy(), expected[col].to_numpy(), equal_nan=True
+            ), col
+    return results
+
+
+def benchmark_lazy_boards(
+    data_dir: str, year: int = 2024, divisionId: int = 1, repeats: int = 3
+) -> dict:
+    """Times getting the matched Open and Games overall results of one year and
+    division from every consolidated year in data_dir, by loading everything and
+    calling the eager functions of analysis, and with one lazy Boards query,
+    collected normally and with the streaming engine. All ways must give the same
+    frames."""
+
+    def eager():
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = consolidate.load_consolidated(data_dir)
+        opn, gms = analysis.split_competition(
+            analysis.overall_results(df), year, divisionId
+        )
+        return analysis.intersect_athletes(opn, gms)
+
+    def lazy():
+        boards = analysis.Boards.scan(data_dir).overall()
+        return analysis.collect_all(
+            *analysis.Boards.intersect(*boards.split(year, divisionId))
+        )
+
+    def streaming():
+        boards = analysis.Boards.scan(data_dir).overall()
+        opn, gms = boards.split(year, divisionId)
+        opn, gms = opn.intersect(gms)
+        return opn.collect(streaming=True), gms.collect(streaming=True)
+
+    results = {
+        name: best_time(function, repeats=repeats)
+        for name, function in [
+            ("eager", eager),
+            ("lazy", lazy),
+            ("streaming", streaming),
+        ]
+    }
+    for name in results:
+        rprint(f"{name:>10}: {results[name]:.3f} s")
+    key = ["competitorId", "overallRank"]
+    expected = [frame.sort(key) for frame in eager()]
+    for found in [lazy(), streaming()]:
+        for frame, other in zip(found, expected):
+            assert frame.sort(key).equals(other)
+    return results
+
+
+def synthetic_open_games(
+    years: range = range(2011, 2025),
+    divisions: range = range(1, 21),
+    open_athletes: int = 2000,
+    games_athletes: int = 40,
+    workouts: int = 3,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """Makes a leaderboard frame with the overall columns of consolidated Open and
+    Games results for many years and divisions. Most Games athletes were in the
+    Open of their year and division, and a few weren't."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for year in years:
+        for division in divisions:
+            ids = rng.choice(10**8, open_athletes + games_athletes, replace=False)
+            games = np.concatenate([ids[: games_athletes - 5], ids[open_athletes:][:5]])
+            for competition, competitors in [
+                ("open", ids[:open_athletes]),
+                ("games", games),
+            ]:
+                n = len(competitors)
+                frames.append(
+                    pl.DataFrame(
+                        {
+                            "competitorId": competitors,
+                            "competitorName": [f"Athlete {i}" for i in competitors],
+                            "competitionType": competition,
+                            "year": year,
+                            "divisionId": division,
+                            "age": rng.integers(16, 60, n),
+                            "height": rng.normal(1.75, 0.1, n),
+                            "weight": rng.normal(80, 10, n),
+                            "overallRank": rng.permutation(n) + 1,
+                            "overallScore": rng.integers(0, 10**4, n),
+                        }
+                    )
+                )
+    df = pl.concat(frames)
+    return df.join(pl.DataFrame({"workoutNumber": range(1, workouts + 1)}), how="cross")
+
+
+def open_games_loop(boards: pl.DataFrame) -> dict:
+    """Merged Open and Games results of each year and division, as
+    models.create_open_games_groups and merge_rank_columns made them before the
+    groups were prepared in one query, one group at a time in Python."""
+    merged = {}
+    for (year, divisionId), group in boards.group_by(["year", "divisionId"]):
+        opn, gms = analysis.prepare_overall_open_games(group)
+        if opn.is_empty() or gms.is_empty():
+            continue
+        df = opn[
+            ["competitorName", "competitorId", "year", "divisionId"]
+            + ["age", "height", "weight"]
+        ]
+        for col in analysis.RANK_COLUMNS:
+            df = df.with_columns(opn[col].alias(col + "Open"))
+            df = df.with_columns(gms[col].alias(col + "Games"))
+        for col in analysis.RANK_COLUMNS:
+            if col != "overallScore":
+                df = df.with_columns(
+                    (df[col + "Games"] - df[col + "Open"]).alias(col + "Difference")
+                )
+        merged[(year, divisionId)] = df
+    return merged
+
+
+def benchmark_open_games(repeats: int = 3, **kwargs) -> dict:
+    """Times merging the Open and Games results of every year and division in a
+    synthetic frame (see synthetic_open_games), one group at a time and with
+    analysis.merge_open_games. Every group must come out the same."""
+    from polars.testing import assert_frame_equal
+
+    boards = synthetic_open_games(**kwargs)
+    results = {
+        "loop": best_time(open_games_loop, boards, repeats=repeats),
+        "query": best_time(
+            lambda: analysis.merge_open_games(analysis.Boards(boards.lazy())).collect(),
+            repeats=repeats,
+        ),
+    }
+    rprint(f"{len(boards):,} rows")
+    for name in ["loop", "query"]:
+        rprint(f"{name:>6}: {results[name]:.3f} s")
+    expected = open_games_loop(boards)
+    merged = analysis.merge_open_games(analysis.Boards(boards.lazy())).collect()
+    found = merged.partition_by("year", "divisionId", as_dict=True)
+    assert found.keys() == expected.keys()
+    for key, frame in expected.items():
+        assert_frame_equal(found[key], frame)
+    return results
+
+
+def synthetic_attributes(
+    athletes: int = 500_000,
+    entries: int = 4,
+    workouts: int = 3,
+    missing: float = 0.3,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """Makes a frame of athletes' heights and weights over several years, a row for
+    each workout, with a fraction of the entries missing them, as nulls or NaNs."""
+    rng = np.random.default_rng(seed)
+    n = athletes * entries
+    ids = np.repeat(np.arange(athletes), entries)
+    years = rng.integers(2011, 2025, n)
+    attributes = {}
+    for col, mean, std in [("height", 1.75, 0.1), ("weight", 80.0, 10.0)]:
+        values = rng.normal(mean, std, n).astype(np.float32)
+        values[rng.random(n) < missing / 2] = np.nan
+        attributes[col] = pl.Series(col, values).set(
+            pl.Series(rng.random(n) < missing / 2), None
+        )
+    df = pl.DataFrame({"competitorId": ids, "year": years, **attributes})
+    df = df.join(pl.DataFrame({"workoutNumber": range(1, workouts + 1)}), how="cross")
+    return df.sort("year", "competitorId", "workoutNumber")
+
+
+def fill_column_loop(df: pl.DataFrame, col: str) -> pl.DataFrame:
+    """Fills a column the way analysis.fill_column_nans did before it was a query,
+    with a dict of each athlete's last known value and a loop over the rows."""
+    b = ~np.isnan(df[col].to_numpy())
+    cid = df["competitorId"].to_numpy()
+    val = df[col].to_numpy()
+    cid2val = dict(zip(cid[b], val[b]))
+    cid, val = df["competitorId"], df[col].to_numpy()
+    for i in range(len(val)):
+        if np.isnan(val[i]) and cid[i] in cid2val:
+            val[i] = cid2val[cid[i]]
+    return df.with_columns(pl.Series(col, val))
+
+
+def benchmark_fills(loop_rows: int = 200_000, repeats: int = 3, **kwargs) -> dict:
+    """Times filling missing heights and weights of a synthetic table (see
+    synthetic_attributes) with each policy of analysis.with_filled, lazily, and
+    with the old loop on its first loop_rows rows, since it takes minutes on the
+    whole table. On a table sorted by year, most_recent must fill like the loop."""
+    cols = ["height", "weight"]
+    df = synthetic_attributes(**kwargs)
+    results = {}
+    for policy in analysis.FILL_POLICIES:
+        results[policy] = len(df) / best_time(
+            analysis.with_filled, df, cols, policy, repeats=repeats
+        )
+    results["lazy"] = len(df) / best_time(
+        lambda: analysis.with_filled(df.lazy(), cols).collect(), repeats=repeats
+    )
+    head = df.head(loop_rows)
+    start = perf_counter()
+    expected = head
+    for col in cols:
+        expected = fill_column_loop(expected, col)
+    results["loop"] = len(head) / (perf_counter() - start)
+    rprint(f"{len(df):,} rows")
+    for name in [*analysis.FILL_POLICIES, "lazy", "loop"]:
+        rprint(f"{name:>12}: {results[name]:,.0f} rows/s")
+    _, filled = analysis.fill_columns(df, cols)
+    rprint(f"filled {filled}")
+    found = analysis.with_filled(head, cols).with_columns(
+        pl.col(cols).fill_null(np.nan)
+    )
+    assert found.equals(expected.with_columns(pl.col(cols).fill_null(np.nan)))
+    return results
+
+
+def benchmark_derived(data_dir: str, cache_dir: str, repeats: int = 3) -> dict:
+    """Times loading filled boards (analysis.load_cached_boards) and preparing
+    overall characteristics from the consolidated years in data_dir, computed and
+    then from a derived cache in cache_dir. Cached results must equal computed
+    ones, and writing a consolidated file again or changing an argument must mean
+    computing again instead of serving a stale result."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    cache = derived.DerivedCache(cache_dir)
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = perf_counter()
+        boards = analysis.load_cached_boards(data_dir, cache=cache)
+        results["boards computed"] = perf_counter() - start
+        results["boards cached"] = best_time(
+            analysis.load_cached_boards, data_dir, cache=cache, repeats=repeats
+        )
+        assert analysis.load_cached_boards(data_dir, cache=cache).equals(boards)
+        start = perf_counter()
+        prepared = analysis.prepare_overall_characteristics(boards, cache=cache)
+        results["characteristics computed"] = perf_counter() - start
+        results["characteristics cached"] = best_time(
+            analysis.prepare_overall_characteristics,
+            boards,
+            cache=cache,
+            repeats=repeats,
+        )
+        for found, expected in zip(
+            analysis.prepare_overall_characteristics(boards, cache=cache), prepared
+        ):
+            assert found.equals(expected)
+        misses = cache.counts.misses
+        analysis.load_cached_boards(data_dir, fill_weight=False, cache=cache)
+        assert cache.counts.misses == misses + 1
+        # Writing a year again changes its fingerprint.
+        path = fs.glob(fs.sep.join([url, "boards", "consolidated", "*.parquet"]))[0]
+        sleep(0.01)
+        fs.pipe_file(path, fs.cat_file(path))
+        analysis.load_cached_boards(data_dir, cache=cache)
+        assert cache.counts.misses == misses + 2
+    for name, seconds in results.items():
+        rprint(f"{name:>25}: {seconds:.3f} s")
+    rprint(cache.summary())
+    return results
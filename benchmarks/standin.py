@@ -0,0 +1,299 @@
+import hashlib
+import json
+import random
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from urllib.parse import parse_qs, urlsplit
+
+# A few values for filling out synthetic entrants.
+COUNTRIES = {
+    "US": "United States",
+    "CA": "Canada",
+    "AU": "Australia",
+    "IS": "Iceland",
+    "BR": "Brazil",
+    "GB": "United Kingdom",
+}
+
+REGIONS = {
+    1: "North America East",
+    2: "North America West",
+    3: "Europe",
+    4: "Oceania",
+    5: "South America",
+}
+
+SCORE_KINDS = ("time", "reps", "load", "capped")
+
+
+def make_score_display(rng: random.Random, kind: str, rank: int) -> str:
+    if kind == "time":
+        seconds = 240 + 3 * rank + rng.randrange(30)
+        return f"{seconds // 60}:{seconds % 60:02}"
+    elif kind == "reps":
+        return f"{max(1, 300 - 2 * rank - rng.randrange(10))} reps"
+    elif kind == "load":
+        return f"{max(45, 315 - rank - rng.randrange(20))} lb"
+    else:
+        return f"12:00 - CAP + {rank + rng.randrange(5)}"
+
+
+def make_leaderboard_row(
+    rng: random.Random, division: int, rank: int, workout_kinds: tuple[str, ...]
+) -> dict:
+    """Makes a synthetic leaderboard row shaped like the rows of the real API,
+    with the string-valued fields that the API returns."""
+    country = rng.choice(list(COUNTRIES))
+    region = rng.choice(list(REGIONS))
+    if rng.random() < 0.5:
+        height = f"{rng.randrange(150, 200)} cm"
+        weight = f"{rng.randrange(50, 110)} kg"
+    else:
+        height = f"{rng.randrange(59, 79)} in"
+        weight = f"{rng.randrange(110, 240)} lb"
+    # Some athletes leave these empty.
+    if rng.random() < 0.1:
+        height = ""
+    if rng.random() < 0.1:
+        weight = ""
+    competitor_id = rng.randrange(1, 2_000_000)
+    entrant = {
+        "competitorId": str(competitor_id),
+        "competitorName": f"Athlete {competitor_id}",
+        "firstName": "Athlete",
+        "lastName": str(competitor_id),
+        "status": "ACT",
+        "postCompStatus": "",
+        "gender": "M" if division % 2 else "F",
+        "profilePicS3key": "",
+        "countryOfOriginCode": country,
+        "countryOfOriginName": COUNTRIES[country],
+        "regionId": str(region),
+        "regionName": REGIONS[region],
+        "divisionId": str(division),
+        "affiliateId": str(rng.randrange(1, 30_000)) if rng.random() < 0.8 else "0",
+        "affiliateName": "Some Affiliate" if rng.random() < 0.8 else "",
+        "age": rng.randrange(18, 45),
+        "height": height,
+        "weight": weight,
+    }
+    scores = []
+    for ordinal, kind in enumerate(workout_kinds, start=1):
+        workout_rank = max(1, rank + rng.randrange(-10, 10))
+        scores.append(
+            {
+                "ordinal": ordinal,
+                "rank": str(workout_rank),
+                "score": str(rng.randrange(1_000_000)),
+                "scoreDisplay": make_score_display(rng, kind, workout_rank),
+                "valid": "1",
+                "scaled": "0",
+                "heat": "",
+                "lane": "",
+                "breakdown": "",
+                "judge": "",
+                "affiliate": "",
+                "time": "",
+                "video": "0",
+            }
+        )
+    return {
+        "overallRank": str(rank),
+        "overallScore": str(10 * rank + rng.randrange(10)),
+        "nextStage": "",
+        "ui": {"highlight": False},
+        "entrant": entrant,
+        "scores": scores,
+    }
+
+
+def make_board(
+    competition: str,
+    year: int,
+    division: int,
+    page: int,
+    *,
+    last_page: int,
+    rows_per_page: int = 50,
+    workouts: int = 5,
+    pagination: bool = True,
+) -> dict:
+    """Makes a synthetic, but deterministic, leaderboard page. Pages beyond the
+    last page have no rows, as with the real API."""
+    rng = random.Random(f"{competition}-{year}-{division}-{page}")
+    workout_kinds = tuple(SCORE_KINDS[i % len(SCORE_KINDS)] for i in range(workouts))
+    rows = []
+    if 1 <= page <= last_page:
+        first_rank = (page - 1) * rows_per_page + 1
+        for rank in range(first_rank, first_rank + rows_per_page):
+            rows.append(make_leaderboard_row(rng, division, rank, workout_kinds))
+    board = {
+        "version": 2,
+        "competition": {
+            "competitionId": 1,
+            "competitionType": competition,
+            "year": str(year),
+        },
+        "ordinals": [{"ordinal": i + 1} for i in range(workouts)],
+        "leaderboardRows": rows,
+    }
+    if pagination:
+        board["pagination"] = {
+            "totalPages": last_page,
+            "totalCompetitors": last_page * rows_per_page,
+            "currentPage": page,
+        }
+    return board
+
+
+@dataclass
+class StandinConfig:
+    # The last page of every leaderboard, unless listed in last_pages.
+    last_page: int = 10
+    # Last pages for specific (competition, year, division) keys.
+    last_pages: dict = field(default_factory=dict)
+    # Number of rows on each full page.
+    rows_per_page: int = 50
+    # Number of workouts in each row.
+    workouts: int = 5
+    # Seconds to wait before each response, to imitate network latency.
+    latency: float = 0.0
+    # Fraction of requests answered with a 429 status instead of a board.
+    failure_rate: float = 0.0
+    # Seconds sent in the Retry-After header of 429 responses, if any.
+    retry_after: float | None = None
+    # Whether boards include pagination metadata with the total page count.
+    pagination: bool = True
+    # Whether responses carry an ETag, answering 304 to requests that send it back.
+    etags: bool = True
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Answers requests for leaderboard urls built by xft.fetch."""
+
+    # Keep-alive connections, like the real API.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        config = self.server.config
+        self.server.count_request()
+        sleep(config.latency)
+        if self.server.rng.random() < config.failure_rate:
+            headers = {}
+            if config.retry_after is not None:
+                headers["Retry-After"] = str(config.retry_after)
+            self.send_json(429, {"error": "Too many requests"}, headers)
+            return None
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        query = parse_qs(url.query)
+        try:
+            if parts[-1] != "leaderboards":
+                raise ValueError
+            competition, year = parts[-3], int(parts[-2])
+            # The 2024 Games urls contain "finals" in place of the competition.
+            if competition == "finals":
+                competition = "games"
+            division = int(query["division"][0])
+            page = int(query["page"][0])
+        except (ValueError, KeyError, IndexError):
+            self.send_json(404, {"error": "Not found"})
+            return None
+        last_page = config.last_pages.get(
+            (competition, year, division), config.last_page
+        )
+        board = make_board(
+            competition,
+            year,
+            division,
+            page,
+            last_page=last_page,
+            rows_per_page=config.rows_per_page,
+            workouts=config.workouts,
+            pagination=config.pagination,
+        )
+        self.send_json(200, board, etag=config.etags)
+        return None
+
+    def send_json(
+        self,
+        status: int,
+        contents: dict,
+        headers: dict | None = None,
+        etag: bool = False,
+    ):
+        body = json.dumps(contents).encode("utf-8")
+        headers = dict(headers or {})
+        if etag:
+            headers["ETag"] = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        # Counted before sending, so clients that got a response see it counted.
+        self.server.count_bytes(len(body))
+        self.wfile.write(body)
+        return None
+
+    def log_message(self, format, *args):
+        # Stay quiet instead of printing every request to stderr.
+        return None
+
+
+class StandinServer(ThreadingHTTPServer):
+    """A local stand-in for the leaderboard API that serves synthetic boards and
+    counts the requests it receives."""
+
+    daemon_threads = True
+
+    def __init__(self, config: StandinConfig, port: int = 0):
+        super().__init__(("127.0.0.1", port), StandinHandler)
+        self.config = config
+        self.rng = random.Random(0)
+        self.requests = 0
+        # Bytes of response bodies sent.
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled connections is normal and not worth a traceback.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+        return None
+
+    def count_bytes(self, size: int) -> None:
+        with self._lock:
+            self.bytes_sent += size
+        return None
+
+    @property
+    def root(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+@contextmanager
+def serve(config: StandinConfig | None = None, port: int = 0):
+    """Runs a stand-in server on a background thread for the duration of a with
+    block, yielding the server. Pass server.root as the api root of downloads."""
+    server = StandinServer(StandinConfig() if config is None else config, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,271 @@
+import fsspec
+import numpy as np
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from benchmarks import benchmark
+from xft import analysis, consolidate
+
+YEARS = [2023, 2024]
+
+DIVISIONS = [1, 2]
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    data_dir = str(tmp_path_factory.mktemp("data"))
+    fs, url = fsspec.url_to_fs(data_dir)
+    for competition in ["games", "open"]:
+        benchmark.write_synthetic_pages(
+            data_dir, competition, YEARS, DIVISIONS, pages=3, workouts=3
+        )
+    for year in YEARS:
+        path = fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
+        consolidate.stream_consolidated_year(data_dir, year, DIVISIONS, path)
+    return data_dir
+
+
+@pytest.fixture(scope="module")
+def boards(data_dir):
+    return consolidate.load_consolidated(data_dir)
+
+
+def assert_close(found, expected):
+    assert found.columns == expected.columns
+    for col in found.columns:
+        assert np.allclose(
+            found[col].to_numpy(), expected[col].to_numpy(), equal_nan=True
+        ), col
+
+
+def test_invnt_matches_the_transform_of_each_group():
+    ranks = pl.DataFrame({"group": [1, 1, 1, 2, 2], "rank": [3, 1, 2, 2, 1]})
+    found = ranks.select(analysis.invnt("rank", ["group"]))["rank"]
+    expected = np.concatenate(
+        [
+            analysis.inverse_normal_transform(np.array([3, 1, 2])),
+            analysis.inverse_normal_transform(np.array([2, 1])),
+        ]
+    )
+    assert np.allclose(found.to_numpy(), expected)
+
+
+def test_window_characteristics_match_map_groups(boards):
+    df = analysis.overall_results(boards)
+    df = df.select(
+        "competitorId", "year", "divisionId", "height", "weight", "age", "overallRank"
+    ).drop_nulls()
+    key = ["year", "divisionId", "competitorId", "overallRank"]
+    expected = benchmark.characteristics_map_groups(df).sort(key)
+    eager = benchmark.characteristics_windows(df)
+    lazy = benchmark.characteristics_windows(df.lazy()).collect()
+    for found in [eager, lazy]:
+        assert_close(found.sort(key), expected)
+
+
+def test_prepared_characteristics_are_standardized_by_division(boards):
+    df, means, stds = analysis.prepare_overall_characteristics(boards, "open")
+    for (division,), group in df.group_by("divisionId"):
+        for col in ["height", "weight", "age"]:
+            standardized = group[f"standardized{col.title()}"]
+            assert standardized.mean() == pytest.approx(0, abs=1e-5)
+            assert standardized.std() == pytest.approx(1, rel=1e-5)
+            mean = means.filter(pl.col("divisionId") == division)[col].item()
+            assert group[col].mean() == pytest.approx(mean, rel=1e-5)
+        # Ranks within each year are symmetric around the median.
+        sums = group.group_by("year").agg(pl.col("inverseNormalTransform").sum())
+        assert np.allclose(sums["inverseNormalTransform"].to_numpy(), 0)
+
+
+def test_boards_filters_match_eager_filters(data_dir, boards):
+    found = (
+        analysis.Boards.scan(data_dir)
+        .years(2024)
+        .divisions(2)
+        .competition("games")
+        .select("competitorId", "workoutNumber", "workoutScore")
+        .collect()
+    )
+    expected = boards.filter(
+        pl.col("year") == 2024,
+        pl.col("divisionId") == 2,
+        pl.col("competitionType") == "games",
+    ).select(found.columns)
+    key = ["competitorId", "workoutNumber"]
+    assert found.sort(key).equals(expected.sort(key))
+
+
+@pytest.fixture(scope="module")
+def paired(tmp_path_factory, boards):
+    """Consolidated years in which the Games athletes did the Open too, which
+    synthetic boards, with random ids, don't have."""
+    data_dir = str(tmp_path_factory.mktemp("paired"))
+    fs, url = fsspec.url_to_fs(data_dir)
+    opn = boards.filter(pl.col("competitionType") == "games").with_columns(
+        pl.lit("open", boards.schema["competitionType"]).alias("competitionType"),
+        pl.col("overallRank") * 3,
+    )
+    df = pl.concat([boards, opn])
+    fs.mkdirs(fs.sep.join([url, "boards", "consolidated"]))
+    for (year,), group in df.group_by("year"):
+        group.write_parquet(
+            fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
+        )
+    return data_dir, df
+
+
+def overall_of(df, competitionType, year, divisionId):
+    return (
+        df.filter(
+            pl.col("competitionType") == competitionType,
+            pl.col("year") == year,
+            pl.col("divisionId") == divisionId,
+            pl.col("overallRank").is_not_null(),
+        )
+        .unique(consolidate.ENTRY_KEY)
+        .select("competitorId", "overallRank", "overallScore")
+    )
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_lazy_open_and_games_match_eager_results(paired, streaming):
+    data_dir, df = paired
+    opn, gms = [overall_of(df, c, 2024, 1) for c in ["open", "games"]]
+    ids = set(opn["competitorId"]) & set(gms["competitorId"])
+    expected = [
+        frame.filter(pl.col("competitorId").is_in(ids)).sort("competitorId")
+        for frame in (opn, gms)
+    ]
+    overall = analysis.Boards.scan(data_dir).overall()
+    opn, gms = analysis.Boards.intersect(*overall.split(2024, 1))
+    columns = expected[0].columns
+    for found in [
+        [opn.collect(streaming), gms.collect(streaming)],
+        analysis.collect_all(opn, gms),
+        analysis.intersect_athletes(
+            *analysis.split_competition(analysis.overall_results(df), 2024, 1)
+        ),
+    ]:
+        for frame, other in zip(found, expected):
+            assert len(frame) == len(ids) > 0
+            assert frame.select(columns).equals(other)
+
+
+@pytest.fixture(scope="module")
+def open_games():
+    return benchmark.synthetic_open_games(
+        years=range(2022, 2025), divisions=range(1, 4), open_athletes=200
+    )
+
+
+def test_merged_open_games_match_the_loop_over_groups(open_games):
+    expected = benchmark.open_games_loop(open_games)
+    merged = analysis.merge_open_games(analysis.Boards(open_games.lazy())).collect()
+    found = merged.partition_by("year", "divisionId", as_dict=True)
+    assert found.keys() == expected.keys()
+    for key, frame in expected.items():
+        # The Games athletes who weren't in the Open are left out.
+        assert len(frame) == 35
+        assert_frame_equal(found[key], frame)
+    divisions = analysis.merge_open_games(
+        analysis.Boards(open_games.lazy()), divisionIds=[2]
+    ).collect()
+    assert_frame_equal(divisions, merged.filter(pl.col("divisionId") == 2))
+
+
+def test_merged_groups_keep_their_labels(open_games):
+    models = pytest.importorskip("xft.models", exc_type=ImportError)
+    groups = models.create_open_games_groups(open_games)
+    merged = models.merge_rank_columns(groups)
+    assert merged.keys() == groups.keys()
+    expected = analysis.merge_open_games(analysis.Boards(open_games.lazy())).collect()
+    for label, frame in merged.items():
+        year, divisionId = frame["year"][0], frame["divisionId"][0]
+        assert groups[label]["opn"]["year"][0] == year
+        assert_frame_equal(
+            frame,
+            expected.filter(pl.col("year") == year, pl.col("divisionId") == divisionId),
+        )
+
+
+def test_most_recent_fills_like_the_loop():
+    df = benchmark.synthetic_attributes(athletes=2_000)
+    cols = ["height", "weight"]
+    expected = df
+    for col in cols:
+        expected = benchmark.fill_column_loop(expected, col)
+    found = analysis.with_filled(df, cols)
+    assert found.with_columns(pl.col(cols).fill_null(np.nan)).equals(
+        expected.with_columns(pl.col(cols).fill_null(np.nan))
+    )
+    lazy = analysis.with_filled(df.lazy(), cols).collect()
+    assert lazy.equals(found)
+
+
+def attribute_rows(rows):
+    return pl.DataFrame(
+        rows,
+        schema={
+            "competitorId": pl.Int64,
+            "competitionType": pl.String,
+            "year": pl.Int16,
+            "divisionId": pl.Int8,
+            "weight": pl.Float32,
+        },
+        orient="row",
+    )
+
+
+def fills(df, policy):
+    return analysis.with_filled(df, ["weight"], policy)["weight"].to_list()
+
+
+def test_games_are_more_recent_than_the_open():
+    rows = [
+        (1, "games", 2024, 1, 90.0),
+        (1, "open", 2024, 1, 80.0),
+        (1, "open", 2024, 1, 80.0),
+        (1, "open", 2023, 1, None),
+    ]
+    # Whichever order the rows are in, the Games value of 2024 fills 2023.
+    assert fills(attribute_rows(rows), "most_recent") == [90.0, 80.0, 80.0, 90.0]
+    assert fills(attribute_rows(rows[::-1]), "most_recent") == [90.0, 80.0, 80.0, 90.0]
+
+
+def test_medians_count_each_entry_and_year_once():
+    rows = [
+        # Three workouts of one entry count as one value.
+        *[(1, "open", 2023, 1, 80.0)] * 3,
+        (1, "games", 2023, 1, 84.0),
+        (1, "open", 2024, 1, 90.0),
+        (1, "open", 2022, 1, float("nan")),
+        (2, "open", 2022, 1, None),
+    ]
+    # 2023 is the median of its entries, 82, and the athlete's value is the
+    # median of 82 and 90.
+    assert fills(attribute_rows(rows), "median") == [
+        80.0,
+        80.0,
+        80.0,
+        84.0,
+        90.0,
+        86.0,
+        None,
+    ]
+
+
+def test_nearest_fills_from_the_closest_year():
+    rows = [
+        (1, "open", 2020, 1, 70.0),
+        (1, "open", 2021, 1, None),
+        (1, "open", 2023, 1, float("nan")),
+        (1, "open", 2024, 1, 90.0),
+        (1, "open", 2026, 1, None),
+    ]
+    assert fills(attribute_rows(rows), "nearest") == [70.0, 70.0, 90.0, 90.0, 90.0]
+
+
+def test_unknown_fill_policies_fail():
+    with pytest.raises(ValueError):
+        analysis.with_filled(attribute_rows([]), ["weight"], "mean")
@@ -0,0 +1,65 @@
+import fsspec
+import pytest
+
+from benchmarks import standin
+from xft import archive, consolidate, tabulate
+
+DIVISIONS = [1, 2, 3]
+
+
+def archive_boards(data_dir, pages: int, **kwargs) -> None:
+    fs, url = fsspec.url_to_fs(data_dir)
+    for division in DIVISIONS:
+        subdir = archive.archive_subdir(fs, url, "open", 2024, division)
+        writer = archive.ArchiveWriter(fs, subdir, **kwargs)
+        for page in range(1, pages + 1):
+            board = standin.make_board("open", 2024, division, page, last_page=pages)
+            writer.write(page, board)
+        writer.close()
+
+
+@pytest.mark.parametrize(
+    "codec",
+    [
+        "gzip",
+        pytest.param(
+            "zstd",
+            marks=pytest.mark.skipif(
+                archive.zstandard is None, reason="zstandard isn't installed"
+            ),
+        ),
+    ],
+)
+def test_archive_keeps_the_latest_board_of_each_page(tmp_path, codec):
+    fs, url = fsspec.url_to_fs(str(tmp_path))
+    subdir = archive.archive_subdir(fs, url, "open", 2024, 1)
+    writer = archive.ArchiveWriter(fs, subdir, codec, segment_pages=2)
+    boards = [standin.make_board("open", 2024, 1, p, last_page=3) for p in (1, 2, 3)]
+    for page, board in enumerate(boards, start=1):
+        writer.write(page, board)
+    writer.write(2, boards[0])
+    writer.close()
+    assert len(archive.list_segments(fs, subdir)) == 2
+    assert archive.read_archive(fs, subdir) == {
+        1: boards[0],
+        2: boards[0],
+        3: boards[2],
+    }
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_retabulated_pages_match_the_boards(tmp_path, workers):
+    archive_boards(str(tmp_path), pages=7, segment_pages=3)
+    written = archive.retabulate_boards(
+        str(tmp_path), "open", [2024], DIVISIONS, workers=workers
+    )
+    assert written == {(2024, division): 7 for division in DIVISIONS}
+    for division in DIVISIONS:
+        expected = tabulate.tabulate_leaderboards(
+            [
+                standin.make_board("open", 2024, division, page, last_page=7)
+                for page in range(1, 8)
+            ]
+        )
+        found = consolidate.consolidate_boards(str(tmp_path), "open", 2024, division)
+        assert found.equals(expected)
@@ -0,0 +1,32 @@
+import numpy as np
+import polars as pl
+
+from benchmarks import benchmark, standin
+from xft import clean, tabulate
+
+
+def test_expressions_match_scalar_functions():
+    # Raises with an example of any value cleaned differently.
+    benchmark.compare_cleaning(n=5_000)
+
+
+def test_reclean_is_idempotent():
+    board = standin.make_board("open", 2024, 1, 1, last_page=1)
+    df = tabulate.tabulate_leaderboard(board)
+    assert clean.reclean(df).equals(df)
+
+
+def test_reclean_applies_the_current_rules():
+    df = pl.DataFrame(
+        {
+            "height": pl.Series([1.8, 3.0, None], dtype=pl.Float32),
+            "age": pl.Series([30, 5, 40], dtype=pl.Int8),
+            "gender": pl.Series([0, 1, 2], dtype=pl.Int8),
+        }
+    )
+    recleaned = clean.reclean(df.lazy()).collect()
+    # Only the rules of the columns in the frame are applied.
+    assert recleaned.columns == df.columns
+    assert np.isnan(recleaned["height"].to_numpy()[1:]).all()
+    assert recleaned["age"].to_list() == [30, None, 40]
+    assert recleaned["gender"].to_list() == [0, 1, None]
@@ -0,0 +1,289 @@
+import fsspec
+import polars as pl
+import pytest
+
+from benchmarks import benchmark, standin
+from xft import analysis, cli, consolidate, download, manifest, scores
+from xft.download import write_parquet
+
+YEARS = [2023, 2024]
+
+DIVISIONS = [1, 2]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for competition in ["games", "open"]:
+        benchmark.write_synthetic_pages(
+            str(tmp_path), competition, YEARS, DIVISIONS, pages=3, workouts=3
+        )
+    return str(tmp_path)
+
+
+def consolidated_path(data_dir, year):
+    fs, url = fsspec.url_to_fs(data_dir)
+    return fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
+
+
+def test_streaming_matches_in_memory(data_dir):
+    path = consolidated_path(data_dir, 2024)
+    pages = consolidate.stream_consolidated_year(data_dir, 2024, DIVISIONS, path)
+    assert pages == 2 * 2 * 3
+    expected = scores.with_parsed_scores(
+        consolidate.consolidate_year(data_dir, 2024, DIVISIONS)
+    )
+    assert pl.read_parquet(path).equals(expected)
+
+
+def test_streaming_without_pages_writes_nothing(data_dir):
+    path = consolidated_path(data_dir, 2020)
+    assert consolidate.stream_consolidated_year(data_dir, 2020, DIVISIONS, path) == 0
+    assert not fsspec.url_to_fs(path)[0].exists(path)
+
+
+def test_partitioned_dataset_matches_the_year(data_dir):
+    written = consolidate.consolidate_partitions(data_dir, 2024, DIVISIONS)
+    assert len(written) == 2 * len(DIVISIONS)
+    key = ["competitorId", "competitionType", "divisionId", "workoutNumber"]
+    expected = scores.with_parsed_scores(
+        consolidate.consolidate_year(data_dir, 2024, DIVISIONS)
+    ).filter(pl.col("competitionType") == "games", pl.col("divisionId") == 2)
+    found = consolidate.load_dataset(
+        data_dir, competitions=["games"], years=[2024], divisions=[2]
+    )
+    assert found.select(expected.columns).sort(key).equals(expected.sort(key))
+
+
+def test_partitions_are_sorted_by_rank(data_dir):
+    consolidate.consolidate_partitions(data_dir, 2023, [1])
+    fs, url = fsspec.url_to_fs(data_dir)
+    df = pl.read_parquet(consolidate.partition_path(fs, url, "open", 2023, 1))
+    assert df.equals(df.sort(consolidate.PARTITION_SORT, nulls_last=True))
+    assert "year" not in df.columns
+
+
+def rewrite_page(data_dir, competition, year, division, page):
+    fs, url = fsspec.url_to_fs(data_dir)
+    subdir = consolidate.division_subdir(fs, url, competition, year, division)
+    path = fs.sep.join([subdir, f"{page}.parquet"])
+    df = pl.read_parquet(path)
+    download.write_parquet(fs, path, df.head(len(df) - 1))
+
+
+def test_year_fingerprint_follows_pages_and_options(data_dir):
+    fingerprint = consolidate.year_fingerprint(data_dir, 2024, DIVISIONS)
+    assert consolidate.year_fingerprint(data_dir, 2024, DIVISIONS) == fingerprint
+    assert (
+        consolidate.year_fingerprint(data_dir, 2024, DIVISIONS, parse_scores=False)
+        != fingerprint
+    )
+    assert consolidate.year_fingerprint(data_dir, 2023, DIVISIONS) != fingerprint
+    rewrite_page(data_dir, "open", 2024, 2, 3)
+    assert consolidate.year_fingerprint(data_dir, 2024, DIVISIONS) != fingerprint
+
+
+def test_only_changed_partitions_are_written_again(data_dir):
+    consolidate.consolidate_partitions(data_dir, 2024, DIVISIONS)
+    assert consolidate.consolidate_partitions(data_dir, 2024, DIVISIONS) == []
+    rewrite_page(data_dir, "open", 2024, 2, 3)
+    written = consolidate.consolidate_partitions(data_dir, 2024, DIVISIONS)
+    fs, url = fsspec.url_to_fs(data_dir)
+    assert written == [consolidate.partition_path(fs, url, "open", 2024, 2)]
+    forced = consolidate.consolidate_partitions(data_dir, 2024, DIVISIONS, force=True)
+    assert len(forced) == 2 * len(DIVISIONS)
+
+
+def test_downloaded_divisions_are_listed_from_their_manifests(tmp_path):
+    with standin.serve(standin.StandinConfig(last_page=4)) as server:
+        download.download_boards(
+            str(tmp_path),
+            "open",
+            [2024],
+            [1],
+            api_root=server.root,
+            rate=1_000,
+            max_rate=1_000,
+        )
+    fs, url = fsspec.url_to_fs(str(tmp_path))
+    subdir = consolidate.division_subdir(fs, url, "open", 2024, 1)
+    listed = consolidate.list_divisions(fs, url, "open", 2024, [1])
+    division_manifest = manifest.read_manifest(fs, subdir)
+    assert listed[1].fingerprint == division_manifest.fingerprint()
+    assert len(listed[1].parts) == 4
+    assert (
+        len(consolidate.consolidate_boards(str(tmp_path), "open", 2024, 1))
+        == 4 * 50 * 5
+    )
+
+
+def consolidate_variant(data_dir, **options):
+    fs, url = fsspec.url_to_fs(data_dir)
+    # Athlete tables left by another variant would be loaded too.
+    if fs.exists(fs.sep.join([url, "boards", "athletes"])):
+        fs.rm(fs.sep.join([url, "boards", "athletes"]), recursive=True)
+    conf = consolidate.ConsolidationConfig(
+        data_dir, YEARS, DIVISIONS, force=True, index=False, **options
+    )
+    cli.run_consolidation(conf)
+    return consolidate.load_consolidated(data_dir)
+
+
+def comparable(df):
+    return df.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.String)).sort(
+        "competitorId", "competitionType", "year", "divisionId", "workoutNumber"
+    )
+
+
+def test_categorical_columns_are_opt_in(data_dir):
+    assert not consolidate.ConsolidationConfig(data_dir, YEARS).categorical
+    df = consolidate_variant(data_dir)
+    assert not df.select(pl.col(pl.Categorical, pl.Enum)).columns
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_storage_variants_load_the_same_rows(data_dir, streaming):
+    expected = comparable(consolidate_variant(data_dir, streaming=streaming))
+    ids = benchmark.consistent_athletes(expected)
+    expected = expected.filter(pl.col("competitorId").is_in(ids))
+    for options in [
+        dict(categorical=True),
+        dict(categorical=True, split_athletes=True),
+        dict(split_athletes=True),
+    ]:
+        found = comparable(
+            consolidate_variant(data_dir, streaming=streaming, **options)
+        )
+        assert found.filter(pl.col("competitorId").is_in(ids)).equals(expected)
+
+
+def test_split_athletes_keep_their_attributes_of_each_year(data_dir):
+    fs, url = fsspec.url_to_fs(data_dir)
+    fs.mkdirs(fs.sep.join([url, "boards", "consolidated"]), exist_ok=True)
+    first = consolidate.consolidate_year(data_dir, 2023, DIVISIONS)
+    # The same athletes a year older, and heavier, in the next year.
+    second = first.with_columns(
+        pl.lit(2024, first.schema["year"]).alias("year"),
+        pl.col("age") + 1,
+        pl.col("weight") + 2,
+    )
+    for year, df in [(2023, first), (2024, second)]:
+        consolidate.write_athletes(fs, url, year, df)
+        write_parquet(
+            fs,
+            consolidated_path(data_dir, year),
+            consolidate.split_consolidated(df, split_athletes=True),
+        )
+    expected = comparable(pl.concat([first, second]))
+    ids = benchmark.consistent_athletes(expected.filter(pl.col("year") == 2023))
+    found = comparable(consolidate.load_consolidated(data_dir))
+    lazy = comparable(consolidate.scan_consolidated(data_dir).collect())
+    for df in [found, lazy]:
+        assert df.filter(pl.col("competitorId").is_in(ids)).equals(
+            expected.filter(pl.col("competitorId").is_in(ids))
+        )
+
+
+def test_split_years_are_recleaned_with_their_athletes(data_dir):
+    expected = comparable(consolidate_variant(data_dir, split_athletes=True))
+    consolidate.reclean_consolidated(data_dir)
+    assert comparable(consolidate.load_consolidated(data_dir)).equals(expected)
+    fs, url = fsspec.url_to_fs(data_dir)
+    athletes = pl.read_parquet(consolidate.athlete_path(fs, url, 2024))
+    # Out of range values are removed from the athlete tables too.
+    write_parquet(
+        fs,
+        consolidate.athlete_path(fs, url, 2024),
+        athletes.with_columns(pl.lit(1_000.0, pl.Float32).alias("height")),
+    )
+    consolidate.reclean_consolidated(data_dir, years=[2024])
+    athletes = pl.read_parquet(consolidate.athlete_path(fs, url, 2024))
+    assert athletes["height"].is_nan().all()
+
+
+@pytest.fixture
+def star_dir(data_dir):
+    for year in YEARS:
+        path = consolidated_path(data_dir, year)
+        consolidate.stream_consolidated_year(data_dir, year, DIVISIONS, path)
+        consolidate.consolidate_star(data_dir, year, DIVISIONS)
+    return data_dir
+
+
+def test_star_schema_joins_back_to_the_consolidated_rows(star_dir):
+    df = consolidate.load_consolidated(star_dir)
+    ids = benchmark.consistent_athletes(df)
+    key = [*consolidate.ENTRY_KEY, "workoutNumber"]
+    joined = consolidate.load_star(star_dir).filter(pl.col("competitorId").is_in(ids))
+    expected = df.filter(
+        pl.col("competitorId").is_in(ids), pl.col("workoutNumber").is_not_null()
+    )
+    assert joined.sort(key).equals(expected.sort(key))
+    found = consolidate.load_star(star_dir, years=[2023], columns=["year"])
+    assert found.columns == ["year"] and found["year"].unique().to_list() == [2023]
+
+
+def test_entries_give_the_overall_results(star_dir):
+    df = consolidate.load_consolidated(star_dir)
+    ids = benchmark.consistent_athletes(df)
+    expected, entries = [
+        frame.filter(pl.col("competitorId").is_in(ids)).sort(consolidate.ENTRY_KEY)
+        for frame in (
+            analysis.overall_results(df),
+            analysis.load_overall_results(star_dir),
+        )
+    ]
+    assert entries.equals(expected)
+
+
+def test_unchanged_star_years_are_skipped(star_dir):
+    assert consolidate.consolidate_star(star_dir, 2024, DIVISIONS) == []
+    rewrite_page(star_dir, "games", 2024, 1, 2)
+    written = consolidate.consolidate_star(star_dir, 2024, DIVISIONS)
+    assert len(written) == 1 + len(consolidate.STAR_TABLES)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_rows_without_ids_keep_their_attributes_when_split(data_dir, streaming):
+    fs, url = fsspec.url_to_fs(data_dir)
+    subdir = consolidate.division_subdir(fs, url, "open", 2024, 1)
+    path = fs.sep.join([subdir, "1.parquet"])
+    df = pl.read_parquet(path)
+    # The first rows of a page lose their ids.
+    write_parquet(
+        fs,
+        path,
+        df.with_columns(
+            pl.when(pl.int_range(pl.len()) >= 20).then(pl.col("competitorId"))
+        ),
+    )
+    expected = comparable(consolidate_variant(data_dir, streaming=streaming))
+    found = comparable(
+        consolidate_variant(data_dir, streaming=streaming, split_athletes=True)
+    )
+    missing = pl.col("competitorId").is_null()
+    assert expected.filter(missing)["competitorName"].null_count() == 0
+    for frame in [found, expected]:
+        assert len(frame.filter(missing)) == 20
+    assert (
+        found.filter(missing)
+        .sort(pl.all())
+        .equals(expected.filter(missing).sort(pl.all()))
+    )
+    ids = benchmark.consistent_athletes(expected)
+    assert found.filter(pl.col("competitorId").is_in(ids)).equals(
+        expected.filter(pl.col("competitorId").is_in(ids))
+    )
+    consolidate.reclean_consolidated(data_dir)
+    assert comparable(consolidate.load_consolidated(data_dir)).equals(found)
+
+
+def test_frames_sunk_together_match_frames_sunk_alone(data_dir):
+    fs, url = fsspec.url_to_fs(data_dir)
+    pages = consolidate.list_year(fs, url, 2024, DIVISIONS)
+    lf = consolidate.scan_parts(fs, [part for p in pages for part in p.parts])
+    frames = [consolidate.athlete_table(lf), consolidate.entries_table(lf)]
+    paths = [fs.sep.join([url, "sunk", f"{i}.parquet"]) for i in range(2)]
+    consolidate.sink_parquets(fs, list(zip(paths, frames)))
+    for path, frame in zip(paths, frames):
+        assert pl.read_parquet(path).equals(frame.collect())
+    assert sorted(fs.ls(fs.sep.join([url, "sunk"]))) == sorted(paths)
@@ -0,0 +1,106 @@
+import os
+
+import fsspec
+import polars as pl
+import pytest
+
+from benchmarks import benchmark
+from xft import analysis, consolidate, derived
+from xft.download import write_parquet
+
+
+def frames():
+    return {
+        "first": pl.DataFrame({"a": [1, 2, 3]}),
+        "rest": (pl.DataFrame({"b": ["x"]}), [pl.DataFrame({"c": [0.5]})]),
+    }
+
+
+def equal(found, expected):
+    if isinstance(expected, pl.DataFrame):
+        return found.equals(expected)
+    if isinstance(expected, dict):
+        return found.keys() == expected.keys() and all(
+            equal(found[k], v) for k, v in expected.items()
+        )
+    return type(found) is type(expected) and all(
+        equal(f, e) for f, e in zip(found, expected, strict=True)
+    )
+
+
+def test_results_are_computed_once_for_the_same_params(tmp_path):
+    cache = derived.DerivedCache(tmp_path)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return frames()
+
+    for params in [{"x": 1}, {"x": 1}, {"x": 2}]:
+        assert equal(cache.get(frames, params, compute), frames())
+    assert len(calls) == 2
+    assert (cache.counts.hits, cache.counts.misses) == (1, 2)
+    # Another cache on the same directory finds the stored results.
+    other = derived.DerivedCache(tmp_path)
+    assert equal(other.get(frames, {"x": 2}, compute), frames())
+    assert len(calls) == 2
+
+
+def test_keys_change_with_the_code(tmp_path, monkeypatch):
+    cache = derived.DerivedCache(tmp_path)
+    key = cache.key(frames, {"x": 1})
+    assert cache.key(frames, {"x": 1}) == key
+    assert cache.key(equal, {"x": 1}) != key
+    monkeypatch.setattr(derived, "package_hash", lambda: "changed")
+    assert cache.key(frames, {"x": 1}) != key
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    cache = derived.DerivedCache(tmp_path)
+    for x in range(3):
+        cache.get(frames, {"x": x}, frames)
+        # Artifacts written within the resolution of the clock would tie.
+        artifact = tmp_path / cache.key(frames, {"x": x}) / derived.ARTIFACT_FILE
+        os.utime(artifact, (1_000 + x, 1_000 + x))
+    size = sum(file.stat().st_size for file in tmp_path.rglob("*") if file.is_file())
+    cache.get(frames, {"x": 0}, frames)
+    cache.max_bytes = size // 2
+    cache.evict()
+    assert cache.counts.evictions == 2
+    cache.get(frames, {"x": 0}, frames)
+    assert cache.counts.hits == 2
+    with pytest.raises(TypeError):
+        cache.get(frames, {"x": 3}, lambda: {1: pl.DataFrame()})
+
+
+def test_fingerprints_follow_the_data(tmp_path):
+    data_dir = str(tmp_path)
+    fs, url = fsspec.url_to_fs(data_dir)
+    benchmark.write_synthetic_pages(data_dir, "open", [2024], [1], pages=2)
+    path = fs.sep.join([url, "boards", "consolidated", "2024.parquet"])
+    consolidate.stream_consolidated_year(data_dir, 2024, [1], path)
+    fingerprint = derived.data_fingerprint(data_dir)
+    assert derived.data_fingerprint(data_dir) == fingerprint
+    df = pl.read_parquet(path)
+    write_parquet(fs, path, df.head(len(df) - 1))
+    assert derived.data_fingerprint(data_dir) != fingerprint
+    frame = derived.frame_fingerprint(df)
+    assert derived.frame_fingerprint(df.clone()) == frame
+    assert derived.frame_fingerprint(df.reverse()) != frame
+    assert derived.frame_fingerprint(df.rename({"age": "years"})) != frame
+
+
+def test_cached_boards_are_loaded_again_until_the_data_changes(tmp_path):
+    data_dir = str(tmp_path / "data")
+    fs, url = fsspec.url_to_fs(data_dir)
+    benchmark.write_synthetic_pages(data_dir, "open", [2024], [1], pages=2)
+    path = fs.sep.join([url, "boards", "consolidated", "2024.parquet"])
+    consolidate.stream_consolidated_year(data_dir, 2024, [1], path)
+    cache = derived.DerivedCache(tmp_path / "cache")
+    expected = analysis.load_cached_boards(data_dir, cache=cache)
+    assert analysis.load_cached_boards(data_dir, cache=cache).equals(expected)
+    assert cache.counts.hits == 1
+    analysis.load_cached_boards(data_dir, policy="median", cache=cache)
+    consolidate.stream_consolidated_year(data_dir, 2024, [1], path, categorical=True)
+    analysis.load_cached_boards(data_dir, cache=cache)
+    assert (cache.counts.hits, cache.counts.misses) == (1, 3)
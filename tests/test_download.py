@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import subprocess
+import sys
+import time
+
+import fsspec
+import polars as pl
+import pytest
+
+from benchmarks import standin
+from xft import archive, consolidate, download, fetch, manifest, misc
+from xft.ratelimit import RateLimiter
+
+
+def download_division(output_directory, server, mode, **kwargs):
+    download.download_boards(
+        str(output_directory),
+        "open",
+        [2024],
+        [1],
+        mode=mode,
+        api_root=server.root,
+        rate=1_000,
+        max_rate=1_000,
+        **kwargs,
+    )
+    return consolidate.consolidate_boards(str(output_directory), "open", 2024, 1)
+
+
+def test_download_modes_match(tmp_path):
+    with standin.serve(standin.StandinConfig(last_page=12)) as server:
+        frames = [
+            download_division(tmp_path / mode, server, mode, max_in_flight=4)
+            for mode in download.DOWNLOAD_MODES
+        ]
+    assert len(frames[0]) == 12 * 50 * 5
+    assert all(frame.equals(frames[0]) for frame in frames)
+
+
+def test_gather_or_cancel_cancels_siblings():
+    cancelled = []
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise KeyError("failed")
+
+    async def wait():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        return await download.gather_or_cancel(fail(), wait(), wait())
+
+    with pytest.raises(KeyError):
+        asyncio.run(run())
+    assert cancelled == [True, True]
+
+
+def test_gather_or_cancel_gives_results_in_order():
+    async def value(x, delay):
+        await asyncio.sleep(delay)
+        return x
+
+    async def run():
+        return await download.gather_or_cancel(value(1, 0.02), value(2, 0.0))
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_failures_are_retried_max_tries_times():
+    config = standin.StandinConfig(failure_rate=1.0)
+    limiter = RateLimiter(rate=1_000, max_rate=1_000, cooldown=0.0)
+    with standin.serve(config) as server:
+        url = fetch.make_leaderboard_url("open", 2024, 1, 1, server.root)
+        contents = download.fetch_with_retries(
+            url, "page 1", limiter, max_tries=3, ignore_failures=True
+        )
+        requests = server.requests
+    assert contents is None
+    assert requests == 4
+    assert limiter.counts.throttles == 4
+    assert limiter.counts.retries == 3
+
+
+def test_dropped_connections_are_retried():
+    # Nothing listens on a server's port once it's closed.
+    with standin.serve() as server:
+        url = fetch.make_leaderboard_url("open", 2024, 1, 1, server.root)
+    limiter = RateLimiter(rate=1_000, max_rate=1_000)
+    with pytest.raises(Exception, match="after 2 attempts"):
+        download.fetch_with_retries(url, "page 1", limiter, max_tries=2)
+    assert limiter.counts.throttles == 3
+
+
+def run_search(search, last_page):
+    try:
+        page = next(search)
+        while True:
+            page = search.send(1 <= page <= last_page)
+    except StopIteration as stop:
+        return stop.value
+
+
+@pytest.mark.parametrize("start", [None, 1, 7, 40])
+def test_gallop_finds_the_last_page(start):
+    for last_page in range(0, 60):
+        search = download.gallop_last_page(1, 50, start)
+        assert run_search(search, last_page) == min(last_page, 50)
+
+
+def test_gallop_checks_fewer_pages_than_bisection():
+    for last_page in [1, 5, 30, 200]:
+        gallop = download.gallop_last_page(1, download.DEFAULT_MAX_PAGE)
+        bisect = download.bisect_last_page(1, download.DEFAULT_MAX_PAGE)
+        assert download.count_search_requests(
+            gallop, last_page
+        ) < download.count_search_requests(bisect, last_page)
+
+
+@pytest.mark.parametrize("pagination", [True, False])
+def test_discovery_keeps_the_probed_boards(pagination):
+    config = standin.StandinConfig(last_page=13, pagination=pagination)
+    limiter = RateLimiter(rate=1_000, max_rate=1_000)
+    with standin.serve(config) as server:
+        discovery = download.discover_last_page(
+            "open", 2024, 1, 1, 100, root=server.root, limiter=limiter
+        )
+        requests = server.requests
+    assert discovery.complete and discovery.last_page == 13
+    assert discovery.requests == requests
+    # The total page count on the first board ends the search.
+    assert requests == 1 if pagination else requests > 1
+    assert all(1 <= page <= 13 for page in discovery.boards)
+    assert all(download.board_has_rows(board) for board in discovery.boards.values())
+
+
+def test_decode_and_tabulate_takes_bodies_or_boards():
+    board = standin.make_board("open", 2024, 1, 1, last_page=1)
+    table, line, _ = download.decode_and_tabulate(1, fetch.encode_json(board), True)
+    assert table.equals(download.decode_and_tabulate(1, board, False)[0])
+    assert fetch.decode_json(line)["board"] == board
+
+
+def test_pipelined_downloads_archive_and_chunk_like_serial(tmp_path):
+    with standin.serve(standin.StandinConfig(last_page=9)) as server:
+        serial = download_division(tmp_path / "serial", server, "serial")
+        pipelined = download_division(
+            tmp_path / "pipelined",
+            server,
+            "pipelined",
+            workers=2,
+            queue_size=2,
+            chunk_pages=4,
+            archive="gzip",
+        )
+    assert pipelined.equals(serial)
+    fs, url = fsspec.url_to_fs(str(tmp_path / "pipelined"))
+    boards = archive.read_archive(fs, archive.archive_subdir(fs, url, "open", 2024, 1))
+    assert sorted(boards) == list(range(1, 10))
+
+
+def test_the_queue_must_hold_a_page(tmp_path):
+    with pytest.raises(ValueError, match="queue"):
+        download.download_boards(
+            str(tmp_path), "open", [2024], [1], mode="pipelined", queue_size=0
+        )
+
+
+def test_downloads_resume_from_the_manifest(tmp_path):
+    with standin.serve(standin.StandinConfig(last_page=10)) as server:
+        expected = download_division(tmp_path, server, "serial")
+        fs, url = fsspec.url_to_fs(str(tmp_path))
+        subdir = consolidate.division_subdir(fs, url, "open", 2024, 1)
+        division_manifest = manifest.read_manifest(fs, subdir)
+        assert division_manifest.last_page == 10
+        # Forget some pages, like a download killed before writing them.
+        for page in [4, 9, 10]:
+            record = division_manifest.pages.pop(page)
+            fs.rm_file(fs.sep.join([subdir, record.name]))
+        fs.pipe_file(
+            manifest.manifest_path(fs, subdir), division_manifest.to_json().encode()
+        )
+        requests = server.requests
+        found = download_division(tmp_path, server, "serial")
+        requests = server.requests - requests
+    assert found.equals(expected)
+    # The missing pages, plus the probes confirming the last page.
+    assert 3 <= requests <= 5
+
+
+def test_killed_downloads_resume_without_trusting_partial_files(tmp_path):
+    fs, url = fsspec.url_to_fs(str(tmp_path))
+    killed, reference = fs.sep.join([url, "killed"]), fs.sep.join([url, "reference"])
+    subdir = consolidate.division_subdir(fs, killed, "open", 2024, 1)
+    pages = 60
+    with standin.serve(standin.StandinConfig(last_page=pages)) as server:
+        kwargs = dict(api_root=server.root, rate=1_000, max_rate=1_000)
+        # The manifest is saved more often than usual, so a few pages are enough.
+        code = (
+            "from xft import download; download.MANIFEST_SAVE_INTERVAL = 5; "
+            f"download.download_boards({killed!r}, 'open', [2024], [1], **{kwargs!r})"
+        )
+        process = subprocess.Popen(
+            [sys.executable, "-c", code],
+            cwd=misc.get_root_dir(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        while server.requests < 20:
+            assert process.poll() is None
+            time.sleep(0.01)
+        process.kill()
+        process.wait()
+        for path in fs.glob(fs.sep.join([subdir, "*.parquet"])):
+            pl.scan_parquet(path).select(pl.len()).collect()
+        division_manifest = manifest.read_manifest(fs, subdir)
+        assert 0 < len(division_manifest.pages) < pages
+        for record in division_manifest.pages.values():
+            data = fs.cat_file(fs.sep.join([subdir, record.name]))
+            assert hashlib.sha256(data).hexdigest() == record.sha256
+        # A page file cut short, which isn't in the manifest, is downloaded again.
+        page = min(set(range(1, pages + 1)) - set(division_manifest.pages))
+        first = next(iter(division_manifest.pages.values()))
+        data = fs.cat_file(fs.sep.join([subdir, first.name]))
+        fs.pipe_file(fs.sep.join([subdir, manifest.page_name(page)]), data[:100])
+        found = download_division(killed, server, "serial")
+        expected = download_division(reference, server, "serial")
+    assert len(expected) == pages * 50 * 5
+    assert found.equals(expected)
@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+from benchmarks import standin
+from xft import fetch
+
+
+@pytest.fixture(params=["orjson", "json"])
+def decoder(request, monkeypatch):
+    if request.param == "orjson":
+        if fetch.orjson is None:
+            pytest.skip("orjson isn't installed")
+    else:
+        monkeypatch.setattr(fetch, "orjson", None)
+    return request.param
+
+
+def test_json_round_trips(decoder):
+    board = standin.make_board("open", 2024, 1, 1, last_page=1)
+    encoded = fetch.encode_json(board)
+    assert b"\n" not in encoded
+    assert fetch.decode_json(encoded) == board
+    assert fetch.decode_json(encoded.decode()) == board
+    assert fetch.decode_json(json.dumps(board, indent=2).encode()) == board
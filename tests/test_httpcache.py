@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+
+import aiohttp
+import pytest
+
+from benchmarks import standin
+from xft import fetch
+from xft.httpcache import HttpCache
+
+
+def fetch_all(urls, mode):
+    if mode == "serial":
+        return [fetch.fetch_bytes(url) for url in urls]
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return [await fetch.fetch_async(session, url) for url in urls]
+
+    return [fetch.encode_json(board) for board in asyncio.run(run())]
+
+
+@pytest.mark.parametrize("mode", ["serial", "async"])
+def test_fresh_responses_need_no_request_and_stale_ones_no_body(tmp_path, mode):
+    with standin.serve() as server:
+        urls = [
+            fetch.make_leaderboard_url("open", 2024, 1, page, server.root)
+            for page in [1, 2, 3]
+        ]
+        with fetch.use_cache(HttpCache(tmp_path, ttl=None)) as cache:
+            expected = fetch_all(urls, mode)
+            requests = server.requests
+            assert fetch_all(urls, mode) == expected
+            assert server.requests == requests
+            assert cache.counts.hits == 3
+        with fetch.use_cache(HttpCache(tmp_path, ttl=0.0)) as cache:
+            requests, sent = server.requests, server.bytes_sent
+            assert fetch_all(urls, mode) == expected
+            assert server.requests - requests == 3
+            assert server.bytes_sent == sent
+            assert cache.counts.revalidations == 3
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    cache = HttpCache(tmp_path, max_bytes=25)
+    for url in ["a", "b", "c"]:
+        cache.store(url, b"0123456789", {})
+    assert cache.lookup("a") is None
+    assert cache.counts.evictions == 1
+    # Entries are loaded again in the order they were used.
+    cache.lookup("b")
+    cache.store("d", b"0123456789", {})
+    reloaded = HttpCache(tmp_path, max_bytes=25)
+    assert reloaded.lookup("c") is None
+    assert reloaded.lookup("b")[1] == b"0123456789"
+
+
+class NotModifiedHandler(BaseHTTPRequestHandler):
+    # Answers every request with a 304, whatever it sent.
+    def do_GET(self):
+        self.send_response(304)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        return None
+
+
+@contextmanager
+def serve_not_modified():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NotModifiedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        yield f"http://{host}:{port}/page"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_a_304_without_a_cached_response_fails(tmp_path):
+    with serve_not_modified() as url, fetch.use_cache(HttpCache(tmp_path)):
+        with pytest.raises(HTTPError):
+            fetch.fetch_bytes(url)
+
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                return await fetch.fetch_async(session, url)
+
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            asyncio.run(run())
+        assert error.value.status == 304
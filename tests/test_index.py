@@ -0,0 +1,82 @@
+import fsspec
+import numpy as np
+import polars as pl
+import pytest
+
+from benchmarks import benchmark
+from xft import consolidate, index, misc
+
+YEARS = [2022, 2023, 2024]
+
+DIVISIONS = [1, 2]
+
+
+def consolidated_path(data_dir, year):
+    fs, url = fsspec.url_to_fs(data_dir)
+    return fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = str(tmp_path)
+    for competition in ["games", "open"]:
+        benchmark.write_synthetic_pages(
+            data_dir, competition, YEARS, DIVISIONS, pages=2, workouts=3
+        )
+    for year in YEARS:
+        # The last year is split, to read its athletes from the athlete table.
+        consolidate.stream_consolidated_year(
+            data_dir,
+            year,
+            DIVISIONS,
+            consolidated_path(data_dir, year),
+            split_athletes=year == YEARS[-1],
+        )
+    return data_dir
+
+
+def test_only_changed_years_are_indexed_again(data_dir):
+    assert index.update_index(data_dir) == YEARS
+    assert index.update_index(data_dir) == []
+    consolidate.stream_consolidated_year(
+        data_dir, 2023, [1], consolidated_path(data_dir, 2023)
+    )
+    assert index.update_index(data_dir) == [2023]
+    fs, url = fsspec.url_to_fs(data_dir)
+    fs.rm_file(consolidated_path(data_dir, 2022))
+    assert index.update_index(data_dir) == []
+    assert set(index.AthleteIndex(data_dir).table()["year"]) == {2023, 2024}
+    assert index.update_index(data_dir, force=True) == [2023, 2024]
+
+
+def test_lookups_find_every_entry(data_dir):
+    index.update_index(data_dir)
+    athletes = index.AthleteIndex(data_dir)
+    table = athletes.table()
+    assert len(athletes) == table["competitorId"].n_unique()
+    ids = table["competitorId"].unique().sort()[::7].to_list()
+    found = athletes.lookup([*ids, -5])
+    expected = table.filter(pl.col("competitorId").is_in(ids))
+    assert found.sort(found.columns).equals(expected.sort(expected.columns))
+    assert np.all(np.diff(found["competitorId"].to_numpy()) >= 0)
+
+
+def test_reads_match_a_filtered_scan(data_dir):
+    index.update_index(data_dir)
+    athletes = index.AthleteIndex(data_dir)
+    ids = athletes.table()["competitorId"].unique().sort()[::5].to_list()
+    key = [*consolidate.ENTRY_KEY, "workoutNumber"]
+    with misc.string_cache():
+        expected = (
+            consolidate.scan_consolidated(data_dir)
+            .filter(pl.col("competitorId").is_in(ids))
+            .collect()
+        )
+        found = athletes.read(ids)
+    assert found.sort(key).equals(expected.sort(key))
+    # Attributes of the split year are joined back before the selection.
+    columns = ["competitorId", "year", "age"]
+    found = athletes.read(ids, columns)
+    assert found.columns == columns
+    assert found.sort(columns).equals(expected.select(columns).sort(columns))
+    assert athletes.read([-5]).is_empty()
@@ -0,0 +1,92 @@
+import fsspec
+import polars as pl
+import pytest
+
+from benchmarks import benchmark, standin
+from xft import consolidate, manifest, tabulate
+from xft.manifest import Manifest, PageWriter
+
+
+def page_table(page: int, last_page: int = 10) -> pl.DataFrame:
+    board = standin.make_board("open", 2024, 1, page, last_page=last_page, workouts=3)
+    return tabulate.tabulate_leaderboard(board)
+
+
+def write_pages(data_dir, pages, **kwargs) -> PageWriter:
+    fs, url = fsspec.url_to_fs(str(data_dir))
+    subdir = consolidate.division_subdir(fs, url, "open", 2024, 1)
+    fs.makedirs(subdir, exist_ok=True)
+    writer = PageWriter(fs, subdir, Manifest(), **kwargs)
+    for page in pages:
+        writer.write(page, page_table(page))
+    writer.close()
+    return writer
+
+
+def read_division(data_dir) -> pl.DataFrame:
+    return consolidate.consolidate_boards(str(data_dir), "open", 2024, 1)
+
+
+@pytest.mark.parametrize("chunks", [dict(chunk_pages=4), dict(chunk_bytes=1)])
+def test_chunked_pages_read_like_page_files(tmp_path, chunks):
+    pages = range(1, 11)
+    separate = write_pages(tmp_path / "pages", pages)
+    chunked = write_pages(tmp_path / "chunks", pages, **chunks)
+    assert separate.files == 10
+    assert chunked.files == (3 if "chunk_pages" in chunks else 10)
+    assert read_division(tmp_path / "chunks").equals(read_division(tmp_path / "pages"))
+
+
+def test_manifest_parts_merge_neighboring_pages():
+    records = {
+        page: manifest.PageRecord(
+            "chunk", 1, None, None, rows=5, sha256=None, offset=5 * (page - 1)
+        )
+        for page in [1, 2, 3]
+    }
+    for record in records.values():
+        record.file_rows = 20
+    assert Manifest(records).parts() == [("chunk", 0, 15)]
+    del records[2]
+    assert Manifest(records).parts() == [("chunk", 0, 5), ("chunk", 10, 5)]
+
+
+def test_replaced_chunks_are_deleted(tmp_path):
+    writer = write_pages(tmp_path, range(1, 5), chunk_pages=4)
+    fs = writer.fs
+    (old,) = {record.name for record in writer.manifest.pages.values()}
+    writer.write(2, page_table(2).head(10))
+    writer.close()
+    # The other pages still point to the old chunk, so it's kept.
+    assert fs.exists(fs.sep.join([writer.output_subdir, old]))
+    for page in [1, 3, 4]:
+        writer.write(page, page_table(page))
+    writer.close()
+    assert not fs.exists(fs.sep.join([writer.output_subdir, old]))
+    assert len(read_division(tmp_path)) == 10 + 3 * 150
+
+
+def test_pages_are_found_with_one_listing():
+    fs = benchmark.SlowMemoryFileSystem(latency=0.0)
+    subdir = consolidate.division_subdir(fs, "/data", "open", 2024, 1)
+    writer = PageWriter(fs, subdir, Manifest())
+    for page in range(1, 6):
+        writer.write(page, page_table(page))
+    writer.close()
+    fs.rm_file(manifest.manifest_path(fs, subdir))
+    fs.calls.clear()
+    found = manifest.scan_pages(fs, subdir)
+    assert sorted(found.pages) == [1, 2, 3, 4, 5]
+    assert sum(fs.calls.values()) == 1
+
+
+def test_unreadable_local_pages_are_left_out(tmp_path):
+    writer = write_pages(tmp_path, range(1, 4))
+    fs, subdir = writer.fs, writer.output_subdir
+    fs.rm_file(manifest.manifest_path(fs, subdir))
+    # A page cut short by a crash, and one that is empty.
+    fs.pipe_file(fs.sep.join([subdir, "000002.parquet"]), b"PAR1 cut short")
+    fs.pipe_file(fs.sep.join([subdir, "000003.parquet"]), b"")
+    found = manifest.load_manifest(fs, subdir)
+    assert sorted(found.pages) == [1]
+    assert found.pages[1].rows == 150
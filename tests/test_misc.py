@@ -0,0 +1,19 @@
+import fsspec
+import pytest
+
+from xft import misc
+
+
+def test_atomic_writes_keep_the_old_file_on_failure(tmp_path):
+    fs = fsspec.filesystem("file")
+    path = str(tmp_path / "page.parquet")
+    misc.write_atomic(fs, path, b"old")
+    with pytest.raises(RuntimeError):
+        with misc.atomic_open(fs, path) as f:
+            f.write(b"partial")
+            raise RuntimeError
+    assert fs.cat_file(path) == b"old"
+    # The temporary file is cleaned up.
+    assert fs.ls(str(tmp_path), detail=False) == [path]
+    misc.write_atomic(fs, path, b"new")
+    assert fs.cat_file(path) == b"new"
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from xft import ratelimit
+from xft.ratelimit import RateLimiter
+
+
+def test_parse_retry_after():
+    assert ratelimit.parse_retry_after(None) is None
+    assert ratelimit.parse_retry_after(" 2.5 ") == 2.5
+    assert ratelimit.parse_retry_after("-3") == 0.0
+    assert ratelimit.parse_retry_after("soon") is None
+    later = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert 50 < ratelimit.parse_retry_after(format_datetime(later, usegmt=True)) <= 60
+
+
+def test_rate_bounds_are_checked():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=1.0, min_rate=2.0)
+    with pytest.raises(ValueError):
+        RateLimiter(decrease=1.0)
+
+
+def test_rate_increases_on_success_up_to_the_maximum():
+    limiter = RateLimiter(rate=1.0, max_rate=2.0, increase=1.0)
+    limiter.succeeded()
+    assert limiter.rate == 2.0
+    limiter.succeeded()
+    assert limiter.rate == 2.0
+    assert limiter.counts.successes == 2
+
+
+def test_throttles_in_one_cooldown_decrease_once():
+    limiter = RateLimiter(rate=8.0, decrease=0.5, cooldown=60.0)
+    for _ in range(3):
+        limiter.throttled()
+    assert limiter.rate == 4.0
+    assert limiter.counts.throttles == 3
+
+
+def test_retry_after_pauses_every_worker():
+    limiter = RateLimiter(rate=100.0, max_rate=100.0, burst=10.0)
+    limiter.throttled(retry_after=5.0)
+    assert 4.0 < limiter._reserve() <= 5.0
@@ -0,0 +1,88 @@
+import heapq
+
+import fsspec
+import pytest
+
+from benchmarks import standin
+from xft import consolidate, download, scheduler
+from xft.manifest import Manifest
+
+DIVISIONS = [1, 2, 3]
+
+
+@pytest.fixture(autouse=True)
+def no_settling(monkeypatch):
+    # Nothing else writes leases here, so there's no need to wait for them.
+    monkeypatch.setattr(scheduler, "LEASE_SETTLE", 0.0)
+
+
+def test_split_pages():
+    pages = [1, 2, 3, 4, 5, 7, 8, 10]
+    assert scheduler.split_pages(pages, 3) == [(1, 3), (4, 5), (7, 8), (10, 10)]
+
+
+def test_work_is_planned_largest_first():
+    manifests = {(2024, 1): Manifest(), (2024, 2): Manifest()}
+    items = scheduler.plan_work(
+        manifests, {(2024, 1): 3, (2024, 2): 10}, 1, False, item_pages=4
+    )
+    order = [heapq.heappop(items) for _ in range(len(items))]
+    # Every item of the big division comes before the small one, in page order.
+    assert [(item.division, item.first_page) for item in order] == [
+        (2, 1),
+        (2, 5),
+        (2, 9),
+        (1, 1),
+    ]
+    assert [item.pages for item in order] == [4, 4, 2, 3]
+
+
+def board_config(output_directory, server, **kwargs) -> download.BoardsConfig:
+    return download.BoardsConfig(
+        output_directory=str(output_directory),
+        competition="open",
+        years=[2024],
+        divisions=DIVISIONS,
+        api_root=server.root,
+        rate=1_000,
+        max_rate=1_000,
+        max_in_flight=4,
+        **kwargs,
+    )
+
+
+def test_scheduled_downloads_match_division_downloads(tmp_path):
+    config = standin.StandinConfig(last_page=5, last_pages={("open", 2024, 1): 30})
+    with standin.serve(config) as server:
+        tally = scheduler.schedule_boards(
+            board_config(tmp_path / "scheduled", server), item_pages=4
+        )
+        download.download_boards(
+            str(tmp_path / "serial"),
+            "open",
+            [2024],
+            DIVISIONS,
+            api_root=server.root,
+            rate=1_000,
+            max_rate=1_000,
+        )
+    assert tally.total == tally.downloaded == 40
+    for division in DIVISIONS:
+        frames = [
+            consolidate.consolidate_boards(str(tmp_path / name), "open", 2024, division)
+            for name in ["scheduled", "serial"]
+        ]
+        assert frames[0].equals(frames[1])
+
+
+def test_divisions_leased_elsewhere_wait_for_the_lease(tmp_path):
+    fs, url = fsspec.url_to_fs(str(tmp_path))
+    subdir = consolidate.division_subdir(fs, url, "open", 2024, 2)
+    scheduler.Leases(fs, owner="elsewhere", ttl=1.0).write(subdir)
+    with standin.serve(standin.StandinConfig(last_page=6)) as server:
+        tally = scheduler.schedule_boards(
+            board_config(tmp_path, server), item_pages=2, lease_poll=0.2
+        )
+    # The leased division's items are tried again until its lease expires.
+    assert tally.downloaded == 18
+    assert not fs.exists(fs.sep.join([subdir, scheduler.LEASE_NAME]))
@@ -0,0 +1,39 @@
+import pytest
+
+from benchmarks import benchmark
+from xft import scores
+
+
+@pytest.mark.parametrize(
+    "score, parsed",
+    [
+        ("4:32", (272.0, None, None, False)),
+        ("1:02:03.5", (3723.5, None, None, False)),
+        ("12:00 - CAP + 17", (720.0, 17, None, True)),
+        ("CAP+5", (None, 5, None, True)),
+        ("150 reps - s", (None, 150, None, False)),
+        ("100 kg", (None, None, 100.0, False)),
+        ("--", (None, None, None, None)),
+        (None, (None, None, None, None)),
+    ],
+)
+def test_parse_score(score, parsed):
+    assert tuple(scores.parse_score(score).values()) == pytest.approx(parsed)
+
+
+def test_bare_numbers_are_reps_only_for_reps_workouts():
+    assert scores.parse_score("102")["workoutReps"] is None
+    assert scores.parse_score("102", scored_by_reps=True)["workoutReps"] == 102
+
+
+def test_infer_workout_kind():
+    assert scores.infer_workout_kind("AMRAP 12 minutes of burpees") == "reps"
+    assert scores.infer_workout_kind("For time: 21-15-9 thrusters") == "time"
+    assert scores.infer_workout_kind("Find a 1-rep-max clean") == "load"
+    assert scores.infer_workout_kind("Run a mile") is None
+
+
+def test_expressions_match_the_scalar_parser():
+    df = benchmark.open_year_scores(athletes=2_000)
+    parsed = scores.with_parsed_scores(df.lazy()).collect()
+    assert parsed.equals(benchmark.parse_scores_scalar(df))
@@ -0,0 +1,29 @@
+import polars as pl
+import pytest
+
+from benchmarks import standin
+from xft import tabulate
+
+
+@pytest.mark.parametrize("division", [1, 2, 14])
+def test_columnar_tabulation_matches_rowwise(division):
+    board = standin.make_board("open", 2024, division, 3, last_page=5, workouts=4)
+    df = tabulate.tabulate_leaderboard(board)
+    assert df.schema == pl.Schema(tabulate.SCHEMA)
+    assert len(df) == 50 * 4
+    assert df.equals(tabulate.tabulate_leaderboard_rowwise(board))
+
+
+def test_rows_without_scores_have_one_row():
+    board = standin.make_board("open", 2024, 1, 1, last_page=1, workouts=4)
+    del board["leaderboardRows"][7]["scores"]
+    df = tabulate.tabulate_leaderboard(board)
+    assert len(df) == 49 * 4 + 1
+    assert df.filter(pl.col("workoutNumber").is_null())["overallRank"].to_list() == [8]
+
+
+def test_unknown_units_fail():
+    board = standin.make_board("open", 2024, 1, 1, last_page=1)
+    board["leaderboardRows"][0]["entrant"]["height"] = "12 furlongs"
+    with pytest.raises(ValueError, match="furlongs"):
+        tabulate.tabulate_leaderboard(board)
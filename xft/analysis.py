@@ -1,68 +1,266 @@
-import os
+import inspect
 import polars as pl
 import numpy as np
-from scipy import stats
+from scipy import special, stats
 from humanize import naturalsize
 
+from . import consolidate, misc
+from .derived import DerivedCache, data_fingerprint, frame_fingerprint
+from .scores import SCORE_SCHEMA
+
 
 def nan_fraction(df: pl.DataFrame, col: str) -> float:
     return np.isnan(df[col].to_numpy()).sum() / len(df)
 
 
-def fill_column_nans(df: pl.DataFrame, col: str) -> pl.DataFrame:
-    # Create a mapping between competitior IDs and non-nan values in the target col.
-    b = ~np.isnan(df[col].to_numpy())
-    cid = df["competitorId"].to_numpy()
-    val = df[col].to_numpy()
-    cid, val = cid[b], val[b]
-    cid2val = dict(zip(cid, val))
-    # Replace nans in the target column where possible.
-    cid, val = df["competitorId"], df[col].to_numpy()
-    for i in range(len(val)):
-        if np.isnan(val[i]) and cid[i] in cid2val:
-            val[i] = cid2val[cid[i]]
-    # Replace the column.
-    df = df.with_columns(pl.Series(col, val))
-    return df
+# Ways of choosing the value that fills an athlete's missing height or weight.
+FILL_POLICIES = ["most_recent", "median", "nearest"]
+
+
+def missing(col: str) -> pl.Expr:
+    return pl.col(col).is_null() | pl.col(col).is_nan()
+
+
+def filled(lf: pl.LazyFrame, col: str, policy: str) -> pl.LazyFrame:
+    """Fills the missing values of a column with a policy from FILL_POLICIES. With
+    most_recent, athletes get their value from the latest year it's known, as a
+    window over athletes, and with median, the median of their values in each year
+    it's known. With nearest, each year gets the value of the closest year it's
+    known, which is an asof join of the known values by athlete. For both, entries
+    count once however many workouts they have, and so do years however many
+    entries."""
+    names = lf.collect_schema().names()
+    entry = [c for c in consolidate.ENTRY_KEY if c in names]
+    known = pl.when(~missing(col)).then(pl.col(col))
+    if policy == "most_recent":
+        # Entries of the same year are ordered by competition, the Games after the
+        # Open, and then by division, when the frame has them, so that the order
+        # of the rows doesn't break ties.
+        order = [pl.col("year")]
+        if "competitionType" in names:
+            order.append(pl.col("competitionType") == "games")
+        if "divisionId" in names:
+            order.append(pl.col("divisionId"))
+        fill = known.sort_by(order).drop_nulls().last().over("competitorId")
+    elif policy in ["median", "nearest"]:
+        years = (
+            lf.filter(~missing(col))
+            .group_by(entry)
+            .agg(pl.col(col).median())
+            .group_by("competitorId", "year")
+            .agg(pl.col(col).median().alias("_fill"))
+        )
+        if policy == "median":
+            values = years.group_by("competitorId").agg(pl.col("_fill").median())
+            on = ["competitorId"]
+        else:
+            wanted = lf.filter(missing(col)).select("competitorId", "year").unique()
+            # Both sides are sorted by year, which recent versions of Polars warn
+            # they can't check within each athlete.
+            options = inspect.signature(pl.LazyFrame.join_asof).parameters
+            check = {"check_sortedness": False} if "check_sortedness" in options else {}
+            values = wanted.sort("year").join_asof(
+                years.sort("year"),
+                on="year",
+                by="competitorId",
+                strategy="nearest",
+                **check,
+            )
+            on = ["competitorId", "year"]
+        # Joins aren't guaranteed to keep the order of rows, so it's restored.
+        lf = (
+            lf.with_row_index("_row")
+            .join(values, on=on, how="left")
+            .sort("_row")
+            .drop("_row")
+        )
+        fill = pl.col("_fill")
+    else:
+        raise ValueError(
+            f"The fill policy must be one of {FILL_POLICIES}, not {policy}."
+        )
+    fill = fill.cast(lf.collect_schema()[col])
+    lf = lf.with_columns(
+        pl.when(missing(col))
+        .then(fill.fill_null(pl.col(col)))
+        .otherwise(pl.col(col))
+        .alias(col)
+    )
+    return lf.drop("_fill", strict=False)
+
+
+def with_filled(
+    df: pl.DataFrame | pl.LazyFrame, cols: list[str], policy: str = "most_recent"
+) -> pl.DataFrame | pl.LazyFrame:
+    """Fills missing (null or NaN) values of columns like height and weight with
+    values of the same athlete in other rows, chosen by a policy in FILL_POLICIES.
+    Missing values of athletes without any known value stay missing."""
+    lf = df.lazy()
+    for col in cols:
+        lf = filled(lf, col, policy)
+    return lf if isinstance(df, pl.LazyFrame) else lf.collect()
+
+
+def fill_columns(
+    df: pl.DataFrame, cols: list[str], policy: str = "most_recent"
+) -> tuple[pl.DataFrame, dict[str, int]]:
+    """Fills missing values like with_filled and counts how many were filled in
+    each column."""
+    before = df.select(missing(col).sum() for col in cols).row(0)
+    df = with_filled(df, cols, policy)
+    after = df.select(missing(col).sum() for col in cols).row(0)
+    return df, {col: b - a for col, b, a in zip(cols, before, after)}
+
+
+def fill_column_nans(
+    df: pl.DataFrame, col: str, policy: str = "most_recent"
+) -> pl.DataFrame:
+    """Fills missing values of a column using the athlete's values in other rows.
+    See with_filled."""
+    return with_filled(df, [col], policy)
 
 
 def load_cached_boards(
     data_dir: str,
-    file_name: str = "boards.parquet",
     fill_height: bool = True,
     fill_weight: bool = True,
+    policy: str = "most_recent",
+    cache: DerivedCache | None = None,
 ) -> pl.DataFrame:
-    """Loads and concatenates consolidated data frames from the given data directory
-    and stores the whole frame locally for faster retrieval. Height and weight columns
-    are also optionally filled using averages of non-nan values."""
+    """Loads and concatenates consolidated data frames from the given data directory,
+    optionally filling missing heights and weights with each athlete's values from
+    other rows (see with_filled). The result is kept in a derived cache, in
+    derived.DEFAULT_DIRECTORY unless another cache is given, and loaded from it again
+    as long as the consolidated files and the arguments are the same."""
 
-    if os.path.isfile(file_name):
-        boards = pl.read_parquet(file_name)
-    else:
-        boards = pl.concat(
-            [
-                pl.read_parquet(f"{data_dir}/boards/consolidated/{year}.parquet")
-                for year in range(2007, 2025)
-            ]
-        )
-        if fill_height:
-            boards = fill_column_nans(boards, "height")
-        if fill_weight:
-            boards = fill_column_nans(boards, "weight")
-        boards.write_parquet(file_name)
+    def compute():
+        boards = consolidate.load_consolidated(data_dir)
+        cols = [
+            col
+            for col, fill in [("height", fill_height), ("weight", fill_weight)]
+            if fill
+        ]
+        boards, filled = fill_columns(boards, cols, policy)
+        for col, count in filled.items():
+            print(f"filled {count:,} missing values of {col}")
+        return boards
+
+    if cache is None:
+        cache = DerivedCache()
+    params = {
+        "data": data_fingerprint(data_dir),
+        "fill_height": fill_height,
+        "fill_weight": fill_weight,
+        "policy": policy,
+    }
+    boards = cache.get(load_cached_boards, params, compute)
     print(f"{naturalsize(boards.estimated_size())} loaded")
     return boards
 
 
+class Boards:
+    """A lazy query over consolidated leaderboards. Every step gives new Boards
+    without reading anything, and collect runs the whole chain at once, so filters
+    on years, divisions, and competitions and column selections are pushed down to
+    the parquet files. Wrap any lazy frame, or scan the consolidated files of an
+    xft file system with Boards.scan."""
+
+    def __init__(self, lf: pl.LazyFrame):
+        self.lf = lf
+
+    @classmethod
+    def scan(cls, data_dir: str) -> "Boards":
+        return cls(consolidate.scan_consolidated(data_dir))
+
+    def filter(self, *predicates, **constraints) -> "Boards":
+        return Boards(self.lf.filter(*predicates, **constraints))
+
+    def years(self, *years: int) -> "Boards":
+        return self.filter(pl.col("year").is_in(years))
+
+    def divisions(self, *divisionIds: int) -> "Boards":
+        return self.filter(pl.col("divisionId").is_in(divisionIds))
+
+    def competition(self, competitionType: str) -> "Boards":
+        return self.filter(pl.col("competitionType") == competitionType)
+
+    def select(self, *columns) -> "Boards":
+        return Boards(self.lf.select(*columns))
+
+    def pipe(self, function, *args, **kwargs) -> "Boards":
+        """Applies a function taking and returning a lazy frame, like with_invnt."""
+        return Boards(function(self.lf, *args, **kwargs))
+
+    def fill(self, *cols: str, policy: str = "most_recent") -> "Boards":
+        """Fills missing values of columns like height and weight from the same
+        athlete's other rows. See with_filled."""
+        return Boards(with_filled(self.lf, list(cols), policy))
+
+    def overall(self) -> "Boards":
+        """Only the overall results, getting rid of the workout-level data."""
+        lf = self.lf.unique(consolidate.ENTRY_KEY)
+        lf = lf.drop(
+            "workoutNumber",
+            "workoutRank",
+            "workoutScore",
+            "workoutValid",
+            "workoutScaled",
+            *SCORE_SCHEMA,
+            strict=False,
+        )
+        return Boards(lf.filter(pl.col("overallRank").is_not_null()))
+
+    def split(
+        self, year: int | None = None, divisionId: int | None = None
+    ) -> tuple["Boards", "Boards"]:
+        """Splits into Open and Games results, optionally also taking a specific
+        year and/or division."""
+        boards = self
+        if year is not None:
+            boards = boards.years(year)
+        if divisionId is not None:
+            boards = boards.divisions(divisionId)
+        return boards.competition("open"), boards.competition("games")
+
+    def intersect(self, other: "Boards") -> tuple["Boards", "Boards"]:
+        """Keeps the athletes found in both, sorted by athlete. Athletes with more
+        than one row for an entry are dropped."""
+        # If duplicates are found, ignore all of them.
+        lf1 = self.lf.filter(pl.struct(consolidate.ENTRY_KEY).is_unique())
+        lf2 = other.lf.filter(pl.struct(consolidate.ENTRY_KEY).is_unique())
+        # Take common individual athlete IDs.
+        ids1, ids2 = lf1.select("competitorId"), lf2.select("competitorId")
+        lf1 = lf1.join(ids2, on="competitorId", how="semi").sort("competitorId")
+        lf2 = lf2.join(ids1, on="competitorId", how="semi").sort("competitorId")
+        return Boards(lf1), Boards(lf2)
+
+    def collect(self, streaming: bool = False) -> pl.DataFrame:
+        """Runs the query, optionally with the streaming engine, which keeps
+        memory down when the result is much smaller than what is scanned."""
+        with misc.string_cache():
+            return misc.collect(self.lf, streaming)
+
+
+def collect_all(*boards: Boards) -> list[pl.DataFrame]:
+    """Runs several queries together, so the parts they share, like the scans and
+    overall results under both sides of split, run only once."""
+    with misc.string_cache():
+        return pl.collect_all([b.lf for b in boards])
+
+
 def overall_results(df: pl.DataFrame) -> pl.DataFrame:
     """Converts a data frame into overall results only, getting rid
     of the workout-level data."""
-    df = df.unique(["competitorId", "competitionType", "year", "divisionId"])
-    df = df.drop(
-        "workoutNumber", "workoutRank", "workoutScore", "workoutValid", "workoutScaled"
+    return Boards(df.lazy()).overall().collect()
+
+
+def load_overall_results(data_dir: str, years: list[int] | None = None) -> pl.DataFrame:
+    """Reads overall results from the entries table of the star schema (see
+    consolidate.consolidate_star), giving the rows of overall_results without
+    loading every workout and dropping duplicates."""
+    return consolidate.load_entries(
+        data_dir, years=years, where=pl.col("overallRank").is_not_null()
     )
-    df = df.filter(pl.col("overallRank").is_not_null())
-    return df
 
 
 def split_competition(
@@ -70,18 +268,7 @@ def split_competition(
 ) -> tuple[pl.DataFrame, pl.DataFrame]:
     """Splits a data frame into Open and Games results, optionally
     also taking a specific year and/or division."""
-
-    opn = df.filter(pl.col("competitionType") == "open")
-    gms = df.filter(pl.col("competitionType") == "games")
-
-    if year is not None:
-        opn = opn.filter(pl.col("year") == year)
-        gms = gms.filter(pl.col("year") == year)
-
-    if divisionId is not None:
-        opn = opn.filter(pl.col("divisionId") == divisionId)
-        gms = gms.filter(pl.col("divisionId") == divisionId)
-
+    opn, gms = collect_all(*Boards(df.lazy()).split(year, divisionId))
     return opn, gms
 
 
@@ -90,18 +277,7 @@ def intersect_athletes(
 ) -> tuple[pl.DataFrame, pl.DataFrame]:
     """Filters data frames such that the athlete ids are matching. Drops
     non-unique athlete ids in the process."""
-
-    # If duplicates are found, ignore all of them.
-    df1 = df1.filter(
-        df1["competitorId", "competitionType", "year", "divisionId"].is_unique()
-    )
-    df2 = df2.filter(
-        df2["competitorId", "competitionType", "year", "divisionId"].is_unique()
-    )
-    # Take common individual athlete IDs.
-    ids = set(df1["competitorId"]) & set(df2["competitorId"])
-    df1 = df1.filter(pl.col("competitorId").is_in(ids)).sort("competitorId")
-    df2 = df2.filter(pl.col("competitorId").is_in(ids)).sort("competitorId")
+    df1, df2 = collect_all(*Boards(df1.lazy()).intersect(Boards(df2.lazy())))
     # Check and return.
     if len(df1) != len(df2):
         raise ValueError("Intersected frames have different numbers of rows.")
@@ -110,34 +286,76 @@ def intersect_athletes(
     return df1, df2
 
 
-def inverse_normal_transform(ranks):
+def inverse_normal_transform(ranks, count=None):
+    """Transforms ranks to quantiles of the standard normal distribution. Works on
+    arrays and series, and on polars expressions, in which case count can be an
+    expression too, like pl.len().over(...), and the normal quantile is taken once
+    for the whole column."""
+    if count is None:
+        count = pl.len() if isinstance(ranks, pl.Expr) else len(ranks)
     # The sign change puts lowest (best) rankings at the highest transformed values.
-    return -stats.norm.ppf(ranks / (len(ranks) + 1))
+    if isinstance(ranks, pl.Expr):
+        return (ranks / (count + 1)).map_batches(
+            normal_quantile, return_dtype=pl.Float64, is_elementwise=True
+        )
+    return -stats.norm.ppf(ranks / (count + 1))
+
+
+def normal_quantile(s: pl.Series) -> pl.Series:
+    """Negative standard normal quantiles of a whole column. The quantile function
+    is called directly, skipping the argument checks of stats.norm.ppf."""
+    return pl.Series(s.name, -special.ndtri(s.cast(pl.Float64).to_numpy()))
+
+
+def invnt(col: str, over: list[str] | None = None, rerank: bool = True) -> pl.Expr:
+    """An expression for the inverse normal transform of a column, within the
+    groups given by over, optionally reranking the rankings before
+    transformation."""
+    rank = pl.col(col).rank() if rerank else pl.col(col)
+    count = pl.len()
+    if over is not None:
+        rank, count = rank.over(over), count.over(over)
+    return inverse_normal_transform(rank.cast(pl.Float64), count)
 
 
-def with_invnt(df: pl.DataFrame, col: str, rerank: bool = True) -> pl.DataFrame:
+def normalized_rank(
+    col: str, over: list[str] | None = None, rerank: bool = True
+) -> pl.Expr:
+    """An expression for the rank of a column scaled from 0 to 1, within the
+    groups given by over, optionally reranking the rankings before
+    normalization."""
+    rank = pl.col(col).rank() if rerank else pl.col(col)
+    count = pl.len()
+    if over is not None:
+        rank, count = rank.over(over), count.over(over)
+    return (rank.cast(pl.Float64) - 1) / (count - 1)
+
+
+def with_invnt(
+    df: pl.DataFrame | pl.LazyFrame,
+    col: str,
+    rerank: bool = True,
+    over: list[str] | None = None,
+) -> pl.DataFrame | pl.LazyFrame:
     """Adds the inverse normal transformation to a data frame, optionally reranking
-    the rankings before transformation"""
-    if rerank:
-        invnt = inverse_normal_transform(df[col].rank())
-    else:
-        invnt = inverse_normal_transform(df[col])
-    df = df.with_columns(inverseNormalTransform=invnt)
-    return df
+    the rankings before transformation and separating the groups given by over."""
+    return df.with_columns(inverseNormalTransform=invnt(col, over, rerank))
 
 
 def with_normalized_rank(
-    df: pl.DataFrame, col: str, rerank: bool = True
-) -> pl.DataFrame:
+    df: pl.DataFrame | pl.LazyFrame,
+    col: str,
+    rerank: bool = True,
+    over: list[str] | None = None,
+) -> pl.DataFrame | pl.LazyFrame:
     """Adds the normalized rank to a data frame, optionally reranking
-    the rankings before normalization."""
-    if rerank:
-        rank = df[col].rank()
-    else:
-        rank = df[col]
-    norm = (rank - 1) / (len(rank) - 1)
-    df = df.with_columns(normalizedRank=norm)
-    return df
+    the rankings before normalization and separating the groups given by over."""
+    return df.with_columns(normalizedRank=normalized_rank(col, over, rerank))
+
+
+def standardized(col: str, over: list[str]) -> pl.Expr:
+    """An expression standardizing a column within the groups given by over."""
+    return (pl.col(col) - pl.col(col).mean().over(over)) / pl.col(col).std().over(over)
 
 
 def prepare_overall_open_games(df: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
@@ -158,13 +376,110 @@ def prepare_overall_open_games(df: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataF
     return opn, gms
 
 
+# Columns matching an athlete's Open and Games results in a year and division.
+PAIR_KEY = ["year", "divisionId", "competitorId"]
+
+# Columns of Open and Games results compared in merge_open_games.
+RANK_COLUMNS = [
+    "overallRank",
+    "overallScore",
+    "overallRerank",
+    "inverseNormalTransform",
+    "normalizedRank",
+]
+
+
+def with_rank_transforms(lf: pl.LazyFrame, over: list[str]) -> pl.LazyFrame:
+    """Adds the transforms of overallRank that prepare_overall_open_games adds,
+    within the groups given by over."""
+    return lf.with_columns(
+        inverseNormalTransform=invnt("overallRank", over),
+        normalizedRank=normalized_rank("overallRank", over),
+        overallRerank=pl.col("overallRank").rank().over(over),
+    )
+
+
+def open_games_pairs(
+    boards: Boards, divisionIds: list[int] | None = None
+) -> tuple[Boards, Boards]:
+    """Gives the Open and Games overall results of the athletes in both, for every
+    year and division at once, with the rankings transformed within each year and
+    division like prepare_overall_open_games does for one. Both are sorted by
+    year, division, and athlete, so their rows correspond."""
+    if divisionIds is not None:
+        boards = boards.divisions(*divisionIds)
+    opn, gms = boards.overall().split()
+    over = ["year", "divisionId"]
+    # Semi joins keep the athletes in both, without sets or a loop over groups.
+    opn, gms = (
+        Boards(
+            lf.join(other.select(PAIR_KEY), on=PAIR_KEY, how="semi")
+            .pipe(with_rank_transforms, over)
+            .sort(PAIR_KEY)
+        )
+        for lf, other in [(opn.lf, gms.lf), (gms.lf, opn.lf)]
+    )
+    return opn, gms
+
+
+def merge_open_games_pairs(opn: Boards, gms: Boards) -> Boards:
+    """Joins corresponding Open and Games results into one row per athlete, year,
+    and division, with the ranking columns of each suffixed by Open and Games and
+    the differences between them."""
+    renamed = [
+        lf.select(
+            *PAIR_KEY,
+            *[pl.col(col).alias(col + suffix) for col in RANK_COLUMNS],
+        )
+        for lf, suffix in [(opn.lf, "Open"), (gms.lf, "Games")]
+    ]
+    lf = (
+        opn.lf.select("competitorName", *PAIR_KEY, "age", "height", "weight")
+        .join(renamed[0], on=PAIR_KEY)
+        .join(renamed[1], on=PAIR_KEY)
+    )
+    lf = lf.select(
+        "competitorName",
+        "competitorId",
+        "year",
+        "divisionId",
+        "age",
+        "height",
+        "weight",
+        *[col + suffix for col in RANK_COLUMNS for suffix in ["Open", "Games"]],
+        *[
+            (pl.col(col + "Games") - pl.col(col + "Open")).alias(col + "Difference")
+            for col in RANK_COLUMNS
+            if col != "overallScore"
+        ],
+    )
+    return Boards(lf.sort(PAIR_KEY))
+
+
+def merge_open_games(boards: Boards, divisionIds: list[int] | None = None) -> Boards:
+    """Merged Open and Games overall results for every year and division, as one
+    lazy query. See open_games_pairs and merge_open_games_pairs."""
+    return merge_open_games_pairs(*open_games_pairs(boards, divisionIds))
+
+
 def prepare_overall_characteristics(
-    df: pl.DataFrame, competitionType: str | None = None
+    df: pl.DataFrame,
+    competitionType: str | None = None,
+    cache: DerivedCache | None = None,
 ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
     """Prepares a data frame for analysis with height, weight, age, and rankings,
     including standardization of the columns representing athlete physical
     characteristics. Also returns the means and standard deviations for the
-    standardization groups."""
+    standardization groups. With a derived cache, results for the same frame and
+    competition type are reused."""
+
+    if cache is not None:
+        params = {"df": frame_fingerprint(df), "competitionType": competitionType}
+        return cache.get(
+            prepare_overall_characteristics,
+            params,
+            lambda: prepare_overall_characteristics(df, competitionType),
+        )
 
     # Optionally filter the competition type.
     if competitionType is not None:
@@ -188,26 +503,17 @@ def prepare_overall_characteristics(
     df = df.filter(
         np.isnan(df[["height", "weight", "age", "overallRank"]]).sum(axis=1) == 0
     )
-    # Add the inverse normal transform for each event, separated by divisions of course.
-    df = df.group_by("year", "divisionId").map_groups(
-        lambda g: g.with_columns(
-            inverseNormalTransform=inverse_normal_transform(g["overallRank"].rank()),
-        )
+    # Add the inverse normal transform for each event, separated by divisions of
+    # course, and standardize the characteristics within divisions.
+    df = df.with_columns(
+        inverseNormalTransform=invnt("overallRank", ["year", "divisionId"]),
+        standardizedHeight=standardized("height", ["divisionId"]),
+        standardizedWeight=standardized("weight", ["divisionId"]),
+        standardizedAge=standardized("age", ["divisionId"]),
     )
     # Compute standards
     gb = df.group_by("divisionId")
     means = gb.agg(pl.col("height", "weight", "age").mean())
     stds = gb.agg(pl.col("height", "weight", "age").std())
-    # Standardize
-    df = df.group_by("divisionId").map_groups(
-        lambda g: g.with_columns(
-            standardizedHeight=(pl.col("height") - pl.col("height").mean())
-            / pl.col("height").std(),
-            standardizedWeight=(pl.col("weight") - pl.col("weight").mean())
-            / pl.col("weight").std(),
-            standardizedAge=(pl.col("age") - pl.col("age").mean())
-            / pl.col("age").std(),
-        )
-    )
     df = df.sort("year", "divisionId", "overallRank")
     return df, means, stds
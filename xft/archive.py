@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import fsspec
+import polars as pl
+
+from . import fetch, misc, tabulate
+from .manifest import PageWriter, load_manifest
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File name endings of archive segments for each compression codec.
+ARCHIVE_CODECS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+# Boards held in memory before they are written as a segment.
+ARCHIVE_SEGMENT_PAGES = 100
+
+
+def archive_subdir(fs, url, competition: str, year: int, division: int) -> str:
+    return fs.sep.join(
+        [url, "archive", competition, str(year), f"division-{division:02}"]
+    )
+
+
+def check_codec(codec: str) -> None:
+    if codec not in ARCHIVE_CODECS:
+        raise ValueError(
+            f"The archive codec must be one of {tuple(ARCHIVE_CODECS)} but got '{codec}'."
+        )
+    if codec == "zstd" and zstandard is None:
+        raise ImportError("The zstandard package is needed for zstd archives.")
+    return None
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        # Segments are single frames, but reading them as a stream also handles
+        # frames that were concatenated.
+        with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+            return reader.read()
+    # Concatenated gzip members decompress to the concatenated contents.
+    return gzip.decompress(data)
+
+
+def segment_codec(path: str) -> str:
+    for codec, suffix in ARCHIVE_CODECS.items():
+        if path.endswith(suffix):
+            return codec
+    raise ValueError(f"Not an archive segment: {path}")
+
+
+def segment_name(pages: list[int], sha256: str, codec: str) -> str:
+    return (
+        f"segment-{min(pages):06}-{max(pages):06}-{sha256[:12]}{ARCHIVE_CODECS[codec]}"
+    )
+
+
+def archive_line(page: int, board: dict) -> bytes:
+    """Encodes a board as a line of an archive segment."""
+    line = fetch.encode_json({"page": page, "fetched": time.time(), "board": board})
+    return line + b"\n"
+
+
+class ArchiveWriter:
+    """Keeps the raw json of a division's boards as compressed json lines, one
+    {"page", "fetched", "board"} record per line. Boards are collected in memory and
+    written as new segment files, never appended to existing ones, so archives work
+    the same on object storage. A page archived more than once is read back from its
+    most recent record. Safe to use from several threads."""
+
+    def __init__(
+        self,
+        fs,
+        output_subdir: str,
+        codec: str = "gzip",
+        segment_pages: int = ARCHIVE_SEGMENT_PAGES,
+    ):
+        check_codec(codec)
+        self.fs = fs
+        self.output_subdir = output_subdir
+        self.codec = codec
+        self.segment_pages = segment_pages
+        self._lines = {}
+        self._lock = threading.Lock()
+
+    def write(self, page: int, board: dict) -> None:
+        self.write_line(page, archive_line(page, board))
+        return None
+
+    def write_line(self, page: int, line: bytes) -> None:
+        """Adds a line made by archive_line, which may have been encoded elsewhere."""
+        with self._lock:
+            self._lines[page] = line
+            if len(self._lines) < self.segment_pages:
+                return None
+            lines, self._lines = self._lines, {}
+        self._write_segment(lines)
+        return None
+
+    def close(self) -> None:
+        """Writes any boards still in memory."""
+        with self._lock:
+            lines, self._lines = self._lines, {}
+        if lines:
+            self._write_segment(lines)
+        return None
+
+    def _write_segment(self, lines: dict[int, bytes]) -> None:
+        pages = sorted(lines)
+        data = compress(b"".join(lines[page] for page in pages), self.codec)
+        name = segment_name(pages, hashlib.sha256(data).hexdigest(), self.codec)
+        self.fs.makedirs(self.output_subdir, exist_ok=True)
+        misc.write_atomic(self.fs, self.fs.sep.join([self.output_subdir, name]), data)
+        return None
+
+
+def list_segments(fs, output_subdir: str) -> list[str]:
+    return sorted(
+        path
+        for suffix in ARCHIVE_CODECS.values()
+        for path in fs.glob(fs.sep.join([output_subdir, f"*{suffix}"]))
+    )
+
+
+def read_segment(fs, path: str) -> list[dict]:
+    data = decompress(fs.cat_file(path), segment_codec(path))
+    return [fetch.decode_json(line) for line in data.splitlines() if line]
+
+
+def read_archive(fs, output_subdir: str) -> dict[int, dict]:
+    """Reads the most recent board archived for each page of a division."""
+    records = {}
+    for path in list_segments(fs, output_subdir):
+        for record in read_segment(fs, path):
+            page = record["page"]
+            if page not in records or record["fetched"] >= records[page]["fetched"]:
+                records[page] = record
+    return {page: record["board"] for page, record in sorted(records.items())}
+
+
+def tabulate_segment(fs, path: str) -> dict[int, tuple[float, pl.DataFrame]]:
+    """Tabulates every board in a segment, giving the time each was fetched with its
+    table. This runs in worker processes, so it takes a path instead of boards,
+    which would be slow to send between processes."""
+    tables = {}
+    for record in read_segment(fs, path):
+        page, fetched = record["page"], record["fetched"]
+        if page not in tables or fetched >= tables[page][0]:
+            tables[page] = (fetched, tabulate.tabulate_leaderboard(record["board"]))
+    return tables
+
+
+def tabulate_division(fs, paths: list[str]) -> dict[int, pl.DataFrame]:
+    """Tabulates the archive segments of a division, keeping the table of the most
+    recently fetched board of each page. This runs in worker processes."""
+    tables = {}
+    for path in paths:
+        for page, (fetched, table) in tabulate_segment(fs, path).items():
+            if page not in tables or fetched >= tables[page][0]:
+                tables[page] = (fetched, table)
+    return {page: table for page, (_, table) in sorted(tables.items())}
+
+
+def write_division(
+    fs,
+    output_subdir: str,
+    tables: dict[int, pl.DataFrame],
+    chunk_pages: int | None,
+    chunk_bytes: int | None,
+) -> int:
+    """Writes the retabulated pages of a division and updates its manifest."""
+    fs.makedirs(output_subdir, exist_ok=True)
+    manifest = load_manifest(fs, output_subdir)
+    if manifest.last_page is None:
+        manifest.last_page = max(tables)
+    writer = PageWriter(
+        fs,
+        output_subdir,
+        manifest,
+        chunk_pages=chunk_pages,
+        chunk_bytes=chunk_bytes,
+    )
+    try:
+        for page, table in tables.items():
+            writer.write(page, table)
+    finally:
+        writer.close()
+    return len(tables)
+
+
+def retabulate_boards(
+    data_dir: str,
+    competition: str,
+    years: list[int],
+    divisions: list[int],
+    *,
+    workers: int | None = None,
+    chunk_pages: int | None = None,
+    chunk_bytes: int | None = None,
+) -> dict[tuple[int, int], int]:
+    """Rebuilds the page files of divisions from their raw archives, without any
+    requests, and returns the number of pages rewritten for each (year, division).
+    Divisions are tabulated in parallel by a pool of worker processes, one for each
+    core unless workers is given, and each division's pages are written as soon as
+    they arrive. Only a few divisions are in flight at once, so memory doesn't grow
+    with the archive. Pages that aren't archived are left alone, and the division
+    manifests are updated like they are by downloads, so consolidation picks up the
+    new pages."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    segments = {
+        (year, division): list_segments(
+            fs, archive_subdir(fs, url, competition, year, division)
+        )
+        for year in years
+        for division in divisions
+    }
+    segments = {key: paths for key, paths in segments.items() if paths}
+
+    def write(key, tables) -> None:
+        year, division = key
+        output_subdir = fs.sep.join(
+            [url, "boards", competition, str(year), f"division-{division:02}"]
+        )
+        written[key] = write_division(
+            fs, output_subdir, tables, chunk_pages, chunk_bytes
+        )
+        return None
+
+    written = {}
+    if workers == 1:
+        for key, paths in segments.items():
+            write(key, tabulate_division(fs, paths))
+        return written
+    queued = iter(segments.items())
+    with misc.process_pool(workers) as executor:
+        # Twice as many divisions as workers are in flight, which keeps every
+        # worker busy while pages are written.
+        limit = 2 * (workers or os.cpu_count())
+        pending = {}
+        while True:
+            for key, paths in itertools.islice(queued, limit - len(pending)):
+                pending[executor.submit(tabulate_division, fs, paths)] = key
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                write(pending.pop(future), future.result())
+    return written
@@ -1,7 +1,15 @@
+import polars as pl
 import numpy as np
 
 NAN = np.float32(np.nan)
 
+# Plausible ranges of height (meters), weight (kilograms), and age (years).
+HEIGHT_RANGE = (1.2, 2.13)
+
+WEIGHT_RANGE = (35, 150)
+
+AGE_RANGE = (14, 100)
+
 
 def clean_height(height: str) -> np.float32:
     if height is None or height == "":
@@ -15,7 +23,7 @@ def clean_height(height: str) -> np.float32:
         raise ValueError(f"Not sure how to handle cleaning of height value '{height}'.")
 
     # These values are physically implausible, probably from data entry error.
-    if (height < 1.2) or (height > 2.13):
+    if (height < HEIGHT_RANGE[0]) or (height > HEIGHT_RANGE[1]):
         return NAN
 
     return height
@@ -33,7 +41,7 @@ def clean_weight(weight: str) -> np.float32:
         raise ValueError(f"Not sure how to handle cleaning of weight value '{weight}'.")
 
     # These values are physically implausible.
-    if (weight < 35) or (weight > 150):
+    if (weight < WEIGHT_RANGE[0]) or (weight > WEIGHT_RANGE[1]):
         return NAN
 
     return weight
@@ -44,7 +52,7 @@ def clean_age(age: int) -> np.int8:
         return None
 
     # There are no divisions for under 14 year olds.
-    if (age < 14) or (age > 100):
+    if (age < AGE_RANGE[0]) or (age > AGE_RANGE[1]):
         return None
 
     return np.int8(age)
@@ -86,3 +94,123 @@ def clean_scaled(scaled: str) -> bool:
         return None
 
     return bool(int(scaled))
+
+
+# Vectorized versions of the cleaning functions above, as Polars expressions that
+# operate on whole columns. Arithmetic is done in 64-bit floats on values parsed
+# as 32-bit floats, exactly like the scalar versions, so results are identical.
+
+
+def _parse_measurement(value: pl.Expr, first: str, second: str) -> tuple[pl.Expr]:
+    # Like np.float32(value.replace(unit, "")), using the first unit if the value
+    # contains it and the second otherwise, but null where that would raise or
+    # neither unit is present. Also returns whether the first unit was used.
+    is_first = value.str.contains(first, literal=True)
+    number = (
+        pl.when(is_first)
+        .then(value.str.replace_all(first, "", literal=True))
+        .when(value.str.contains(second, literal=True))
+        .then(value.str.replace_all(second, "", literal=True))
+        .str.strip_chars()
+    )
+    number = number.cast(pl.Float64, strict=False).cast(pl.Float32).cast(pl.Float64)
+    return is_first, number
+
+
+def bound_expr(value: pl.Expr, bounds: tuple[float, float]) -> pl.Expr:
+    """Replaces values outside of a plausible range with NaN, keeping nulls. Bounds
+    are compared in the column's own type, so bounding a column again after it
+    has been cast to 32-bit floats changes nothing."""
+    lower, upper = bounds
+    return pl.when((value < lower) | (value > upper)).then(np.nan).otherwise(value)
+
+
+def clean_height_expr(height: pl.Expr) -> pl.Expr:
+    """Vectorized clean_height for a string column. Values without recognizable
+    units are null, where clean_height would raise an error."""
+    is_cm, number = _parse_measurement(height, "cm", "in")
+    meters = number / pl.when(is_cm).then(1e2).otherwise(3.93e1)
+    return (
+        pl.when(height.is_null() | (height == ""))
+        .then(np.nan)
+        .otherwise(bound_expr(meters, HEIGHT_RANGE))
+        .cast(pl.Float32)
+    )
+
+
+def clean_weight_expr(weight: pl.Expr) -> pl.Expr:
+    """Vectorized clean_weight for a string column. Values without recognizable
+    units are null, where clean_weight would raise an error."""
+    is_lb, number = _parse_measurement(weight, "lb", "kg")
+    kilograms = number * pl.when(is_lb).then(0.454).otherwise(1.0)
+    return (
+        pl.when(weight.is_null() | (weight == ""))
+        .then(np.nan)
+        .otherwise(bound_expr(kilograms, WEIGHT_RANGE))
+        .cast(pl.Float32)
+    )
+
+
+def clean_age_expr(age: pl.Expr) -> pl.Expr:
+    """Vectorized clean_age for an integer column."""
+    lower, upper = AGE_RANGE
+    return pl.when((age >= lower) & (age <= upper)).then(age).cast(pl.Int8)
+
+
+def clean_rank_expr(rank: pl.Expr) -> pl.Expr:
+    """Vectorized clean_rank for a string column."""
+    return rank.str.strip_chars().cast(pl.Int64, strict=False)
+
+
+def clean_gender_expr(gender: pl.Expr) -> pl.Expr:
+    """Vectorized clean_gender for a string column."""
+    return pl.when(gender == "M").then(1).when(gender == "F").then(0).cast(pl.Int8)
+
+
+def clean_score_expr(score: pl.Expr) -> pl.Expr:
+    """Vectorized clean_score for a string column."""
+    return pl.when(score != "").then(score)
+
+
+def _parse_flag(flag: pl.Expr) -> pl.Expr:
+    # Like bool(int(flag)), accepting booleans that were converted to strings.
+    flag = flag.str.strip_chars().replace({"true": "1", "false": "0"})
+    return flag.cast(pl.Int64, strict=False) != 0
+
+
+def clean_valid_expr(valid: pl.Expr) -> pl.Expr:
+    """Vectorized clean_valid for a string column."""
+    return (
+        pl.when(valid.is_null() | (valid == ""))
+        .then(False)
+        .otherwise(_parse_flag(valid))
+    )
+
+
+def clean_scaled_expr(scaled: pl.Expr) -> pl.Expr:
+    """Vectorized clean_scaled for a string column."""
+    return pl.when(scaled != "").then(_parse_flag(scaled))
+
+
+def reclean(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Applies the cleaning rules again to a frame that was already tabulated, like
+    consolidated data written before the rules changed. Only the rules of columns
+    in the frame are applied, so the tables of split years, which have some of the
+    columns each, can be recleaned too. Cleaned values are left as they are, so
+    recleaning is idempotent."""
+    rules = {
+        "height": bound_expr(pl.col("height"), HEIGHT_RANGE)
+        .fill_null(np.nan)
+        .cast(pl.Float32),
+        "weight": bound_expr(pl.col("weight"), WEIGHT_RANGE)
+        .fill_null(np.nan)
+        .cast(pl.Float32),
+        "age": clean_age_expr(pl.col("age")),
+        "gender": pl.when(pl.col("gender").is_in([0, 1])).then(pl.col("gender")),
+        "workoutScore": clean_score_expr(pl.col("workoutScore")),
+        "workoutValid": pl.col("workoutValid").fill_null(False),
+    }
+    names = frame.collect_schema().names()
+    return frame.with_columns(
+        **{name: rule for name, rule in rules.items() if name in names}
+    )
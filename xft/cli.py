@@ -1,17 +1,36 @@
 import fsspec
-import polars as pl
 import typer
 from omegaconf import OmegaConf
 from rich import print as rprint
 from rich.table import Table
 import humanize
 
+from time import perf_counter
 from typing import Annotated
 
 from . import misc
 from .download import BoardsConfig, download_boards, download_controls, write_parquet
-from .consolidate import ConsolidationConfig, consolidate_boards
-
+from .consolidate import (
+    CONSOLIDATION_STATE,
+    ConsolidationConfig,
+    consolidate_partitions,
+    consolidate_star,
+    consolidate_year,
+    division_subdir,
+    read_state,
+    reclean_consolidated,
+    split_consolidated,
+    stream_consolidated_year,
+    write_athletes,
+    write_state,
+    year_fingerprint,
+)
+from .archive import retabulate_boards
+from .httpcache import HttpCache
+from .index import AthleteIndex, update_index
+from .scheduler import DEFAULT_ITEM_PAGES, DEFAULT_LEASE_TTL, schedule_boards
+from .manifest import read_manifest
+from .scores import with_parsed_scores
 
 app = typer.Typer(no_args_is_help=True, pretty_exceptions_enable=False)
 
@@ -55,20 +74,75 @@ def boards(
         max_page=conf.max_page,
         force=conf.force,
         ignore_failures=conf.ignore_failures,
+        mode=conf.mode,
+        max_in_flight=conf.max_in_flight,
+        api_root=conf.api_root,
+        rate=conf.rate,
+        max_rate=conf.max_rate,
+        chunk_pages=conf.chunk_pages,
+        chunk_bytes=conf.chunk_bytes,
+        archive=conf.archive,
+        workers=conf.workers,
+        queue_size=conf.queue_size,
+        http_cache=conf.http_cache,
+        http_cache_ttl=conf.http_cache_ttl,
+        http_cache_bytes=conf.http_cache_bytes,
     )
 
 
+@app_download.command(no_args_is_help=True)
+def schedule(
+    config_path: Annotated[
+        str,
+        typer.Argument(help="Path to a download configuration yaml file."),
+    ],
+    item_pages: Annotated[
+        int, typer.Option(help="Most pages in each work item.")
+    ] = DEFAULT_ITEM_PAGES,
+    lease_ttl: Annotated[
+        float,
+        typer.Option(help="Seconds a division's lease lasts without being renewed."),
+    ] = DEFAULT_LEASE_TTL,
+):
+    """Downloads leaderboard pages like boards, with the same config file, but
+    through one queue of work items for every year and division. Several of these
+    can run at once, on different machines even, with the same output directory
+    and they will download different divisions."""
+    conf = OmegaConf.load(config_path)
+    structured_conf = OmegaConf.structured(BoardsConfig)
+    conf = OmegaConf.merge(structured_conf, conf)
+    conf = OmegaConf.to_object(conf)
+
+    rprint("Starting scheduled leaderboard downloads with the following parameters:")
+    for k, v in vars(conf).items():
+        rprint(f"  {k}: {v}")
+
+    tally = schedule_boards(conf, item_pages=item_pages, lease_ttl=lease_ttl)
+    rprint(tally.summary())
+
+
 @app_download.command(no_args_is_help=True)
 def controls(
-    output_directory: str, competition: str, years: list[int], force: bool = False
+    output_directory: str,
+    competition: str,
+    years: list[int],
+    force: bool = False,
+    http_cache: Annotated[
+        str | None,
+        typer.Option(help="Local directory where responses are cached."),
+    ] = None,
 ):
     """Downloads a control table to storage/disk."""
+    cache = None if http_cache is None else HttpCache(http_cache)
     download_controls(
         output_directory=output_directory,
         competition=competition,
         years=years,
         force=force,
+        cache=cache,
     )
+    if cache is not None:
+        rprint(cache.summary())
 
 
 @app.command(no_args_is_help=True)
@@ -81,14 +155,20 @@ def consolidate(
     """Consolidates leaderboard files into a single parquet file on storage.
     See the ConsolidationConfig dataclass for the parameters/arguments. Note
     that Games and Open results are automatically combined into files for
-    each consolidated year."""
+    each consolidated year, unless partitioned is set, in which case there is a
+    file for each competition, year, and division in boards/dataset."""
 
     conf = OmegaConf.load(config_path)
     structured_conf = OmegaConf.structured(ConsolidationConfig)
     conf = OmegaConf.merge(structured_conf, conf)
     conf = OmegaConf.to_object(conf)
     rprint(conf)
+    run_consolidation(conf)
 
+
+def run_consolidation(conf: ConsolidationConfig) -> None:
+    """Consolidates the years of a configuration, skipping the years that are
+    already up to date with their pages."""
     if conf.divisions is None:
         conf.divisions = list(range(1, 11)) + list(range(12, 40))
         rprint(f"Using all individual divisions: {conf.divisions}")
@@ -96,25 +176,231 @@ def consolidate(
     fs, url = fsspec.url_to_fs(conf.data_dir)
     output_dir = fs.sep.join([url, "boards", "consolidated"])
     fs.mkdirs(output_dir, exist_ok=True)
+    state_path = fs.sep.join([output_dir, CONSOLIDATION_STATE])
+    state = read_state(fs, state_path)
 
     for year in conf.years:
+        if conf.star:
+            start = perf_counter()
+            written = consolidate_star(
+                conf.data_dir,
+                year,
+                conf.divisions,
+                parse_scores=conf.parse_scores,
+                categorical=conf.categorical,
+                force=conf.force,
+            )
+            rprint(
+                f"{year} tables written: {len(written)} ({perf_counter() - start:.1f} s, peak RSS {humanize.naturalsize(misc.peak_rss())})"
+            )
+            continue
+        if conf.partitioned:
+            start = perf_counter()
+            written = consolidate_partitions(
+                conf.data_dir,
+                year,
+                conf.divisions,
+                parse_scores=conf.parse_scores,
+                categorical=conf.categorical,
+                force=conf.force,
+            )
+            rprint(
+                f"{year} partitions written: {len(written)} ({perf_counter() - start:.1f} s, peak RSS {humanize.naturalsize(misc.peak_rss())})"
+            )
+            continue
         output_path = fs.sep.join([url, "boards", "consolidated", f"{year}.parquet"])
-        if conf.force or not fs.isfile(output_path):
+        # Years are only rebuilt if their pages changed since the last time.
+        fingerprint = year_fingerprint(
+            conf.data_dir,
+            year,
+            conf.divisions,
+            conf.parse_scores,
+            conf.categorical,
+            conf.split_athletes,
+        )
+        changed = state.get(str(year)) != fingerprint
+        if conf.force or changed or not fs.isfile(output_path):
             rprint(f"starting {year}")
-            dfs = []
-            for competition in ["games", "open"]:
-                for division in conf.divisions:
-                    df = consolidate_boards(conf.data_dir, competition, year, division)
-                    if df is not None:
-                        dfs.append(df)
-            df = pl.concat(dfs, how="vertical")
+            start = perf_counter()
+            if conf.streaming:
+                pages = stream_consolidated_year(
+                    conf.data_dir,
+                    year,
+                    conf.divisions,
+                    output_path,
+                    parse_scores=conf.parse_scores,
+                    categorical=conf.categorical,
+                    split_athletes=conf.split_athletes,
+                )
+                if pages == 0:
+                    rprint(f"no boards found for {year}")
+                    continue
+                rprint(f"{year} table streamed from {pages} files")
+            else:
+                df = consolidate_year(conf.data_dir, year, conf.divisions)
+                if df is None:
+                    rprint(f"no boards found for {year}")
+                    continue
+                if conf.split_athletes:
+                    write_athletes(fs, url, year, df)
+                if conf.parse_scores:
+                    df = with_parsed_scores(df)
+                df = split_consolidated(
+                    df,
+                    categorical=conf.categorical,
+                    split_athletes=conf.split_athletes,
+                )
+                rprint(
+                    f"{year} table consolidated ({humanize.naturalsize(df.estimated_size())})"
+                )
+                write_parquet(fs, output_path, df)
             rprint(
-                f"{year} table consolidated ({humanize.naturalsize(df.estimated_size())})"
+                f"file written: {output_path} ({perf_counter() - start:.1f} s, peak RSS {humanize.naturalsize(misc.peak_rss())})"
             )
-            write_parquet(fs, output_path, df)
-            rprint(f"file written: {output_path}")
+            state[str(year)] = fingerprint
+            write_state(fs, state_path, state)
         else:
-            rprint(f"file already existed and force={conf.force}: {output_path}")
+            rprint(
+                f"file already up to date with its pages and force={conf.force}: {output_path}"
+            )
+
+    if conf.index and not (conf.star or conf.partitioned):
+        start = perf_counter()
+        read = update_index(conf.data_dir)
+        rprint(
+            f"athlete index updated from {len(read)} changed year(s) ({perf_counter() - start:.1f} s)"
+        )
+
+
+@app.command(no_args_is_help=True)
+def retabulate(
+    data_dir: Annotated[
+        str, typer.Argument(help="The root of an xft file system, like in configs.")
+    ],
+    competition: Annotated[
+        str, typer.Argument(help="The competition type ('games' or 'open').")
+    ],
+    years: Annotated[list[int], typer.Argument(help="Years to retabulate.")],
+    divisions: Annotated[
+        list[int] | None,
+        typer.Option(help="Divisions to retabulate. All individual ones by default."),
+    ] = None,
+    workers: Annotated[
+        int | None,
+        typer.Option(help="Worker processes. One for each core by default."),
+    ] = None,
+    chunk_pages: Annotated[
+        int | None, typer.Option(help="Pages packed into each chunk file.")
+    ] = None,
+    consolidate: Annotated[
+        bool, typer.Option(help="Whether to consolidate the years afterward.")
+    ] = False,
+):
+    """Rebuilds page files from the archives of raw board json kept by downloads
+    (see BoardsConfig.archive), applying the current tabulation and cleaning without
+    making any requests."""
+    if not divisions:
+        divisions = list(range(1, 11)) + list(range(12, 40))
+    start = perf_counter()
+    written = retabulate_boards(
+        data_dir,
+        competition,
+        years,
+        divisions,
+        workers=workers,
+        chunk_pages=chunk_pages,
+    )
+    if not written:
+        rprint(f"no archived boards found for {competition} {years}")
+        return None
+    for (year, division), pages in written.items():
+        rprint(f"{competition} {year} division {division}: {pages} page(s) rewritten")
+    rprint(
+        f"retabulated {sum(written.values())} page(s) in {perf_counter() - start:.1f} s"
+    )
+    if consolidate:
+        # Only years whose pages changed are consolidated again.
+        run_consolidation(
+            ConsolidationConfig(
+                data_dir=data_dir, years=sorted({year for year, _ in written})
+            )
+        )
+    return None
+
+
+@app.command(no_args_is_help=True)
+def reclean(
+    data_dir: Annotated[
+        str, typer.Argument(help="The root of an xft file system, like in configs.")
+    ],
+    years: Annotated[
+        list[int] | None,
+        typer.Argument(help="Years to reclean. All consolidated years by default."),
+    ] = None,
+):
+    """Applies the current cleaning rules to consolidated files in place, without
+    downloading or tabulating anything again."""
+    reclean_consolidated(data_dir, years or None)
+
+
+@app.command(no_args_is_help=True)
+def missing(
+    data_dir: Annotated[
+        str, typer.Argument(help="The root of an xft file system, like in configs.")
+    ],
+    competition: Annotated[
+        str, typer.Argument(help="The competition type ('games' or 'open').")
+    ],
+    years: Annotated[list[int], typer.Argument(help="Years to check.")],
+):
+    """Prints the pages missing from each downloaded division, according to the
+    manifests written by downloads, without listing any page files."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    table = Table(title=f"Missing {competition} pages")
+    for column in ["Year", "Division", "Last Page", "Present", "Missing"]:
+        table.add_column(column)
+    for year in years:
+        for division in misc.DIVISIONS:
+            subdir = division_subdir(fs, url, competition, year, division)
+            manifest = read_manifest(fs, subdir)
+            if manifest is None:
+                continue
+            gaps = manifest.missing()
+            table.add_row(
+                str(year),
+                str(division),
+                str(manifest.last_page),
+                str(len(manifest.pages)),
+                misc.format_ranges(gaps) if gaps else "none",
+            )
+    rprint(table)
+
+
+@app.command(no_args_is_help=True)
+def career(
+    data_dir: Annotated[
+        str, typer.Argument(help="The root of an xft file system, like in configs.")
+    ],
+    competitor_id: Annotated[int, typer.Argument(help="The athlete's competitorId.")],
+):
+    """Prints every entry of an athlete in the consolidated years, using the
+    athlete index written by consolidation."""
+    entries = AthleteIndex(data_dir).lookup(competitor_id)
+    if len(entries) == 0:
+        rprint(f"no entries found for competitor {competitor_id}")
+        return None
+    table = Table(title=f"Competitor {competitor_id}")
+    for column in ["Year", "Competition", "Division", "Rows"]:
+        table.add_column(column)
+    for row in entries.iter_rows(named=True):
+        table.add_row(
+            str(row["year"]),
+            row["competitionType"],
+            misc.DIVISIONS.get(row["divisionId"], str(row["divisionId"])),
+            f"{row['row']}-{row['row'] + row['rows'] - 1}",
+        )
+    rprint(table)
+    return None
 
 
 @app.command()
@@ -1,12 +1,66 @@
 import fsspec
 from concurrent.futures import ThreadPoolExecutor
 import polars as pl
+import hashlib
+import inspect
+import json
+import os
+import re
+import tempfile
 import warnings
-import itertools
 from dataclasses import dataclass
 import humanize
 from rich import print as rprint
 
+from . import clean, manifest, misc, scores, tabulate
+from .download import write_parquet
+
+# Columns that name the directories of the partitioned dataset, with their types.
+PARTITIONS = {"competitionType": pl.String, "year": pl.Int16, "divisionId": pl.Int8}
+
+# Name of the files recording what consolidated files were made from.
+CONSOLIDATION_STATE = "manifest.json"
+
+# Order of the rows in each partition file.
+PARTITION_SORT = ["overallRank", "competitorId", "workoutNumber"]
+
+PARTITION_ROW_GROUP_SIZE = 50_000
+
+# Columns identifying an entry, which is an athlete in one division of one
+# competition and year.
+ENTRY_KEY = ["competitorId", "competitionType", "year", "divisionId"]
+
+# Columns of the workout results table, besides ENTRY_KEY. The rest of a
+# leaderboard row belongs to the athlete or the entry.
+RESULT_COLS = [
+    "workoutNumber",
+    "workoutRank",
+    "workoutScore",
+    "workoutValid",
+    "workoutScaled",
+    *scores.SCORE_SCHEMA,
+]
+
+# Tables of the star schema, besides the athlete tables, in directories of boards.
+STAR_TABLES = ["entries", "results"]
+
+# Attributes of athletes that are kept once per athlete and year, in the athlete
+# tables, when consolidated years are split.
+ATHLETE_COLS = [
+    "competitorName",
+    "gender",
+    "countryOfOriginCode",
+    "countryOfOriginName",
+]
+
+# Columns identifying a row of the athlete tables, which have the attributes of
+# each athlete as they were in each year.
+ATHLETE_KEY = ["competitorId", "year"]
+
+# Struct column of split years with the ATHLETE_COLS of rows without a competitorId,
+# which can't be joined to the athlete tables, and null in every other row.
+INLINE_ATHLETE = "athlete"
+
 
 def read_parquet(fs, url) -> pl.DataFrame:
     with fs.open(url, "rb") as f, warnings.catch_warnings():
@@ -29,16 +83,12 @@ def consolidate_boards(
     """Consolidates leaderboard files/chunks for a specific competition, year,
     and division."""
     fs, url = fsspec.url_to_fs(data_dir)
-    urls = fs.glob(
-        fs.sep.join(
-            [url, "boards", competition, str(year), f"division-{division:02}/*.parquet"]
-        )
-    )
+    found = list_divisions(fs, url, competition, year, [division])
     # If there are no boards to read, return None instead of error.
-    if len(urls) == 0:
+    if len(found) == 0:
         return None
     # Otherwise read the boards in parallel and concatenate then in to a single DataFrame.
-    return pl.concat(read_parquets(fs, urls), rechunk=True, how="vertical")
+    return read_parts(fs, found[division].parts)
 
 
 def consolidate_year(
@@ -48,21 +98,580 @@ def consolidate_year(
     including all divisions and both the Open and Games."""
 
     fs, url = fsspec.url_to_fs(data_dir)
-    urls = []
-    prod = itertools.product(["games", "open"], divisions)
-    for competition, division in prod:
-        components = [
+    parts = [
+        part for pages in list_year(fs, url, year, divisions) for part in pages.parts
+    ]
+    # If there are no boards to read, return None instead of error.
+    if len(parts) == 0:
+        return None
+    return read_parts(fs, parts)
+
+
+def read_parts(fs, parts: list[tuple[str, int, int | None]]) -> pl.DataFrame:
+    """Reads (file, first row, number of rows) pieces of page files in parallel and
+    concatenates them. Files holding several pieces are only read once."""
+    urls = list(dict.fromkeys(url for url, _, _ in parts))
+    files = dict(zip(urls, read_parquets(fs, urls)))
+    dfs = [
+        files[url] if rows is None else files[url].slice(offset, rows)
+        for url, offset, rows in parts
+    ]
+    return pl.concat(dfs, rechunk=True, how="vertical")
+
+
+@dataclass
+class DivisionPages:
+    # The (file, first row, number of rows) pieces of files holding the division's
+    # pages, in page order. The number of rows is None where whole files are used.
+    parts: list[tuple[str, int, int | None]]
+    # A hash that changes whenever any of the pages change.
+    fingerprint: str
+
+    @property
+    def urls(self) -> list[str]:
+        return list(dict.fromkeys(url for url, _, _ in self.parts))
+
+
+def division_subdir(fs, url, competition: str, year: int, division: int) -> str:
+    return fs.sep.join(
+        [url, "boards", competition, str(year), f"division-{division:02}"]
+    )
+
+
+def glob_divisions(
+    fs, url, competition: str, year: int, divisions: list[int]
+) -> dict[int, DivisionPages]:
+    """Lists the page files of each division with pages, using a single glob. The
+    fingerprints come from file sizes and modification times."""
+    found = {}
+    pattern = fs.sep.join([url, "boards", competition, str(year), "division-*"])
+    details = fs.glob(fs.sep.join([pattern, "*.parquet"]), detail=True)
+    for page_url, info in sorted(details.items()):
+        match = re.search(r"division-(\d+)", page_url)
+        found.setdefault(int(match.group(1)), []).append((page_url, info))
+    listed = {}
+    for division in divisions:
+        if division in found:
+            digest = hashlib.sha256()
+            for page_url, info in found[division]:
+                versions = manifest.file_versions(info)
+                digest.update(f"{page_url}:{info['size']}:{versions}\n".encode())
+            parts = [(page_url, 0, None) for page_url, _ in found[division]]
+            listed[division] = DivisionPages(parts, digest.hexdigest())
+    return listed
+
+
+def list_divisions(
+    fs, url, competition: str, year: int, divisions: list[int]
+) -> dict[int, DivisionPages]:
+    """Lists the page files of each division with pages from the division manifests
+    written by download_boards, falling back to a glob for divisions downloaded
+    before there were manifests."""
+    subdirs = {
+        division: division_subdir(fs, url, competition, year, division)
+        for division in divisions
+    }
+    with ThreadPoolExecutor() as executor:
+        manifests = dict(
+            zip(
+                subdirs,
+                executor.map(lambda d: manifest.read_manifest(fs, d), subdirs.values()),
+            )
+        )
+    listed = {}
+    for division, division_manifest in manifests.items():
+        if division_manifest is not None and division_manifest.pages:
+            listed[division] = DivisionPages(
+                [
+                    (fs.sep.join([subdirs[division], name]), offset, rows)
+                    for name, offset, rows in division_manifest.parts()
+                ],
+                division_manifest.fingerprint(),
+            )
+    unlisted = [d for d in divisions if manifests[d] is None]
+    if unlisted:
+        listed |= glob_divisions(fs, url, competition, year, unlisted)
+    return {division: listed[division] for division in divisions if division in listed}
+
+
+def fingerprint_pages(
+    pages: list[DivisionPages],
+    parse_scores: bool,
+    categorical: bool = False,
+    split_athletes: bool = False,
+) -> str:
+    """Combines division fingerprints and the consolidation options into a hash
+    that says whether consolidated output is up to date."""
+    digest = hashlib.sha256(f"parse_scores={parse_scores}\n".encode())
+    # Options added later only change the hash when they're used, so that output
+    # written before they existed stays up to date.
+    for key, value in [
+        ("categorical", categorical),
+        ("split_athletes", split_athletes),
+    ]:
+        if value:
+            digest.update(f"{key}={value}\n".encode())
+    for division_pages in pages:
+        digest.update(f"{division_pages.fingerprint}\n".encode())
+    return digest.hexdigest()
+
+
+def read_state(fs, path: str) -> dict[str, str]:
+    """Reads the fingerprints of the inputs of consolidated files."""
+    try:
+        return json.loads(fs.cat_file(path))
+    except FileNotFoundError:
+        return {}
+
+
+def write_state(fs, path: str, state: dict[str, str]) -> None:
+    misc.write_atomic(fs, path, json.dumps(state, indent=1, sort_keys=True).encode())
+    return None
+
+
+def list_year(fs, url, year: int, divisions: list[int]) -> list[DivisionPages]:
+    """Lists the page files of a year's Games and Open boards, by division, in the
+    same order as consolidate_year."""
+    pages = []
+    for competition in ["games", "open"]:
+        pages += list_divisions(fs, url, competition, year, divisions).values()
+    return pages
+
+
+def year_fingerprint(
+    data_dir: str,
+    year: int,
+    divisions: list[int],
+    parse_scores: bool = True,
+    categorical: bool = False,
+    split_athletes: bool = False,
+) -> str:
+    fs, url = fsspec.url_to_fs(data_dir)
+    return fingerprint_pages(
+        list_year(fs, url, year, divisions), parse_scores, categorical, split_athletes
+    )
+
+
+def athlete_path(fs, url, year: int) -> str:
+    return fs.sep.join([url, "boards", "athletes", f"{year}.parquet"])
+
+
+def athlete_table(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Takes the attributes in ATHLETE_COLS out of a leaderboard frame, with one row
+    for each athlete and the first value of each attribute that isn't null."""
+    return (
+        frame.filter(pl.col("competitorId").is_not_null())
+        .group_by("competitorId")
+        .agg(pl.col(ATHLETE_COLS).drop_nulls().first(), pl.col("year").max())
+        .sort("competitorId")
+    )
+
+
+def write_athletes(fs, url, year: int, frame: pl.DataFrame | pl.LazyFrame) -> None:
+    """Writes the athlete table of a year's leaderboard frame, streaming it if the
+    frame is lazy."""
+    output_path = athlete_path(fs, url, year)
+    if isinstance(frame, pl.LazyFrame):
+        sink_parquet(fs, output_path, athlete_table(frame))
+        return None
+    fs.makedirs(fs.sep.join([url, "boards", "athletes"]), exist_ok=True)
+    write_parquet(fs, output_path, athlete_table(frame))
+    return None
+
+
+def split_consolidated(
+    frame: pl.DataFrame | pl.LazyFrame,
+    *,
+    categorical: bool = False,
+    split_athletes: bool = False,
+) -> pl.DataFrame | pl.LazyFrame:
+    """Applies the storage options of consolidated years to a leaderboard frame,
+    dropping the columns that go into the athlete table if split and encoding the
+    repeated strings if categorical. Rows without a competitorId keep their
+    attributes in the INLINE_ATHLETE column of a split frame."""
+    if split_athletes:
+        frame = frame.with_columns(
+            pl.when(pl.col("competitorId").is_null())
+            .then(pl.struct(ATHLETE_COLS))
+            .alias(INLINE_ATHLETE)
+        ).drop(ATHLETE_COLS)
+    if categorical:
+        frame = tabulate.encode_categoricals(frame)
+    return frame
+
+
+def scan_parquets(fs, urls) -> pl.LazyFrame:
+    """Lazily scans parquet files on any file system that polars can read."""
+    if not misc.is_local(fs):
+        urls = [fs.unstrip_protocol(url) for url in urls]
+    return pl.scan_parquet(urls)
+
+
+def scan_parts(fs, parts: list[tuple[str, int, int | None]]) -> pl.LazyFrame:
+    """Lazily scans (file, first row, number of rows) pieces of page files. Runs of
+    whole files are scanned together."""
+    lfs = []
+    whole = []
+    for url, offset, rows in parts:
+        if rows is None:
+            whole.append(url)
+            continue
+        if whole:
+            lfs.append(scan_parquets(fs, whole))
+            whole = []
+        lfs.append(scan_parquets(fs, [url]).slice(offset, rows))
+    if whole:
+        lfs.append(scan_parquets(fs, whole))
+    return pl.concat(lfs, how="vertical")
+
+
+def sink_parquet(fs, output_path, lf: pl.LazyFrame, **kwargs) -> None:
+    """Streams a lazy frame to a parquet file, passing keyword arguments on to
+    LazyFrame.sink_parquet. Remote files are streamed to a temporary local file
+    first and then uploaded. Local files are streamed to a temporary name and then
+    renamed, so a partial file is never left at output_path."""
+    if misc.is_local(fs):
+        fs.mkdirs(os.path.dirname(output_path), exist_ok=True)
+        temporary = misc.temporary_path(fs, output_path)
+        try:
+            lf.sink_parquet(temporary, **kwargs)
+            fs.mv(temporary, output_path)
+        finally:
+            if fs.exists(temporary):
+                fs.rm_file(temporary)
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(output_path))
+        lf.sink_parquet(path, **kwargs)
+        fs.put_file(path, output_path)
+    return None
+
+
+def sink_parquets(fs, sinks: list[tuple[str, pl.LazyFrame]], **kwargs) -> None:
+    """Streams several lazy frames to (output path, frame) parquet files like
+    sink_parquet, but in one query, so that the scans they share are read only once.
+    Older versions of Polars can't sink lazily, so each frame is streamed on its own
+    there, reading its scans again."""
+    if "lazy" not in inspect.signature(pl.LazyFrame.sink_parquet).parameters:
+        for output_path, lf in sinks:
+            sink_parquet(fs, output_path, lf, **kwargs)
+        return None
+    local = misc.is_local(fs)
+    with tempfile.TemporaryDirectory() as tmp:
+        temporaries = []
+        for i, (output_path, _) in enumerate(sinks):
+            if local:
+                fs.mkdirs(os.path.dirname(output_path), exist_ok=True)
+                temporaries.append(misc.temporary_path(fs, output_path))
+            else:
+                name = f"{i}-{os.path.basename(output_path)}"
+                temporaries.append(os.path.join(tmp, name))
+        try:
+            pl.collect_all(
+                [
+                    lf.sink_parquet(path, lazy=True, **kwargs)
+                    for path, (_, lf) in zip(temporaries, sinks)
+                ]
+            )
+            for path, (output_path, _) in zip(temporaries, sinks):
+                if local:
+                    fs.mv(path, output_path)
+                else:
+                    fs.put_file(path, output_path)
+        finally:
+            if local:
+                for path in temporaries:
+                    if fs.exists(path):
+                        fs.rm_file(path)
+    return None
+
+
+def stream_consolidated_year(
+    data_dir: str,
+    year: int,
+    divisions: list[int],
+    output_path: str,
+    *,
+    parse_scores: bool = True,
+    categorical: bool = False,
+    split_athletes: bool = False,
+) -> int:
+    """Consolidates a year's leaderboard files straight into a parquet file, like
+    consolidate_year followed by write_parquet, but without ever holding the whole
+    year in memory. If split_athletes is set, the year's athlete table is streamed
+    into its own file too. Returns the number of files read, writing nothing if
+    there are none."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    pages = list_year(fs, url, year, divisions)
+    parts = [part for division_pages in pages for part in division_pages.parts]
+    if len(parts) == 0:
+        return 0
+    lf = scan_parts(fs, parts)
+    if split_athletes:
+        write_athletes(fs, url, year, lf)
+    if parse_scores:
+        lf = scores.with_parsed_scores(lf)
+    lf = split_consolidated(lf, categorical=categorical, split_athletes=split_athletes)
+    sink_parquet(fs, output_path, lf)
+    return sum(len(division_pages.urls) for division_pages in pages)
+
+
+def partition_path(fs, url, competition: str, year: int, division: int) -> str:
+    return fs.sep.join(
+        [
             url,
             "boards",
-            competition,
-            str(year),
-            f"division-{division:02}/*.parquet",
+            "dataset",
+            f"competitionType={competition}",
+            f"year={year}",
+            f"divisionId={division}",
+            "0.parquet",
         ]
-        urls += list(fs.glob(fs.sep.join(components)))
-    # If there are no boards to read, return None instead of error.
+    )
+
+
+def consolidate_partitions(
+    data_dir: str,
+    year: int,
+    divisions: list[int],
+    *,
+    parse_scores: bool = True,
+    categorical: bool = False,
+    force: bool = False,
+) -> list[str]:
+    """Consolidates a year's leaderboard files into the Hive-partitioned dataset,
+    with one file per competition and division. Rows are sorted by rank so that
+    row group statistics let readers skip most of a file when filtering on rank.
+    Only partitions whose pages changed since they were last written are rebuilt,
+    unless forced, and only one division is streamed through memory at a time.
+    Returns the paths of the files written."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    state_path = fs.sep.join([url, "boards", "dataset", CONSOLIDATION_STATE])
+    state = read_state(fs, state_path)
+    written = []
+    try:
+        for competition in ["games", "open"]:
+            found = list_divisions(fs, url, competition, year, divisions)
+            for division, pages in found.items():
+                output_path = partition_path(fs, url, competition, year, division)
+                key = f"{competition}/{year}/{division}"
+                fingerprint = fingerprint_pages([pages], parse_scores, categorical)
+                if not force and state.get(key) == fingerprint:
+                    continue
+                lf = scan_parts(fs, pages.parts)
+                if parse_scores:
+                    lf = scores.with_parsed_scores(lf)
+                # The partition columns are in the directory names instead.
+                lf = lf.drop(*PARTITIONS).sort(PARTITION_SORT, nulls_last=True)
+                lf = split_consolidated(lf, categorical=categorical)
+                sink_parquet(
+                    fs,
+                    output_path,
+                    lf,
+                    statistics=True,
+                    row_group_size=PARTITION_ROW_GROUP_SIZE,
+                )
+                state[key] = fingerprint
+                written.append(output_path)
+    finally:
+        if written:
+            write_state(fs, state_path, state)
+    return written
+
+
+def scan_dataset(data_dir: str) -> pl.LazyFrame:
+    """Lazily scans the Hive-partitioned dataset. Filters on the partition columns
+    skip whole files, and other filters can skip row groups."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    pattern = fs.sep.join([url, "boards", "dataset", "**", "*.parquet"])
+    if not misc.is_local(fs):
+        pattern = fs.unstrip_protocol(pattern)
+    return pl.scan_parquet(pattern, hive_partitioning=True, hive_schema=PARTITIONS)
+
+
+def load_dataset(
+    data_dir: str,
+    *,
+    competitions: list[str] | None = None,
+    years: list[int] | None = None,
+    divisions: list[int] | None = None,
+    columns: list[str] | None = None,
+    where: pl.Expr | None = None,
+) -> pl.DataFrame:
+    """Loads part of the Hive-partitioned dataset. Only the files of the given
+    competitions, years, and divisions are read, and only the given columns of
+    them. Any other filter can be passed as an expression."""
+    lf = scan_dataset(data_dir)
+    for key, values in [
+        ("competitionType", competitions),
+        ("year", years),
+        ("divisionId", divisions),
+    ]:
+        if values is not None:
+            lf = lf.filter(pl.col(key).is_in(values))
+    if where is not None:
+        lf = lf.filter(where)
+    if columns is not None:
+        lf = lf.select(columns)
+    return lf.collect()
+
+
+def star_path(fs, url, table: str, year: int) -> str:
+    return fs.sep.join([url, "boards", table, f"{year}.parquet"])
+
+
+def entries_table(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Takes the entries out of a leaderboard frame, with one row for each athlete
+    in each competition, year, and division, and without workouts or the
+    attributes in ATHLETE_COLS."""
+    names = frame.collect_schema().names()
+    return (
+        frame.select(
+            col for col in names if col not in RESULT_COLS and col not in ATHLETE_COLS
+        )
+        .unique(ENTRY_KEY, keep="first")
+        .sort(ENTRY_KEY)
+    )
+
+
+def results_table(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Takes the workout results out of a leaderboard frame, keyed by ENTRY_KEY and
+    workoutNumber. Rows without workouts only appear in the entries."""
+    names = frame.collect_schema().names()
+    return (
+        frame.select(*ENTRY_KEY, *(col for col in RESULT_COLS if col in names))
+        .filter(pl.col("workoutNumber").is_not_null())
+        .sort(*ENTRY_KEY, "workoutNumber")
+    )
+
+
+def consolidate_star(
+    data_dir: str,
+    year: int,
+    divisions: list[int],
+    *,
+    parse_scores: bool = True,
+    categorical: bool = False,
+    force: bool = False,
+) -> list[str]:
+    """Consolidates a year's leaderboard files into three linked tables instead of
+    one, so that nothing is repeated for every workout: athletes (by
+    competitorId), entries (by ENTRY_KEY, with overall ranks and scores), and
+    workout results (by ENTRY_KEY and workoutNumber). The three tables are streamed
+    together, in one query that reads the page files once (see sink_parquets). The
+    year is skipped if its pages haven't changed since it was last written, unless
+    forced. Returns the paths of the files written."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    state_path = fs.sep.join([url, "boards", "entries", CONSOLIDATION_STATE])
+    state = read_state(fs, state_path)
+    pages = list_year(fs, url, year, divisions)
+    parts = [part for division_pages in pages for part in division_pages.parts]
+    fingerprint = fingerprint_pages(pages, parse_scores, categorical)
+    if len(parts) == 0 or (not force and state.get(str(year)) == fingerprint):
+        return []
+    lf = scan_parts(fs, parts)
+    if parse_scores:
+        lf = scores.with_parsed_scores(lf)
+    lf = split_consolidated(lf, categorical=categorical)
+    # Every table is made from the same frame, so the scan is shared.
+    sinks = [(athlete_path(fs, url, year), athlete_table(lf))]
+    for table, make_table in zip(STAR_TABLES, [entries_table, results_table]):
+        sinks.append((star_path(fs, url, table, year), make_table(lf)))
+    sink_parquets(fs, sinks, statistics=True)
+    written = [output_path for output_path, _ in sinks]
+    state[str(year)] = fingerprint
+    write_state(fs, state_path, state)
+    return written
+
+
+def scan_star(data_dir: str) -> dict[str, pl.LazyFrame]:
+    """Lazily scans the athlete, entry, and result tables of every year written by
+    consolidate_star. The athlete tables have a row for each athlete in each year,
+    so they're joined on competitorId and year."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    lfs = {"athletes": scan_athletes(data_dir)}
+    if lfs["athletes"] is None:
+        raise FileNotFoundError("There are no athletes tables.")
+    for table in STAR_TABLES:
+        urls = fs.glob(fs.sep.join([url, "boards", table, "*.parquet"]))
+        if len(urls) == 0:
+            raise FileNotFoundError(f"There are no {table} tables.")
+        lfs[table] = scan_parquets(fs, urls)
+    return lfs
+
+
+def scan_athletes(data_dir: str) -> pl.LazyFrame | None:
+    """Lazily scans the athlete tables of every year, with a row for each athlete
+    in each year they appear in, or returns None if there are none."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    urls = fs.glob(fs.sep.join([url, "boards", "athletes", "*.parquet"]))
     if len(urls) == 0:
         return None
-    return pl.concat(read_parquets(fs, urls), rechunk=True, how="vertical")
+    return scan_parquets(fs, urls).pipe(tabulate.encode_categoricals)
+
+
+def join_athletes(
+    frame: pl.DataFrame | pl.LazyFrame, athletes: pl.DataFrame | pl.LazyFrame
+) -> pl.DataFrame | pl.LazyFrame:
+    """Joins the attributes of athletes back into a split year, from the athlete
+    tables or, for rows without a competitorId, from the year's INLINE_ATHLETE
+    column, with the columns in the order of unsplit years."""
+    frame = frame.join(athletes, on=ATHLETE_KEY, how="left")
+    schema = frame.collect_schema()
+    # Years split before rows without an id were kept have no inline attributes.
+    if INLINE_ATHLETE in schema.names():
+        frame = frame.with_columns(
+            pl.coalesce(
+                pl.col(col),
+                pl.col(INLINE_ATHLETE).struct.field(col).cast(schema[col]),
+            )
+            for col in ATHLETE_COLS
+        ).drop(INLINE_ATHLETE)
+    return order_columns(frame)
+
+
+def order_columns(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Puts the columns of a frame in the order of consolidated leaderboards."""
+    order = [*tabulate.SCHEMA, *scores.SCORE_SCHEMA]
+    return frame.select(sorted(frame.collect_schema().names(), key=order.index))
+
+
+def load_entries(
+    data_dir: str, *, years: list[int] | None = None, where: pl.Expr | None = None
+) -> pl.DataFrame:
+    """Loads the overall results of entries with their athletes' attributes from
+    the star schema, like analysis.overall_results gives from a whole consolidated
+    leaderboard, without reading any workouts."""
+    lfs = scan_star(data_dir)
+    lf = lfs["entries"]
+    if years is not None:
+        lf = lf.filter(pl.col("year").is_in(years))
+    if where is not None:
+        lf = lf.filter(where)
+    lf = lf.join(lfs["athletes"], on=ATHLETE_KEY, how="left")
+    return order_columns(lf).collect()
+
+
+def load_star(
+    data_dir: str,
+    *,
+    years: list[int] | None = None,
+    columns: list[str] | None = None,
+    where: pl.Expr | None = None,
+) -> pl.DataFrame:
+    """Loads workout results from the star schema joined with their entries and
+    athletes, giving the rows of consolidated leaderboards. The joins are lazy, so
+    only the tables and columns that are needed are read."""
+    lfs = scan_star(data_dir)
+    lf = lfs["results"].join(lfs["entries"], on=ENTRY_KEY, how="left")
+    lf = order_columns(lf.join(lfs["athletes"], on=ATHLETE_KEY, how="left"))
+    if years is not None:
+        lf = lf.filter(pl.col("year").is_in(years))
+    if where is not None:
+        lf = lf.filter(where)
+    if columns is not None:
+        lf = lf.select(columns)
+    return lf.collect()
 
 
 @dataclass
@@ -71,6 +680,29 @@ class ConsolidationConfig:
     years: list[int]
     divisions: list[int] | None = None
     force: bool = False
+    # Whether to add numeric columns parsed from the workout score strings.
+    parse_scores: bool = True
+    # Whether to stream page files into the consolidated files with bounded memory,
+    # instead of loading each year into memory first.
+    streaming: bool = False
+    # Whether to write the Hive-partitioned dataset instead of a file for each year.
+    partitioned: bool = False
+    # Whether to store repeated strings, like names and affiliates, as categorical
+    # columns, which keep each distinct value once.
+    categorical: bool = False
+    # Whether to move the attributes in ATHLETE_COLS out of the consolidated years
+    # into athlete tables with a row per athlete, in boards/athletes. Rows without a
+    # competitorId keep theirs in the year (see INLINE_ATHLETE). Partitioned
+    # datasets are never split.
+    split_athletes: bool = False
+    # Whether to write each year as linked athlete, entry, and workout result
+    # tables, in boards/athletes, boards/entries, and boards/results, instead of a
+    # file for each year. See consolidate_star.
+    star: bool = False
+    # Whether to keep the athlete index of the consolidated years up to date (see
+    # xft.index), which only reads the years that changed. Only files for each
+    # year are indexed, so nothing is done when star or partitioned is set.
+    index: bool = True
 
 
 def read_control(fs, url) -> pl.DataFrame:
@@ -81,25 +713,110 @@ def read_control(fs, url) -> pl.DataFrame:
     return df
 
 
+def load_athletes(data_dir: str) -> pl.DataFrame | None:
+    """Loads the athlete tables written when consolidating with split_athletes,
+    with a row for each athlete in each year they appear in, or returns None if
+    there are none."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    urls = fs.glob(fs.sep.join([url, "boards", "athletes", "*.parquet"]))
+    if len(urls) == 0:
+        return None
+    df = pl.concat(read_parquets(fs, urls), how="vertical")
+    df = df.sort(ATHLETE_KEY)
+    return tabulate.encode_categoricals(df)
+
+
 def load_consolidated(data_dir: str) -> pl.DataFrame:
-    """Loads consolidated data frames from the root of an xft file system (data_dir)."""
+    """Loads consolidated data frames from the root of an xft file system (data_dir).
+    The athlete attributes of years consolidated with split_athletes are joined
+    back from the athlete tables."""
     fs, url = fsspec.url_to_fs(data_dir)
     urls = fs.glob(fs.sep.join([url, "boards", "consolidated", "*.parquet"]))
     if len(urls) == 0:
         raise FileNotFoundError("There are no consolidated boards files.")
+    athletes = None
     dfs = []
-    for url in urls:
-        df = read_parquet(fs, url)
-        rprint(f"Loaded about {humanize.naturalsize(df.estimated_size())} from {url}.")
-        dfs.append(df)
-
-    df = pl.concat(dfs, how="vertical", rechunk=True)
+    with misc.string_cache():
+        for url in urls:
+            df = read_parquet(fs, url)
+            rprint(
+                f"Loaded about {humanize.naturalsize(df.estimated_size())} from {url}."
+            )
+            if "competitorName" not in df.columns:
+                if athletes is None:
+                    athletes = load_athletes(data_dir)
+                if athletes is None:
+                    raise FileNotFoundError(
+                        f"There are no athlete tables for the split file {url}."
+                    )
+                df = join_athletes(df, athletes)
+            dfs.append(df)
+        # Years consolidated before categorical columns existed have strings.
+        df = pl.concat(dfs, how="vertical_relaxed", rechunk=True)
     rprint(
         f"Total size of concatenated data frame is {humanize.naturalsize(df.estimated_size())}."
     )
     return df
 
 
+def scan_consolidated(data_dir: str) -> pl.LazyFrame:
+    """Lazily scans the consolidated files of every year, like load_consolidated
+    loads them, so that filters and column selections on the result are pushed down
+    to the files. Collect it inside misc.string_cache."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    urls = fs.glob(fs.sep.join([url, "boards", "consolidated", "*.parquet"]))
+    if len(urls) == 0:
+        raise FileNotFoundError("There are no consolidated boards files.")
+    athletes = None
+    lfs = []
+    for url in urls:
+        lf = scan_parquets(fs, [url])
+        if "competitorName" not in lf.collect_schema().names():
+            if athletes is None:
+                athletes = scan_athletes(data_dir)
+            if athletes is None:
+                raise FileNotFoundError(
+                    f"There are no athlete tables for the split file {url}."
+                )
+            lf = join_athletes(lf, athletes)
+        lfs.append(lf)
+    return pl.concat(lfs, how="vertical_relaxed")
+
+
+def reclean_consolidated(data_dir: str, years: list[int] | None = None) -> None:
+    """Applies the cleaning rules again to consolidated files, in place, without
+    tabulating anything again. The athlete tables of years consolidated with
+    split_athletes, and their inline attributes, are recleaned along with them. All
+    consolidated years are recleaned by default."""
+    fs, root = fsspec.url_to_fs(data_dir)
+    if years is None:
+        urls = fs.glob(fs.sep.join([root, "boards", "consolidated", "*.parquet"]))
+    else:
+        urls = [
+            fs.sep.join([root, "boards", "consolidated", f"{year}.parquet"])
+            for year in years
+        ]
+    for url in urls:
+        df = read_parquet(fs, url)
+        targets = [(url, df)]
+        if "competitorName" not in df.columns:
+            year = int(url.split(fs.sep)[-1].removesuffix(".parquet"))
+            path = athlete_path(fs, root, year)
+            targets.append((path, read_parquet(fs, path)))
+        for path, df in targets:
+            df = clean.reclean(df)
+            if INLINE_ATHLETE in df.columns:
+                inline = clean.reclean(df[INLINE_ATHLETE].struct.unnest())
+                df = df.with_columns(
+                    pl.when(pl.col(INLINE_ATHLETE).is_not_null())
+                    .then(inline.to_struct(INLINE_ATHLETE))
+                    .alias(INLINE_ATHLETE)
+                )
+            write_parquet(fs, path, df)
+            rprint(f"Recleaned {len(df):,} rows in {path}.")
+    return None
+
+
 def consolidate_controls(data_dir: str) -> pl.DataFrame | None:
     """Consolidates all contols files into a single DataFrame."""
     fs, url = fsspec.url_to_fs(data_dir)
@@ -0,0 +1,225 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import fsspec
+import polars as pl
+
+from . import manifest
+
+# Where derived frames are kept by default, relative to the working directory.
+DEFAULT_DIRECTORY = os.path.join(".xft-cache", "derived")
+
+# Bytes of derived frames kept before the least recently used are removed.
+DEFAULT_MAX_BYTES = 20 * 1024**3
+
+# Name of the file describing an artifact in its directory.
+ARTIFACT_FILE = "artifact.json"
+
+
+@dataclass
+class DerivedCounts:
+    # Results read from the cache instead of computed.
+    hits: int = 0
+    # Results computed and stored.
+    misses: int = 0
+    # Results removed to stay under the size limit.
+    evictions: int = 0
+
+
+class DerivedCache:
+    """A cache of frames derived from consolidated data, like filled boards or the
+    prepared Open and Games groups, on local disk. Each result is stored under a
+    hash of the function that makes it, including its source code and that of
+    every module of xft, which it calls into, and of params, which must hold
+    everything the result depends on: fingerprints of the input files or frames
+    (see data_fingerprint and frame_fingerprint) and the other arguments. A result
+    is only served again for identical inputs, so changing the consolidated files,
+    the arguments, or any code of xft means computing it again. Results can be
+    frames, or tuples, lists, and dicts with string keys of them, nested any way.
+    The least recently used are removed when the stored frames grow beyond
+    max_bytes."""
+
+    def __init__(
+        self,
+        directory: str | Path = DEFAULT_DIRECTORY,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.counts = DerivedCounts()
+        self._lock = threading.Lock()
+
+    def key(self, function: Callable, params: dict) -> str:
+        identity = {
+            "function": f"{function.__module__}.{function.__qualname__}",
+            "source": source_hash(function),
+            "package": package_hash(),
+            # Row hashes and file formats can change between versions.
+            "polars": pl.__version__,
+            "params": params,
+        }
+        encoded = json.dumps(identity, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, function: Callable, params: dict, compute: Callable[[], object]):
+        """Gives the result of compute, which applies function, from the cache if it
+        was stored for the same function and params, or computes and stores it."""
+        key = self.key(function, params)
+        path = self.directory / key
+        try:
+            result = self._read(path)
+        except (OSError, KeyError, json.JSONDecodeError):
+            pass
+        else:
+            with self._lock:
+                self.counts.hits += 1
+            return result
+        result = compute()
+        self._write(path, function, params, result)
+        with self._lock:
+            self.counts.misses += 1
+        self.evict(keep=key)
+        return result
+
+    def _read(self, path: Path):
+        description = json.loads((path / ARTIFACT_FILE).read_bytes())
+        # Artifacts are touched when used, so their modification times give the
+        # order of use for eviction.
+        os.utime(path / ARTIFACT_FILE)
+        return decode(path, description["structure"])
+
+    def _write(self, path: Path, function: Callable, params: dict, result) -> None:
+        # Everything is written to a temporary directory that is then renamed, so
+        # a partial artifact is never read.
+        temporary = self.directory / f".{path.name}.{uuid.uuid4().hex}"
+        temporary.mkdir()
+        try:
+            frames = []
+            structure = encode(result, frames)
+            for i, frame in enumerate(frames):
+                frame.write_parquet(temporary / f"{i}.parquet")
+            description = {
+                "function": f"{function.__module__}.{function.__qualname__}",
+                "params": params,
+                "stored": time.time(),
+                "structure": structure,
+            }
+            (temporary / ARTIFACT_FILE).write_text(json.dumps(description, default=str))
+            shutil.rmtree(path, ignore_errors=True)
+            try:
+                temporary.rename(path)
+            except OSError:
+                # Another process stored the same result first.
+                pass
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+        return None
+
+    def evict(self, keep: str | None = None) -> None:
+        """Removes the least recently used artifacts until the rest fit in
+        max_bytes, never removing the one named keep."""
+        artifacts = []
+        for path in self.directory.iterdir():
+            try:
+                used = (path / ARTIFACT_FILE).stat().st_mtime
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            size = sum(file.stat().st_size for file in path.iterdir())
+            artifacts.append((used, size, path))
+        total = sum(size for _, size, _ in artifacts)
+        for _, size, path in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+            if path.name == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.counts.evictions += 1
+        return None
+
+    def summary(self) -> str:
+        counts = self.counts
+        return (
+            f"derived cache: {counts.hits} hit(s), {counts.misses} miss(es), and "
+            f"{counts.evictions} eviction(s)"
+        )
+
+
+def source_hash(function: Callable) -> str:
+    """Identifies the code of a function, by its source when it can be found and by
+    its compiled code otherwise, like for functions defined interactively."""
+    try:
+        code = inspect.getsource(function).encode()
+    except (OSError, TypeError):
+        code = function.__code__.co_code
+    return hashlib.sha256(code).hexdigest()
+
+
+@functools.cache
+def package_hash() -> str:
+    """Identifies the code of every module of xft, which derived results depend on
+    through the functions that make them. It's computed once per process."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def encode(result, frames: list[pl.DataFrame]):
+    """Describes the structure of a result as json, collecting its frames."""
+    if isinstance(result, pl.DataFrame):
+        frames.append(result)
+        return {"frame": len(frames) - 1}
+    if isinstance(result, (tuple, list)):
+        kind = "tuple" if isinstance(result, tuple) else "list"
+        return {kind: [encode(item, frames) for item in result]}
+    if isinstance(result, dict) and all(isinstance(k, str) for k in result):
+        return {"dict": {k: encode(v, frames) for k, v in result.items()}}
+    raise TypeError(
+        "Derived results must be frames, or tuples, lists, and dicts with string "
+        f"keys of them, not {type(result)}."
+    )
+
+
+def decode(path: Path, structure: dict):
+    if "frame" in structure:
+        return pl.read_parquet(path / f"{structure['frame']}.parquet")
+    if "tuple" in structure:
+        return tuple(decode(path, item) for item in structure["tuple"])
+    if "list" in structure:
+        return [decode(path, item) for item in structure["list"]]
+    return {k: decode(path, v) for k, v in structure["dict"].items()}
+
+
+def data_fingerprint(data_dir: str) -> list:
+    """Identifies the consolidated and athlete files of an xft file system by their
+    names, sizes, and versions, which change whenever a file is written again."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    fingerprint = []
+    for table in ["consolidated", "athletes"]:
+        pattern = fs.sep.join([url, "boards", table, "*.parquet"])
+        for path, info in sorted(fs.glob(pattern, detail=True).items()):
+            name = fs.sep.join(path.split(fs.sep)[-2:])
+            fingerprint.append([name, info["size"], *manifest.file_versions(info)])
+    return fingerprint
+
+
+def frame_fingerprint(df: pl.DataFrame) -> str:
+    """Identifies the contents of a frame, including its column names, types, and
+    the order of its rows."""
+    digest = hashlib.sha256(str(df.schema).encode())
+    digest.update(df.hash_rows(seed=0).to_numpy().tobytes())
+    return digest.hexdigest()
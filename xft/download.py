@@ -1,66 +1,206 @@
-import itertools
+import asyncio
+from contextlib import nullcontext
+import aiohttp
 import fsspec
-from urllib.error import HTTPError
-from rich.progress import track
-from time import sleep
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from urllib.error import HTTPError, URLError
+from rich.progress import Progress, track
 from dataclasses import dataclass, field
+from typing import Generator
 import warnings
 import logging
 import numpy as np
+import polars as pl
 
-from . import fetch, tabulate, misc
-
-DEFAULT_SLEEP_TIME = 0.01
+from . import fetch, tabulate, misc, ratelimit
+from .archive import ArchiveWriter, archive_line, archive_subdir, check_codec
+from .httpcache import DEFAULT_MAX_BYTES, DEFAULT_TTL, HttpCache
+from .manifest import Manifest, PageWriter, load_manifest
+from .ratelimit import RateLimiter
 
 DEFAULT_MAX_PAGE = 1_000
 
+DEFAULT_MAX_IN_FLIGHT = 8
+
+DOWNLOAD_MODES = ("serial", "async", "pipelined")
+
+# Pages fetched but not yet written, in pipelined mode, beyond which fetching waits.
+DEFAULT_QUEUE_SIZE = 64
+
+# Pages written between saves of a division's manifest.
+MANIFEST_SAVE_INTERVAL = 100
+
 
 def write_parquet(fs, output_path, df) -> None:
-    with fs.open(output_path, "wb") as f, warnings.catch_warnings():
+    """Writes a table to a parquet file atomically, as described by
+    misc.atomic_open, so that a crash never leaves a partial file behind."""
+    with misc.atomic_open(fs, output_path) as f, warnings.catch_warnings():
         # Polars warns about using a file object instead of a path/string.
         warnings.filterwarnings("ignore", category=UserWarning)
         df.write_parquet(f)
     return None
 
 
-def fetch_and_sleep(
-    competition: str,
-    year: int,
-    division: int,
-    page: int,
-    sleep_time: float = DEFAULT_SLEEP_TIME,
+def fetch_with_retries(
+    url: str,
+    description: str,
+    limiter: RateLimiter,
+    *,
+    max_tries: int = 10,
+    ignore_failures: bool = False,
+    logger: logging.Logger | None = None,
+    raw: bool = False,
+) -> dict | bytes | None:
+    """Requests a url when the shared rate limiter allows it, retrying failures.
+    Throttling responses slow down every worker sharing the limiter. With raw set,
+    the body of the response is returned without decoding it."""
+    # Fresh cached responses need no request, so they don't wait for the limiter.
+    cached = fetch.cache_lookup(url)
+    contents = fetch.fresh_body(cached)
+    if contents is not None:
+        return contents if raw else fetch.decode_json(contents)
+    tries = 0
+    while True:
+        limiter.acquire()
+        try:
+            contents = fetch.request_bytes(url, cached)
+        except HTTPError as error:
+            handle_failure(
+                limiter,
+                description,
+                error.code,
+                error.headers.get("Retry-After"),
+                logger,
+            )
+        except (URLError, TimeoutError, ConnectionError):
+            # Dropped connections and timeouts are treated like overload.
+            handle_failure(limiter, description, None, None, logger)
+        else:
+            limiter.succeeded()
+            return contents if raw else fetch.decode_json(contents)
+        tries += 1
+        if tries > max_tries:
+            return give_up(description, max_tries, ignore_failures, logger)
+        limiter.retried()
+
+
+async def fetch_with_retries_async(
+    session: aiohttp.ClientSession,
+    url: str,
+    description: str,
+    limiter: RateLimiter,
+    *,
     max_tries: int = 10,
     ignore_failures: bool = False,
     logger: logging.Logger | None = None,
 ) -> dict | None:
+    """The asynchronous counterpart of fetch_with_retries, using a shared session."""
+    cached = await fetch.cache_lookup_async(url)
+    contents = fetch.fresh_body(cached)
+    if contents is not None:
+        return fetch.decode_json(contents)
     tries = 0
-    done = False
-    while not done:
+    while True:
+        await limiter.acquire_async()
         try:
-            board = fetch.fetch_leaderboard(competition, year, division, page)
-        except HTTPError:
-            sleep_time *= 2
-            if logger is not None:
-                logger.warning(
-                    f"Leaderboard request failed for {competition=}, {year=}, {division=}, {page=}. Temporarily increasing sleep time to {sleep_time} seconds."
-                )
+            contents = await fetch.request_async(session, url, cached)
+        except aiohttp.ClientResponseError as error:
+            retry_after = (
+                None if error.headers is None else error.headers.get("Retry-After")
+            )
+            handle_failure(limiter, description, error.status, retry_after, logger)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Dropped connections and timeouts are treated like overload.
+            handle_failure(limiter, description, None, None, logger)
         else:
-            done = True
+            limiter.succeeded()
+            return contents
         tries += 1
         if tries > max_tries:
-            if ignore_failures:
-                if logger is not None:
-                    logger.warning(
-                        f"Could not download the target information. Ignoring because {ignore_failures=}."
-                    )
-                return None
-            else:
-                raise Exception(
-                    f"Failed to request board for {competition=}, {year=}, {division=}, {page=} after {max_tries} attempts."
-                )
-        sleep(sleep_time)
+            return give_up(description, max_tries, ignore_failures, logger)
+        limiter.retried()
+
+
+def handle_failure(
+    limiter: RateLimiter,
+    description: str,
+    status: int | None,
+    retry_after: str | None,
+    logger: logging.Logger | None,
+) -> None:
+    if status is None or status in ratelimit.THROTTLE_STATUSES:
+        limiter.throttled(ratelimit.parse_retry_after(retry_after))
+    if logger is not None:
+        logger.warning(
+            f"Request failed for {description} with {status=}. The shared request rate is now {limiter.rate:.2f}/s."
+        )
+    return None
+
+
+def give_up(
+    description: str,
+    max_tries: int,
+    ignore_failures: bool,
+    logger: logging.Logger | None,
+) -> None:
+    if ignore_failures:
+        if logger is not None:
+            logger.warning(
+                f"Could not download the target information. Ignoring because {ignore_failures=}."
+            )
+        return None
+    else:
+        raise Exception(f"Failed to request {description} after {max_tries} attempts.")
+
+
+def fetch_and_sleep(
+    competition: str,
+    year: int,
+    division: int,
+    page: int,
+    max_tries: int = 10,
+    ignore_failures: bool = False,
+    logger: logging.Logger | None = None,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+) -> dict | None:
+    """Requests a leaderboard page, waiting as long as the rate limiter requires."""
+    return fetch_with_retries(
+        fetch.make_leaderboard_url(competition, year, division, page, root),
+        f"board {competition=}, {year=}, {division=}, {page=}",
+        RateLimiter() if limiter is None else limiter,
+        max_tries=max_tries,
+        ignore_failures=ignore_failures,
+        logger=logger,
+    )
 
-    return board
+
+async def fetch_and_sleep_async(
+    session: aiohttp.ClientSession,
+    competition: str,
+    year: int,
+    division: int,
+    page: int,
+    max_tries: int = 10,
+    ignore_failures: bool = False,
+    logger: logging.Logger | None = None,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+) -> dict | None:
+    """The asynchronous counterpart of fetch_and_sleep, using a shared session."""
+    return await fetch_with_retries_async(
+        session,
+        fetch.make_leaderboard_url(competition, year, division, page, root),
+        f"board {competition=}, {year=}, {division=}, {page=}",
+        RateLimiter() if limiter is None else limiter,
+        max_tries=max_tries,
+        ignore_failures=ignore_failures,
+        logger=logger,
+    )
 
 
 def board_has_rows(board: dict) -> bool:
@@ -69,42 +209,48 @@ def board_has_rows(board: dict) -> bool:
     return False
 
 
-def page_exists(competition: str, year: int, division: int, page: int) -> bool:
+def page_exists(
+    competition: str,
+    year: int,
+    division: int,
+    page: int,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+) -> bool:
     board = fetch_and_sleep(
-        competition, year, division, page, max_tries=2, ignore_failures=True
+        competition,
+        year,
+        division,
+        page,
+        max_tries=2,
+        ignore_failures=True,
+        root=root,
+        limiter=limiter,
     )
     if board is not None and board_has_rows(board):
         return True
     return False
 
 
-def find_last_page(
-    competition: str, year: int, division: int, min_page: int, max_page: int
-) -> int:
-    if max_page <= min_page:
-        raise ValueError(
-            f"The maximum page must be greater than the minimum page but got {max_page=} and {min_page=}."
-        )
-
+def bisect_last_page(min_page: int, max_page: int) -> Generator[int, bool, int]:
+    """The original bisection search for the last page, written as a generator that
+    yields pages to check, receives whether each has rows, and returns the last
+    page. It is kept for counting the requests that galloping saves."""
     # Set the initial page numbers for a bisection search.
     page_lo = min_page
     page_mi = (max_page + min_page) // 2
     page_hi = max_page
 
-    # A convenience closure for checking pages
-    def check_page(page):
-        return page_exists(competition, year, division, page)
-
     # There should be a valid response for the first page, otherwise there's no data.
-    exists_lo = check_page(page_lo)
+    exists_lo = yield page_lo
 
     if not exists_lo:
         # Returning zero indicates that no pages are valid.
         return 0
 
     # Set the initial response flags for the middle and high pages.
-    exists_mi = check_page(page_mi)
-    exists_hi = check_page(page_hi)
+    exists_mi = yield page_mi
+    exists_hi = yield page_hi
 
     # If the maximum page number is valid, that's the answer.
     if exists_hi:
@@ -114,12 +260,12 @@ def find_last_page(
     while page_hi - page_lo > 2:
         if exists_mi:
             page_lo = page_mi
-            exists_lo = check_page(page_lo)
+            exists_lo = yield page_lo
         else:
             page_hi = page_mi
-            exists_hi = check_page(page_hi)
+            exists_hi = yield page_hi
         page_mi = (page_hi + page_lo) // 2
-        exists_mi = check_page(page_mi)
+        exists_mi = yield page_mi
 
     if exists_mi:
         return page_mi
@@ -127,6 +273,245 @@ def find_last_page(
         return page_lo
 
 
+def gallop_last_page(
+    min_page: int, max_page: int, start: int | None = None
+) -> Generator[int, bool, int]:
+    """Searches for the last page by probing exponentially larger steps upward from
+    a starting guess (like the number of pages already downloaded), then bisecting
+    the final step. Yields pages to check, receives whether each has rows, and
+    returns the last page, or zero if there are none."""
+    if not (yield min_page):
+        return 0
+    page_lo = min_page
+    # Pages are probed at start, start + 1, start + 3, start + 7, ...
+    page_hi = min_page + 1 if start is None else min(max(start, min_page + 1), max_page)
+    step = 1
+    while page_hi > page_lo:
+        if not (yield page_hi):
+            break
+        page_lo = page_hi
+        page_hi = min(page_lo + step, max_page)
+        step *= 2
+    else:
+        # The cap was reached with data on every probed page.
+        return page_lo
+    # Bisect between the last page with rows and the first page without.
+    while page_hi - page_lo > 1:
+        page_mi = (page_hi + page_lo) // 2
+        if (yield page_mi):
+            page_lo = page_mi
+        else:
+            page_hi = page_mi
+    return page_lo
+
+
+def count_search_requests(search: Generator[int, bool, int], last_page: int) -> int:
+    """Counts the pages a search would check for a board whose last page is known."""
+    requests = 0
+    try:
+        page = next(search)
+        while True:
+            requests += 1
+            page = search.send(1 <= page <= last_page)
+    except StopIteration:
+        pass
+    return requests
+
+
+def total_pages(board: dict) -> int | None:
+    """Reads the total page count from a board's pagination metadata, if present."""
+    try:
+        total = int(board["pagination"]["totalPages"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return total
+
+
+@dataclass
+class Discovery:
+    # The last page with rows, or zero if there are none.
+    last_page: int = 0
+    # Whether the last page has been found.
+    complete: bool = False
+    # Boards with rows fetched while probing, by page number, so that they can be
+    # written without fetching them again.
+    boards: dict[int, dict] = field(default_factory=dict)
+    # The number of requests made while probing.
+    requests: int = 0
+
+    def record(self, page: int, board: dict | None, max_page: int) -> bool:
+        """Stores a probed board and returns whether it had rows. If the board gives
+        the total page count, the search is complete."""
+        self.requests += 1
+        if board is None or not board_has_rows(board):
+            return False
+        self.boards[page] = board
+        total = total_pages(board)
+        if total is not None and total >= page:
+            self.last_page = min(total, max_page)
+            self.complete = True
+        return True
+
+
+def check_page_range(min_page: int, max_page: int) -> None:
+    if max_page <= min_page:
+        raise ValueError(
+            f"The maximum page must be greater than the minimum page but got {max_page=} and {min_page=}."
+        )
+    return None
+
+
+def discover_last_page(
+    competition: str,
+    year: int,
+    division: int,
+    min_page: int,
+    max_page: int,
+    *,
+    start: int | None = None,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+) -> Discovery:
+    """Finds the last page of a leaderboard, keeping every probed board. The search
+    stops as soon as a board reports the total page count."""
+    check_page_range(min_page, max_page)
+    discovery = Discovery()
+    search = gallop_last_page(min_page, max_page, start)
+    try:
+        page = next(search)
+        while True:
+            board = fetch_and_sleep(
+                competition,
+                year,
+                division,
+                page,
+                max_tries=2,
+                ignore_failures=True,
+                root=root,
+                limiter=limiter,
+            )
+            exists = discovery.record(page, board, max_page)
+            if discovery.complete:
+                return discovery
+            page = search.send(exists)
+    except StopIteration as stop:
+        discovery.last_page = stop.value
+        discovery.complete = True
+    return discovery
+
+
+async def discover_last_page_async(
+    session: aiohttp.ClientSession,
+    competition: str,
+    year: int,
+    division: int,
+    min_page: int,
+    max_page: int,
+    *,
+    start: int | None = None,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+) -> Discovery:
+    """The asynchronous counterpart of discover_last_page."""
+    check_page_range(min_page, max_page)
+    discovery = Discovery()
+    search = gallop_last_page(min_page, max_page, start)
+    try:
+        page = next(search)
+        while True:
+            board = await fetch_and_sleep_async(
+                session,
+                competition,
+                year,
+                division,
+                page,
+                max_tries=2,
+                ignore_failures=True,
+                root=root,
+                limiter=limiter,
+            )
+            exists = discovery.record(page, board, max_page)
+            if discovery.complete:
+                return discovery
+            page = search.send(exists)
+    except StopIteration as stop:
+        discovery.last_page = stop.value
+        discovery.complete = True
+    return discovery
+
+
+async def gather_or_cancel(*coroutines) -> list:
+    """Runs coroutines concurrently and gives their results in order, like
+    asyncio.gather, except that when one raises, the rest are cancelled instead of
+    running on and sending requests. The first exception is raised as it is."""
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Cancelled tasks get to unwind, closing their responses, before returning.
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def discover_last_pages_async(
+    competition: str,
+    year: int,
+    starts: dict[int, int | None],
+    min_page: int,
+    max_page: int,
+    *,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+) -> dict[int, Discovery]:
+    """Discovers the last pages of many divisions concurrently. The starting guess
+    for each division is given by the starts dictionary."""
+    connector = aiohttp.TCPConnector(limit_per_host=max_in_flight)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        discoveries = await gather_or_cancel(
+            *(
+                discover_last_page_async(
+                    session,
+                    competition,
+                    year,
+                    division,
+                    min_page,
+                    max_page,
+                    start=start,
+                    root=root,
+                    limiter=limiter,
+                )
+                for division, start in starts.items()
+            )
+        )
+    return dict(zip(starts, discoveries))
+
+
+def find_last_page(
+    competition: str,
+    year: int,
+    division: int,
+    min_page: int,
+    max_page: int,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+) -> int:
+    return discover_last_page(
+        competition, year, division, min_page, max_page, root=root, limiter=limiter
+    ).last_page
+
+
+def downloaded_last_page(manifest: Manifest) -> int | None:
+    """Returns the last page found by an earlier download or, failing that, the
+    highest page number already written, which is a good starting guess for the
+    last page."""
+    if manifest.last_page:
+        return manifest.last_page
+    return max(manifest.pages, default=None)
+
+
 def check_competition_years(competition: str, years: list[int]) -> None:
     if competition not in ("games", "open"):
         raise ValueError(
@@ -143,6 +528,382 @@ def check_competition_years(competition: str, years: list[int]) -> None:
     return None
 
 
+def download_pages(
+    fs,
+    output_subdir: str,
+    competition: str,
+    year: int,
+    division: int,
+    min_page: int,
+    last_page: int,
+    *,
+    force: bool = False,
+    ignore_failures: bool = False,
+    logger: logging.Logger | None = None,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+    boards: dict[int, dict] | None = None,
+    manifest: Manifest | None = None,
+    chunk_pages: int | None = None,
+    chunk_bytes: int | None = None,
+    archive: ArchiveWriter | None = None,
+) -> tuple[int, int, int]:
+    """Downloads, tabulates, and writes pages one at a time. Boards that were already
+    fetched (while finding the last page) are taken out of the boards dictionary
+    instead of being fetched again. Pages listed in the division's manifest are
+    skipped without touching the file system, and the manifest is updated as pages
+    are written. Pages are packed into chunk files as described by PageWriter. If
+    an archive is given, the raw json of every downloaded board is kept in it.
+    Returns the number of pages downloaded, skipped, and failed."""
+    if boards is None:
+        boards = {}
+    if manifest is None:
+        manifest = load_manifest(fs, output_subdir)
+    writer = PageWriter(
+        fs, output_subdir, manifest, chunk_pages=chunk_pages, chunk_bytes=chunk_bytes
+    )
+    writer.set_last_page(last_page)
+    down = 0
+    skip = 0
+    fail = 0
+    try:
+        for page in track(range(min_page, last_page + 1), description="Downloading..."):
+            # Only write a file if it's absent or we should overwrite.
+            if force or page not in manifest.pages:
+                # Download the table as json and parse it into a dictionary
+                board = boards.pop(page, None)
+                if board is None:
+                    board = fetch_and_sleep(
+                        competition,
+                        year,
+                        division,
+                        page,
+                        ignore_failures=ignore_failures,
+                        logger=logger,
+                        root=root,
+                        limiter=limiter,
+                    )
+                if board is not None:
+                    if archive is not None:
+                        archive.write(page, board)
+                    # Arrange relevant information into a polars DataFrame
+                    table = tabulate.tabulate_leaderboard(board)
+                    writer.write(page, table)
+                    # Increment the download counter
+                    down += 1
+                    if down % MANIFEST_SAVE_INTERVAL == 0:
+                        writer.save()
+                else:
+                    fail += 1
+            else:
+                # Increment the skip counter
+                skip += 1
+    finally:
+        # Keep track of whatever was written, even if the download stops early.
+        writer.close()
+        if archive is not None:
+            archive.close()
+    return down, skip, fail
+
+
+async def download_pages_async(
+    fs,
+    output_subdir: str,
+    competition: str,
+    year: int,
+    division: int,
+    min_page: int,
+    last_page: int,
+    *,
+    force: bool = False,
+    ignore_failures: bool = False,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    logger: logging.Logger | None = None,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+    boards: dict[int, dict] | None = None,
+    manifest: Manifest | None = None,
+    chunk_pages: int | None = None,
+    chunk_bytes: int | None = None,
+    archive: ArchiveWriter | None = None,
+) -> tuple[int, int, int]:
+    """Downloads, tabulates, and writes pages with up to max_in_flight requests
+    outstanding at once, over a pool of keep-alive connections. Pages are written
+    as soon as they arrive, in whatever order they complete. Boards that were
+    already fetched, the manifest, chunking, and the archive work as in
+    download_pages. Returns the
+    number of pages downloaded, skipped, and failed."""
+    if boards is None:
+        boards = {}
+    if manifest is None:
+        manifest = await asyncio.to_thread(load_manifest, fs, output_subdir)
+    writer = PageWriter(
+        fs, output_subdir, manifest, chunk_pages=chunk_pages, chunk_bytes=chunk_bytes
+    )
+    await asyncio.to_thread(writer.set_last_page, last_page)
+    counts = {"down": 0, "skip": 0, "fail": 0}
+    # Workers share one iterator, which is safe because they all run on one thread.
+    pages = iter(range(min_page, last_page + 1))
+    connector = aiohttp.TCPConnector(limit_per_host=max_in_flight)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async def worker(session, progress, task):
+        for page in pages:
+            if force or page not in manifest.pages:
+                board = boards.pop(page, None)
+                if board is None:
+                    board = await fetch_and_sleep_async(
+                        session,
+                        competition,
+                        year,
+                        division,
+                        page,
+                        ignore_failures=ignore_failures,
+                        logger=logger,
+                        root=root,
+                        limiter=limiter,
+                    )
+                if board is not None:
+                    # Tabulation and file system calls block, so they run in
+                    # threads to keep other requests moving.
+                    if archive is not None:
+                        await asyncio.to_thread(archive.write, page, board)
+                    table = await asyncio.to_thread(
+                        tabulate.tabulate_leaderboard, board
+                    )
+                    await asyncio.to_thread(writer.write, page, table)
+                    counts["down"] += 1
+                    if counts["down"] % MANIFEST_SAVE_INTERVAL == 0:
+                        await asyncio.to_thread(writer.save)
+                else:
+                    counts["fail"] += 1
+            else:
+                counts["skip"] += 1
+            progress.advance(task)
+
+    try:
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            with Progress() as progress:
+                task = progress.add_task(
+                    "Downloading...", total=last_page - min_page + 1
+                )
+                await gather_or_cancel(
+                    *(worker(session, progress, task) for _ in range(max_in_flight))
+                )
+    finally:
+        writer.close()
+        if archive is not None:
+            archive.close()
+
+    return counts["down"], counts["skip"], counts["fail"]
+
+
+def decode_and_tabulate(
+    page: int, contents: bytes | dict, archive: bool
+) -> tuple[pl.DataFrame, bytes | None, float]:
+    """Decodes a response body, if it isn't a board already, and tabulates it. This
+    runs in worker processes. Returns the table, the board's archive line if asked
+    for, and the seconds spent."""
+    start = perf_counter()
+    board = fetch.decode_json(contents) if isinstance(contents, bytes) else contents
+    table = tabulate.tabulate_leaderboard(board)
+    line = archive_line(page, board) if archive else None
+    return table, line, perf_counter() - start
+
+
+@dataclass
+class StageMetrics:
+    # Pages that went through the stage.
+    pages: int = 0
+    # Seconds spent working, summed over the stage's threads or processes.
+    busy: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.pages += 1
+        self.busy += seconds
+        return None
+
+    def summary(self, name: str, elapsed: float) -> str:
+        rate = self.pages / self.busy if self.busy > 0 else float("nan")
+        return (
+            f"{name} {self.pages} page(s), {self.pages / elapsed:.1f}/s overall "
+            f"and {rate:.1f}/s per busy worker"
+        )
+
+
+@dataclass
+class PipelineMetrics:
+    fetch: StageMetrics = field(default_factory=StageMetrics)
+    tabulate: StageMetrics = field(default_factory=StageMetrics)
+    write: StageMetrics = field(default_factory=StageMetrics)
+    # Sum and maximum of the tabulation queue's depth, sampled whenever a page is
+    # added to it.
+    depth_total: int = 0
+    depth_max: int = 0
+    depth_samples: int = 0
+
+    def sample_depth(self, depth: int) -> None:
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.depth_samples += 1
+        return None
+
+    def summary(self, elapsed: float, queue_size: int) -> str:
+        mean = self.depth_total / max(self.depth_samples, 1)
+        stages = "; ".join(
+            getattr(self, name).summary(name, elapsed)
+            for name in ("fetch", "tabulate", "write")
+        )
+        return (
+            f"Pipeline ran for {elapsed:.1f} s: {stages}. The queue held "
+            f"{mean:.1f} page(s) on average and {self.depth_max} at most, of {queue_size}."
+        )
+
+
+def download_pages_pipelined(
+    fs,
+    output_subdir: str,
+    competition: str,
+    year: int,
+    division: int,
+    min_page: int,
+    last_page: int,
+    *,
+    executor: ProcessPoolExecutor,
+    force: bool = False,
+    ignore_failures: bool = False,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    logger: logging.Logger | None = None,
+    root: str = fetch.LEADERBOARD_ROOT,
+    limiter: RateLimiter | None = None,
+    boards: dict[int, dict] | None = None,
+    manifest: Manifest | None = None,
+    chunk_pages: int | None = None,
+    chunk_bytes: int | None = None,
+    archive: ArchiveWriter | None = None,
+) -> tuple[int, int, int]:
+    """Downloads pages in three stages that run at the same time: max_in_flight
+    threads fetch response bodies, the executor's worker processes decode and
+    tabulate them, and this thread writes the tables. The stages are joined by a
+    queue of at most queue_size pages, so fetching waits when tabulation or writing
+    falls behind instead of holding every board in memory. Everything else works as
+    in download_pages. Returns the number of pages downloaded, skipped, and
+    failed."""
+    if boards is None:
+        boards = {}
+    if manifest is None:
+        manifest = load_manifest(fs, output_subdir)
+    if limiter is None:
+        limiter = RateLimiter()
+    writer = PageWriter(
+        fs, output_subdir, manifest, chunk_pages=chunk_pages, chunk_bytes=chunk_bytes
+    )
+    writer.set_last_page(last_page)
+    counts = {"down": 0, "skip": 0, "fail": 0}
+    metrics = PipelineMetrics()
+    tabulated = queue.Queue(maxsize=queue_size)
+    # Fetchers share one iterator, so it is guarded by a lock, like the counts.
+    pages = iter(range(min_page, last_page + 1))
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Waits for room in the queue, unless the writer has stopped.
+        while not stop.is_set():
+            try:
+                tabulated.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetcher(progress, task) -> None:
+        try:
+            while not stop.is_set():
+                with lock:
+                    page = next(pages, None)
+                if page is None:
+                    return None
+                if not force and page in manifest.pages:
+                    with lock:
+                        counts["skip"] += 1
+                    progress.advance(task)
+                    continue
+                contents = boards.pop(page, None)
+                if contents is None:
+                    start = perf_counter()
+                    contents = fetch_with_retries(
+                        fetch.make_leaderboard_url(
+                            competition, year, division, page, root
+                        ),
+                        f"board {competition=}, {year=}, {division=}, {page=}",
+                        limiter,
+                        ignore_failures=ignore_failures,
+                        logger=logger,
+                        raw=True,
+                    )
+                    with lock:
+                        metrics.fetch.add(perf_counter() - start)
+                if contents is None:
+                    with lock:
+                        counts["fail"] += 1
+                    progress.advance(task)
+                    continue
+                future = executor.submit(
+                    decode_and_tabulate, page, contents, archive is not None
+                )
+                with lock:
+                    metrics.sample_depth(tabulated.qsize())
+                if not put((page, future)):
+                    return None
+        finally:
+            # Tell the writer that this fetcher is done.
+            put(None)
+
+    try:
+        with Progress() as progress, ThreadPoolExecutor(max_in_flight) as threads:
+            task = progress.add_task("Downloading...", total=last_page - min_page + 1)
+            start = perf_counter()
+            fetchers = [
+                threads.submit(fetcher, progress, task) for _ in range(max_in_flight)
+            ]
+            try:
+                finished = 0
+                while finished < len(fetchers):
+                    item = tabulated.get()
+                    if item is None:
+                        finished += 1
+                        continue
+                    page, future = item
+                    table, line, seconds = future.result()
+                    metrics.tabulate.add(seconds)
+                    write_start = perf_counter()
+                    if line is not None:
+                        archive.write_line(page, line)
+                    writer.write(page, table)
+                    metrics.write.add(perf_counter() - write_start)
+                    counts["down"] += 1
+                    if counts["down"] % MANIFEST_SAVE_INTERVAL == 0:
+                        writer.save()
+                    progress.advance(task)
+            finally:
+                stop.set()
+            # Raise any error from the fetchers.
+            for fetcher_future in fetchers:
+                fetcher_future.result()
+        if logger is not None:
+            logger.info(metrics.summary(perf_counter() - start, queue_size))
+    finally:
+        writer.close()
+        if archive is not None:
+            archive.close()
+
+    return counts["down"], counts["skip"], counts["fail"]
+
+
 def download_boards(
     output_directory: str,
     competition: str,
@@ -153,6 +914,19 @@ def download_boards(
     max_page: int = DEFAULT_MAX_PAGE,
     force: bool = False,
     ignore_failures: bool = False,
+    mode: str = "serial",
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    api_root: str = fetch.LEADERBOARD_ROOT,
+    rate: float = ratelimit.DEFAULT_RATE,
+    max_rate: float = ratelimit.DEFAULT_MAX_RATE,
+    chunk_pages: int | None = None,
+    chunk_bytes: int | None = None,
+    archive: str | None = None,
+    workers: int | None = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    http_cache: str | None = None,
+    http_cache_ttl: float | None = DEFAULT_TTL,
+    http_cache_bytes: int = DEFAULT_MAX_BYTES,
 ) -> None:
     logger = misc.initialize_logger(
         __name__, filename=f"download_boards_{competition}.log"
@@ -177,66 +951,193 @@ def download_boards(
         raise ValueError(
             f"The highest division number is 39 but got {np.max(divisions)}."
         )
+    if mode not in DOWNLOAD_MODES:
+        raise ValueError(
+            f"The download mode must be one of {DOWNLOAD_MODES} but got '{mode}'."
+        )
+    if max_in_flight < 1:
+        raise ValueError(
+            f"At least one request must be allowed in flight but got {max_in_flight=}."
+        )
+    if chunk_pages is not None and chunk_pages < 1:
+        raise ValueError(f"Chunks must hold at least one page but got {chunk_pages=}.")
+    if queue_size < 1:
+        raise ValueError(
+            f"The queue must hold at least one page but got {queue_size=}."
+        )
+    if archive is not None:
+        check_codec(archive)
 
     # Make an output path and, if needed, make the directory.
     fs, _ = fsspec.url_to_fs(output_directory)
+    archive_directory = output_directory
     output_directory = fs.sep.join([output_directory, "boards", competition])
     fs.makedirs(output_directory, exist_ok=True)
 
-    for year, division in itertools.product(years, divisions):
-        logger.info("--------")
-        logger.info(f"Starting {competition=}, {year=}, {division=}.")
-        # Get the last valid page for this year and division.
-        logger.info(
-            f"Finding the final page of the leaderboard with a minimum of {min_page} and a cap of {max_page}."
-        )
-        last_page = find_last_page(competition, year, division, min_page, max_page)
-        if last_page == 0:
-            logger.info(
-                f"There are no pages to download for page numbers in [{min_page},{max_page}]."
-            )
-        else:
-            logger.info(f"The last page with data is number {last_page}.")
-            # Download, tabulate, and store the pages as compressed tables.
-            output_subdir = fs.sep.join(
-                [output_directory, str(year), f"division-{division:02}"]
-            )
-            fs.makedirs(output_subdir, exist_ok=True)
-            down = 0
-            fail = 0
-            skip = 0
+    # One limiter for the whole run, so the rate learned from the server carries
+    # across pages, divisions, and years.
+    limiter = RateLimiter(rate, max_rate=max_rate)
+
+    # Tallies of requests spent on and saved by finding last pages.
+    probes = 0
+    saved = 0
+
+    # Worker processes for pipelined mode are started once and shared by every
+    # division.
+    pool = misc.process_pool(workers) if mode == "pipelined" else nullcontext()
+
+    # Responses are cached on disk if a directory is given.
+    cache = (
+        None
+        if http_cache is None
+        else HttpCache(http_cache, http_cache_ttl, http_cache_bytes)
+    )
+
+    with pool as executor, fetch.use_cache(cache):
+        for year in years:
+            logger.info("--------")
             logger.info(
-                f"Downloading {'' if force else 'or skipping '}pages {min_page} to {last_page}."
+                f"Finding the final pages of {len(divisions)} division(s) for {competition=}, {year=}, with a minimum of {min_page} and a cap of {max_page}."
             )
-            for page in track(
-                range(min_page, last_page + 1), description="Downloading..."
-            ):
-                output_path = fs.sep.join([output_subdir, f"{page:06}.parquet"])
-                # Only write a file if it's absent or we should overwrite.
-                if force or not fs.isfile(output_path):
-                    # Download the table as json and parse it into a dictionary
-                    board = fetch_and_sleep(
+            # Searches start from the pages already present, if any.
+            output_subdirs = {
+                division: fs.sep.join(
+                    [output_directory, str(year), f"division-{division:02}"]
+                )
+                for division in divisions
+            }
+            # Each division's manifest says which pages are already present, without
+            # listing or checking any files.
+            manifests = {
+                division: load_manifest(fs, output_subdir)
+                for division, output_subdir in output_subdirs.items()
+            }
+            starts = {
+                division: downloaded_last_page(manifest)
+                for division, manifest in manifests.items()
+            }
+            # Pipelined downloads find last pages concurrently too.
+            if mode in ("async", "pipelined"):
+                discoveries = asyncio.run(
+                    discover_last_pages_async(
+                        competition,
+                        year,
+                        starts,
+                        min_page,
+                        max_page,
+                        max_in_flight=max_in_flight,
+                        root=api_root,
+                        limiter=limiter,
+                    )
+                )
+            else:
+                discoveries = {
+                    division: discover_last_page(
                         competition,
                         year,
                         division,
-                        page,
-                        ignore_failures=ignore_failures,
-                        logger=logger,
+                        min_page,
+                        max_page,
+                        start=start,
+                        root=api_root,
+                        limiter=limiter,
+                    )
+                    for division, start in starts.items()
+                }
+            logger.info(limiter.summary(limiter.reset_counts()))
+
+            for division in divisions:
+                discovery = discoveries[division]
+                last_page = discovery.last_page
+                probes += discovery.requests
+                # The original bisection would have made this many requests.
+                saved += count_search_requests(
+                    bisect_last_page(min_page, max_page), last_page
+                )
+                saved -= discovery.requests
+                logger.info("--------")
+                logger.info(f"Starting {competition=}, {year=}, {division=}.")
+                if last_page == 0:
+                    logger.info(
+                        f"There are no pages to download for page numbers in [{min_page},{max_page}]."
+                    )
+                    continue
+                logger.info(
+                    f"The last page with data is number {last_page}, found with {discovery.requests} request(s)."
+                )
+                # Download, tabulate, and store the pages as compressed tables.
+                output_subdir = output_subdirs[division]
+                fs.makedirs(output_subdir, exist_ok=True)
+                logger.info(
+                    f"Downloading {'' if force else 'or skipping '}pages {min_page} to {last_page}."
+                )
+                args = (
+                    fs,
+                    output_subdir,
+                    competition,
+                    year,
+                    division,
+                    min_page,
+                    last_page,
+                )
+                kwargs = dict(
+                    force=force,
+                    ignore_failures=ignore_failures,
+                    logger=logger,
+                    root=api_root,
+                    limiter=limiter,
+                    boards=discovery.boards,
+                    manifest=manifests[division],
+                    chunk_pages=chunk_pages,
+                    chunk_bytes=chunk_bytes,
+                    archive=(
+                        None
+                        if archive is None
+                        else ArchiveWriter(
+                            fs,
+                            archive_subdir(
+                                fs, archive_directory, competition, year, division
+                            ),
+                            archive,
+                        )
+                    ),
+                )
+                fetched = len(discovery.boards)
+                if mode == "async":
+                    logger.info(f"Keeping up to {max_in_flight} requests in flight.")
+                    down, skip, fail = asyncio.run(
+                        download_pages_async(
+                            *args, max_in_flight=max_in_flight, **kwargs
+                        )
+                    )
+                elif mode == "pipelined":
+                    logger.info(
+                        f"Fetching with {max_in_flight} threads and tabulating with {workers or os.cpu_count()} processes."
+                    )
+                    down, skip, fail = download_pages_pipelined(
+                        *args,
+                        executor=executor,
+                        max_in_flight=max_in_flight,
+                        queue_size=queue_size,
+                        **kwargs,
                     )
-                    if board is not None:
-                        # Arrange relevant information into a polars DataFrame
-                        table = tabulate.tabulate_leaderboard(board)
-                        write_parquet(fs, output_path, table)
-                        # Increment the download counter
-                        down += 1
-                    else:
-                        fail += 1
                 else:
-                    # Increment the skip counter
-                    skip += 1
-            logger.info(
-                f"Downloaded {down} page(s). Skipped {skip} page(s) that were already present. Ignored {fail} page(s) that failed to download."
-            )
+                    down, skip, fail = download_pages(*args, **kwargs)
+                reused = fetched - len(discovery.boards)
+                saved += reused
+                # Let go of any probed boards that were not needed.
+                discovery.boards.clear()
+                logger.info(
+                    f"Downloaded {down} page(s), {reused} of them reused from the last page search. Skipped {skip} page(s) that were already present. Ignored {fail} page(s) that failed to download."
+                )
+                logger.info(limiter.summary(limiter.reset_counts()))
+
+    logger.info("--------")
+    logger.info(
+        f"Finding last pages took {probes} request(s). Compared to bisection without reusing pages, {saved} request(s) were saved."
+    )
+    if cache is not None:
+        logger.info(cache.summary())
 
     return None
 
@@ -259,6 +1160,43 @@ class BoardsConfig:
     force: bool = False
     # Whether to ignore failed page downloads or raise an error.
     ignore_failures: bool = False
+    # How pages are downloaded, either "serial" (one at a time), "async" (many
+    # requests in flight at once), or "pipelined" (fetching threads feeding a pool of
+    # tabulating processes).
+    mode: str = "serial"
+    # The maximum number of page requests in flight at once, in async and pipelined
+    # modes.
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    # Processes tabulating pages in pipelined mode, one for each core if None.
+    workers: int | None = None
+    # Pages fetched but not yet written, in pipelined mode, beyond which fetching
+    # waits.
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    # The scheme and host of the leaderboard API, which can point to a local server.
+    api_root: str = fetch.LEADERBOARD_ROOT
+    # Requests per second at the start, which adapts to the server's responses.
+    rate: float = ratelimit.DEFAULT_RATE
+    # The ceiling for the adapted request rate.
+    max_rate: float = ratelimit.DEFAULT_MAX_RATE
+    # Pages packed into each chunk file. Without this or chunk_bytes, every page
+    # gets its own file.
+    chunk_pages: int | None = None
+    # Bytes of tables in memory packed into each chunk file, if set. Chunks are
+    # written when either limit is reached.
+    chunk_bytes: int | None = None
+    # Compression of the archive of raw board json, "gzip" or "zstd", which lets
+    # "xft retabulate" rebuild pages without downloading them again. No archive is
+    # kept if None.
+    archive: str | None = None
+    # A local directory where responses are cached, so that repeated downloads of
+    # unchanged pages cost a 304 response or no request at all. Nothing is cached
+    # if None.
+    http_cache: str | None = None
+    # Seconds cached responses are used before asking the server whether they
+    # changed, or never if None, which suits years that are over.
+    http_cache_ttl: float | None = DEFAULT_TTL
+    # Bytes of cached responses kept before the least recently used are removed.
+    http_cache_bytes: int = DEFAULT_MAX_BYTES
 
 
 def download_controls(
@@ -267,10 +1205,14 @@ def download_controls(
     years: int | list[int],
     *,
     force: bool = False,
+    limiter: RateLimiter | None = None,
+    cache: HttpCache | None = None,
 ):
     logger = misc.initialize_logger(
         __name__, filename=f"download_controls_{competition}.log"
     )
+    if limiter is None:
+        limiter = RateLimiter()
 
     if isinstance(years, int):
         years = [years]
@@ -283,18 +1225,23 @@ def download_controls(
     for year in years:
         output_path = fs.sep.join([output_directory, f"{year}_controls.parquet"])
         if force or not fs.isfile(output_path):
-            control = fetch.fetch_controls(competition, year)
-            sleep(DEFAULT_SLEEP_TIME)
+            with fetch.use_cache(cache):
+                control = fetch_with_retries(
+                    fetch.make_controls_url(competition, year),
+                    f"controls {competition=}, {year=}",
+                    limiter,
+                    logger=logger,
+                )
             table = tabulate.tabulate_control(control)
             if table is not None:
-                with fs.open(output_path, "wb") as f, warnings.catch_warnings():
-                    # Polars warns about using a file object instead of a path/string.
-                    warnings.filterwarnings("ignore", category=UserWarning)
-                    table.write_parquet(f)
-                    logger.info(f"Controls table written to {output_path}.")
+                write_parquet(fs, output_path, table)
+                logger.info(f"Controls table written to {output_path}.")
             else:
                 logger.info(f"Information not present for {year}.")
         else:
             logger.info(
                 f"Skipped {year} because a file already exists at {output_path}."
             )
+        logger.info(limiter.summary(limiter.reset_counts()))
+    if cache is not None:
+        logger.info(cache.summary())
@@ -1,11 +1,37 @@
-from urllib.parse import urlunsplit, urlencode
-from urllib.request import urlopen
+import asyncio
+from contextlib import contextmanager
+from urllib.error import HTTPError
+from urllib.parse import urlunsplit, urlencode, urlsplit
+from urllib.request import Request, urlopen
 import json
 
+import aiohttp
 
-def make_leaderboard_url(competition: str, year: int, division: int, page: int) -> str:
-    scheme = "https"
-    host = "c3po.crossfit.com"
+from . import httpcache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Roots of the two APIs. These can be replaced (with a local server, for example)
+# wherever the URL functions below are used.
+LEADERBOARD_ROOT = "https://c3po.crossfit.com"
+
+CONTROLS_ROOT = "https://games.crossfit.com"
+
+# The HTTP cache used by every fetch, set with use_cache.
+_cache = None
+
+
+def make_leaderboard_url(
+    competition: str,
+    year: int,
+    division: int,
+    page: int,
+    root: str = LEADERBOARD_ROOT,
+) -> str:
+    scheme, host, *_ = urlsplit(root)
     # The API path changes for 2024 games, for unknown reasons, and the query does too.
     if competition == "games" and year == 2024:
         path = "api/leaderboards/v2/competitions/finals/2024/leaderboards"
@@ -23,25 +49,159 @@ def make_leaderboard_url(competition: str, year: int, division: int, page: int)
     return urlunsplit(components)
 
 
-def make_controls_url(competition: str, year: int) -> str:
-    scheme = "https"
-    host = "games.crossfit.com"
+def make_controls_url(competition: str, year: int, root: str = CONTROLS_ROOT) -> str:
+    scheme, host, *_ = urlsplit(root)
     path = f"competitions/api/v1/competitions/{competition}/{year}"
     query = urlencode({"expand[]": "controls"})
     components = (scheme, host, path, query, "")
     return urlunsplit(components)
 
 
-def fetch(url) -> str:
-    with urlopen(url) as response:
-        contents = response.read().decode("utf-8")
-    contents = json.loads(contents)
+def decode_json(contents: bytes | str):
+    """Decodes json with orjson if it's installed, which is a few times faster than
+    the standard library on leaderboard responses, and with the json module if not."""
+    if orjson is not None:
+        return orjson.loads(contents)
+    return json.loads(contents)
+
+
+def encode_json(value) -> bytes:
+    """Encodes json compactly on one line, with orjson if it's installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+@contextmanager
+def use_cache(cache):
+    """Answers every fetch in a with block from an httpcache.HttpCache, which does
+    nothing if cache is None."""
+    global _cache
+    previous, _cache = _cache, cache
+    try:
+        yield cache
+    finally:
+        _cache = previous
+
+
+def cache_lookup(url) -> tuple[httpcache.CacheEntry, bytes] | None:
+    """Looks a url up in the cache in use, if any. The result is handed on to
+    fresh_body and request_bytes, so that a request reads the cache only once."""
+    if _cache is None:
+        return None
+    return _cache.lookup(url)
+
+
+async def cache_lookup_async(url) -> tuple[httpcache.CacheEntry, bytes] | None:
+    """Looks a url up like cache_lookup, reading the cache in a thread, so that it
+    doesn't hold up the event loop."""
+    if _cache is None:
+        return None
+    return await asyncio.to_thread(_cache.lookup, url)
+
+
+def fresh_body(cached: tuple[httpcache.CacheEntry, bytes] | None) -> bytes | None:
+    """Gives a looked up body if it can be used without any request, counting a
+    hit, so callers can skip rate limiting too."""
+    if cached is None or not _cache.is_fresh(cached[0]):
+        return None
+    _cache.hit(cached[0])
+    return cached[1]
+
+
+def request_bytes(url, cached: tuple[httpcache.CacheEntry, bytes] | None) -> bytes:
+    """Requests a url and returns the undecoded body of the response. With a cache
+    in use, a looked up response is revalidated and new ones are stored."""
+    cache = _cache
+    if cache is None:
+        with urlopen(url) as response:
+            contents = response.read()
+        return contents
+    headers = {} if cached is None else httpcache.validator_headers(cached[0])
+    try:
+        with urlopen(Request(url, headers=headers)) as response:
+            contents = response.read()
+            cache.store(url, contents, response.headers)
+    except HTTPError as error:
+        # A 304 without a cached response has no body to use, so it fails like
+        # any other error and the request is retried.
+        if error.code != 304 or cached is None:
+            raise
+        cache.revalidated(cached[0])
+        return cached[1]
     return contents
 
 
-def fetch_leaderboard(competition: str, year: int, division: int, page: int) -> str:
-    return fetch(make_leaderboard_url(competition, year, division, page))
+def fetch_bytes(url) -> bytes:
+    """Requests a url and returns the undecoded body of the response. With a cache
+    in use, fresh responses are returned without a request and stale ones are
+    revalidated."""
+    cached = cache_lookup(url)
+    contents = fresh_body(cached)
+    if contents is not None:
+        return contents
+    return request_bytes(url, cached)
+
+
+def fetch(url) -> dict:
+    # Bytes are decoded directly, without making a string first.
+    return decode_json(fetch_bytes(url))
+
+
+def fetch_leaderboard(
+    competition: str,
+    year: int,
+    division: int,
+    page: int,
+    root: str = LEADERBOARD_ROOT,
+) -> str:
+    return fetch(make_leaderboard_url(competition, year, division, page, root))
+
+
+def fetch_controls(competition: str, year: int, root: str = CONTROLS_ROOT) -> str:
+    return fetch(make_controls_url(competition, year, root))
+
+
+async def request_async(
+    session: aiohttp.ClientSession,
+    url: str,
+    cached: tuple[httpcache.CacheEntry, bytes] | None,
+) -> dict:
+    """Requests a url through a shared session, which keeps a pool of keep-alive
+    connections, and decodes the json response. A looked up response is revalidated
+    like it is by request_bytes, with the cache's disk writes in a thread, so they
+    don't hold up the event loop."""
+    cache = _cache
+    if cache is None:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            contents = await response.read()
+        return decode_json(contents)
+    headers = {} if cached is None else httpcache.validator_headers(cached[0])
+    async with session.get(url, headers=headers) as response:
+        if response.status == 304:
+            if cached is None:
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=304,
+                    message="Not Modified, without a cached response",
+                    headers=response.headers,
+                )
+            await asyncio.to_thread(cache.revalidated, cached[0])
+            return decode_json(cached[1])
+        response.raise_for_status()
+        contents = await response.read()
+    # The connection goes back to the pool before the response is stored.
+    await asyncio.to_thread(cache.store, url, contents, response.headers)
+    return decode_json(contents)
 
 
-def fetch_controls(competition: str, year: int) -> str:
-    return fetch(make_controls_url(competition, year))
+async def fetch_async(session: aiohttp.ClientSession, url: str) -> dict:
+    """The asynchronous counterpart of fetch, consulting the cache in use, if any,
+    like fetch_bytes."""
+    cached = await cache_lookup_async(url)
+    contents = fresh_body(cached)
+    if contents is not None:
+        return decode_json(contents)
+    return await request_async(session, url, cached)
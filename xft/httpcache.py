@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import fsspec
+
+from . import misc
+
+# Seconds a cached response is used without asking the server whether it changed.
+DEFAULT_TTL = 24 * 3600.0
+
+# Bytes of response bodies kept before the least recently used are removed.
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    # Validators sent back to the server to ask whether the response changed.
+    etag: str | None
+    last_modified: str | None
+    # When the response was stored or last confirmed unchanged, in epoch seconds.
+    stored: float
+    # Bytes in the body.
+    size: int
+
+
+@dataclass
+class CacheCounts:
+    # Fresh responses used without any request.
+    hits: int = 0
+    # Stale responses that the server said were unchanged (304).
+    revalidations: int = 0
+    # Responses that weren't cached or had changed.
+    misses: int = 0
+    # Responses removed to stay under the size limit.
+    evictions: int = 0
+    # Body bytes that didn't have to be transferred.
+    saved_bytes: int = 0
+
+
+class HttpCache:
+    """A cache of response bodies on local disk, keyed by url. Responses younger than
+    ttl seconds are used without a request, and older ones are revalidated with
+    If-None-Match and If-Modified-Since, so an unchanged response costs a 304 with
+    no body. With ttl set to None, responses are never revalidated, which suits
+    leaderboards of past years. The least recently used responses are removed when
+    the bodies grow beyond max_bytes. Safe to use from several threads, but not from
+    several processes at once."""
+
+    def __init__(
+        self,
+        directory: str | Path,
+        ttl: float | None = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fs = fsspec.filesystem("file")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.counts = CacheCounts()
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._bytes = sum(entry.size for entry in self._entries.values())
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        return (
+            self.directory / f"{key}.json",
+            self.directory / f"{key}.body",
+        )
+
+    def _load(self) -> OrderedDict[str, CacheEntry]:
+        # Bodies are touched when used, so their modification times give the order
+        # of use across runs.
+        entries = []
+        for meta_path in self.directory.glob("*.json"):
+            body_path = meta_path.with_suffix(".body")
+            try:
+                entry = CacheEntry(**json.loads(meta_path.read_bytes()))
+                used = body_path.stat().st_mtime
+            except (OSError, TypeError, json.JSONDecodeError):
+                continue
+            entries.append((used, meta_path.stem, entry))
+        return OrderedDict((key, entry) for _, key, entry in sorted(entries))
+
+    def lookup(self, url: str) -> tuple[CacheEntry, bytes] | None:
+        """Gives the cached entry and body for a url, if there is one."""
+        key = cache_key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        _, body_path = self._paths(key)
+        try:
+            body = body_path.read_bytes()
+            os.utime(body_path)
+        except FileNotFoundError:
+            return None
+        return entry, body
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return self.ttl is None or time.time() - entry.stored < self.ttl
+
+    def hit(self, entry: CacheEntry) -> None:
+        with self._lock:
+            self.counts.hits += 1
+            self.counts.saved_bytes += entry.size
+        return None
+
+    def revalidated(self, entry: CacheEntry) -> None:
+        """Records that the server said a stale response is unchanged."""
+        entry.stored = time.time()
+        self._write_entry(cache_key(entry.url), entry)
+        with self._lock:
+            self.counts.revalidations += 1
+            self.counts.saved_bytes += entry.size
+        return None
+
+    def store(self, url: str, body: bytes, headers) -> None:
+        """Keeps a response that was fully transferred, counting a miss."""
+        key = cache_key(url)
+        entry = CacheEntry(
+            url,
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+            time.time(),
+            len(body),
+        )
+        _, body_path = self._paths(key)
+        misc.write_atomic(self.fs, str(body_path), body)
+        self._write_entry(key, entry)
+        with self._lock:
+            self.counts.misses += 1
+            previous = self._entries.pop(key, None)
+            self._bytes += entry.size - (0 if previous is None else previous.size)
+            self._entries[key] = entry
+            evicted = []
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self._bytes -= old_entry.size
+                evicted.append(old_key)
+            self.counts.evictions += len(evicted)
+        for old_key in evicted:
+            for path in self._paths(old_key):
+                path.unlink(missing_ok=True)
+        return None
+
+    def _write_entry(self, key: str, entry: CacheEntry) -> None:
+        meta_path, _ = self._paths(key)
+        misc.write_atomic(self.fs, str(meta_path), json.dumps(asdict(entry)).encode())
+        return None
+
+    def summary(self) -> str:
+        counts = self.counts
+        total = counts.hits + counts.revalidations + counts.misses
+        return (
+            f"HTTP cache answered {counts.hits + counts.revalidations} of {total} request(s): "
+            f"{counts.hits} hit(s) without a request, {counts.revalidations} revalidation(s), "
+            f"{counts.misses} miss(es), and {counts.evictions} eviction(s), saving "
+            f"{counts.saved_bytes / 1e6:.1f} MB of transfers."
+        )
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def validator_headers(entry: CacheEntry) -> dict[str, str]:
+    """Headers asking the server to answer 304 if a response hasn't changed."""
+    headers = {}
+    if entry.etag is not None:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified is not None:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
@@ -0,0 +1,214 @@
+import io
+
+import fsspec
+import numpy as np
+import polars as pl
+
+from . import consolidate, manifest, misc
+
+# Competition types are stored as small codes in the index.
+COMPETITIONS = ["games", "open"]
+
+# One entry of an athlete, which is their rows in a consolidated year file for
+# one competition and division.
+ENTRY_DTYPE = np.dtype(
+    [
+        ("competitorId", np.int64),
+        ("year", np.int16),
+        ("competitionType", np.int8),
+        ("divisionId", np.int8),
+        # Index of the entry's first row in the year's consolidated file.
+        ("row", np.int64),
+        # Number of consecutive rows of the entry, one for each workout.
+        ("rows", np.int32),
+    ]
+)
+
+# Names of the index files, next to the consolidated files.
+INDEX_DIR = "index"
+
+INDEX_STATE = "index.json"
+
+
+def index_dir(fs, url) -> str:
+    return fs.sep.join([url, "boards", "consolidated", INDEX_DIR])
+
+
+def save_array(fs, path: str, array: np.ndarray) -> None:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    misc.write_atomic(fs, path, buffer.getvalue())
+    return None
+
+
+def load_array(fs, path: str, mmap: bool = True) -> np.ndarray:
+    """Loads an array saved by save_array, memory mapping local files."""
+    if mmap and misc.is_local(fs):
+        return np.load(path, mmap_mode="r", allow_pickle=False)
+    return np.load(io.BytesIO(fs.cat_file(path)), allow_pickle=False)
+
+
+def year_entries(df: pl.DataFrame, year: int) -> np.ndarray:
+    """Finds the entries in the key columns of a consolidated year, as runs of
+    consecutive rows with the same athlete, competition, and division. An athlete
+    appearing on two pages of a division gets two entries."""
+    key = ["competitorId", "competitionType", "divisionId"]
+    df = df.select(key).with_columns(
+        pl.col("competitionType")
+        .cast(pl.String)
+        .replace_strict(COMPETITIONS, range(len(COMPETITIONS)), return_dtype=pl.Int8)
+    )
+    starts = df.select(pl.any_horizontal(pl.col(key).ne_missing(pl.col(key).shift(1))))
+    start_rows = np.flatnonzero(starts.to_series().fill_null(True).to_numpy())
+    entries = np.zeros(len(start_rows), dtype=ENTRY_DTYPE)
+    first = df[start_rows]
+    entries["competitorId"] = first["competitorId"].fill_null(-1).to_numpy()
+    entries["year"] = year
+    entries["competitionType"] = first["competitionType"].to_numpy()
+    entries["divisionId"] = first["divisionId"].fill_null(-1).to_numpy()
+    entries["row"] = start_rows
+    entries["rows"] = np.diff(start_rows, append=len(df))
+    return entries[entries["competitorId"] >= 0]
+
+
+def update_index(data_dir: str, force: bool = False) -> list[int]:
+    """Brings the athlete index of the consolidated year files up to date. Each
+    year's entries are found once and kept, and only years whose files changed
+    since, or are new, are read again, and only their key columns. The entries of
+    every year are then merged and sorted by athlete. Returns the years that were
+    read."""
+    fs, url = fsspec.url_to_fs(data_dir)
+    directory = index_dir(fs, url)
+    fs.makedirs(fs.sep.join([directory, "years"]), exist_ok=True)
+    state_path = fs.sep.join([directory, INDEX_STATE])
+    state = consolidate.read_state(fs, state_path)
+    pattern = fs.sep.join([url, "boards", "consolidated", "*.parquet"])
+    files = {}
+    for path, info in fs.glob(pattern, detail=True).items():
+        name = path.split(fs.sep)[-1].removesuffix(".parquet")
+        if name.isdigit():
+            files[name] = (path, f"{info['size']}:{manifest.file_versions(info)}")
+    read = []
+    for year, (path, version) in sorted(files.items()):
+        if not force and state.get(year) == version:
+            continue
+        columns = ["competitorId", "competitionType", "divisionId"]
+        df = consolidate.scan_parquets(fs, [path]).select(columns).collect()
+        save_array(fs, year_path(fs, directory, year), year_entries(df, int(year)))
+        state[year] = version
+        read.append(int(year))
+    removed = set(state) - set(files)
+    for year in removed:
+        fs.rm_file(year_path(fs, directory, year))
+        del state[year]
+    if read or removed or not fs.exists(fs.sep.join([directory, "entries.npy"])):
+        pieces = [
+            load_array(fs, year_path(fs, directory, year), mmap=False)
+            for year in sorted(state)
+        ]
+        entries = np.concatenate(pieces) if pieces else np.zeros(0, ENTRY_DTYPE)
+        entries = entries[
+            np.lexsort(
+                (
+                    entries["divisionId"],
+                    entries["competitionType"],
+                    entries["year"],
+                    entries["competitorId"],
+                )
+            )
+        ]
+        ids, starts = np.unique(entries["competitorId"], return_index=True)
+        offsets = np.append(starts, len(entries)).astype(np.int64)
+        for name, array in [("entries", entries), ("ids", ids), ("offsets", offsets)]:
+            save_array(fs, fs.sep.join([directory, f"{name}.npy"]), array)
+        consolidate.write_state(fs, state_path, state)
+    return read
+
+
+def year_path(fs, directory: str, year: str) -> str:
+    return fs.sep.join([directory, "years", f"{year}.npy"])
+
+
+def entry_frame(entries: np.ndarray) -> pl.DataFrame:
+    return pl.from_numpy(entries).with_columns(
+        pl.col("competitionType").replace_strict(
+            range(len(COMPETITIONS)), COMPETITIONS, return_dtype=pl.String
+        )
+    )
+
+
+class AthleteIndex:
+    """The entries of every athlete in the consolidated year files, sorted by
+    athlete and then by year, competition, and division, as written by
+    update_index. Looking up athletes costs a binary search for each plus the
+    number of their entries, without touching anyone else's, and local index files
+    are memory mapped instead of read. It's for questions about some athletes, like
+    their careers. Matching Open and Games results and filling attributes touch
+    every athlete, so analysis does them with queries over whole years instead."""
+
+    def __init__(self, data_dir: str, mmap: bool = True):
+        fs, url = fsspec.url_to_fs(data_dir)
+        directory = index_dir(fs, url)
+        self.fs = fs
+        self.url = url
+        self.entries = load_array(fs, fs.sep.join([directory, "entries.npy"]), mmap)
+        self.ids = load_array(fs, fs.sep.join([directory, "ids.npy"]), mmap)
+        self.offsets = load_array(fs, fs.sep.join([directory, "offsets.npy"]), mmap)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions(self, competitor_ids) -> np.ndarray:
+        """Gives the positions in entries of every entry of the given athletes, in
+        the order the athletes are given. Unknown athletes have none."""
+        competitor_ids = np.atleast_1d(np.asarray(competitor_ids, dtype=np.int64))
+        found = np.searchsorted(self.ids, competitor_ids)
+        known = found < len(self.ids)
+        known[known] = self.ids[found[known]] == competitor_ids[known]
+        found = found[known]
+        starts, stops = self.offsets[found], self.offsets[found + 1]
+        counts = stops - starts
+        # Each run of positions counts up from its start.
+        runs = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return runs + np.arange(counts.sum())
+
+    def lookup(self, competitor_ids) -> pl.DataFrame:
+        """The entries of the given athletes, with the competition types named."""
+        return entry_frame(self.entries[self.positions(competitor_ids)])
+
+    def table(self) -> pl.DataFrame:
+        """Every entry, as a frame, for joins on whole competitions like the Open
+        and Games of a year."""
+        return entry_frame(np.asarray(self.entries))
+
+    def read(self, competitor_ids, columns: list[str] | None = None) -> pl.DataFrame:
+        """Reads the consolidated rows of the given athletes, only touching the
+        slices of the year files that hold them. The athlete attributes of years
+        consolidated with split_athletes are joined back from the year's athlete
+        table."""
+        entries = self.lookup(competitor_ids)
+        frames = []
+        for (year,), group in entries.group_by("year", maintain_order=True):
+            path = self.fs.sep.join(
+                [self.url, "boards", "consolidated", f"{year}.parquet"]
+            )
+            lf = consolidate.scan_parquets(self.fs, [path])
+            split = "competitorName" not in lf.collect_schema().names()
+            lf = pl.concat(
+                [
+                    lf.slice(row, rows)
+                    for row, rows in group.select("row", "rows").rows()
+                ]
+            )
+            if split:
+                athletes = consolidate.scan_parquets(
+                    self.fs, [consolidate.athlete_path(self.fs, self.url, year)]
+                )
+                lf = consolidate.join_athletes(lf, athletes)
+            if columns is not None:
+                lf = lf.select(columns)
+            frames.append(lf)
+        if not frames:
+            return pl.DataFrame()
+        with misc.string_cache():
+            return pl.concat(pl.collect_all(frames), how="vertical_relaxed")
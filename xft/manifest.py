@@ -0,0 +1,393 @@
+import hashlib
+import io
+import json
+import re
+import threading
+import warnings
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
+
+import polars as pl
+
+from .misc import is_local, write_atomic
+
+# The manifest of a division's pages lives in the same directory as the pages.
+MANIFEST_NAME = "manifest.json"
+
+MANIFEST_VERSION = 1
+
+
+def page_name(page: int) -> str:
+    return f"{page:06}.parquet"
+
+
+def chunk_name(pages: list[int], sha256: str) -> str:
+    # The hash keeps a rewritten chunk from replacing a file that other pages
+    # still point to.
+    return f"chunk-{min(pages):06}-{max(pages):06}-{sha256[:12]}.parquet"
+
+
+def page_number(name: str) -> int:
+    return int(name.split("/")[-1].split(".")[0])
+
+
+def file_versions(info: dict) -> tuple[float | None, str | None]:
+    """Pulls a modification time and an etag, when there are any, out of the file
+    details given by an fsspec file system. Every backend names them differently."""
+    mtime = info.get("mtime", info.get("created"))
+    if isinstance(mtime, datetime):
+        mtime = mtime.timestamp()
+    etag = None
+    for key in ("etag", "ETag", "md5Hash", "generation"):
+        if info.get(key) is not None:
+            etag = str(info[key]).strip('"')
+            break
+    return mtime, etag
+
+
+@dataclass
+class PageRecord:
+    # File name of the page, relative to its division directory.
+    name: str
+    # Size of the file in bytes.
+    size: int
+    # Modification time of the file, if the file system reports one.
+    mtime: float | None
+    # Entity tag of the file, if the file system reports one.
+    etag: str | None
+    # Number of rows in the table, if known. Pages found by listing object storage
+    # aren't read, so this is None for them.
+    rows: int | None
+    # SHA-256 of the file contents, if known, like rows.
+    sha256: str | None
+    # Index of the page's first row in the file, which is not zero for pages
+    # packed into chunks.
+    offset: int = 0
+    # Number of rows in the whole file, if it holds more than this page.
+    file_rows: int | None = None
+
+    def is_whole_file(self) -> bool:
+        return self.file_rows is None or self.file_rows == self.rows
+
+
+@dataclass
+class Manifest:
+    # Records of the pages that were written, by page number.
+    pages: dict[int, PageRecord] = field(default_factory=dict)
+    # The last page with data, when it has been found.
+    last_page: int | None = None
+
+    def missing(self, min_page: int = 1, last_page: int | None = None) -> list[int]:
+        """Lists the pages up to the last page that have not been written."""
+        if last_page is None:
+            last_page = self.last_page or 0
+        return [p for p in range(min_page, last_page + 1) if p not in self.pages]
+
+    def fingerprint(self) -> str:
+        """A hash that changes whenever any page is added, removed, or changed."""
+        digest = hashlib.sha256()
+        for page in sorted(self.pages):
+            record = self.pages[page]
+            # Pages that were listed but not read are identified by their versions.
+            version = record.sha256 or f"{record.size}:{record.mtime}:{record.etag}"
+            digest.update(f"{page}:{version}:{record.offset}\n".encode())
+        return digest.hexdigest()
+
+    def parts(self) -> list[tuple[str, int, int | None]]:
+        """Lists the (file name, first row, number of rows) pieces of files that
+        hold the pages, in page order, merging neighboring pages in the same file.
+        The number of rows is None where the whole file is used."""
+        parts = []
+        for page in sorted(self.pages):
+            record = self.pages[page]
+            if parts:
+                name, offset, rows = parts[-1]
+                if name == record.name and offset + rows == record.offset:
+                    parts[-1] = (name, offset, rows + record.rows)
+                    continue
+            parts.append((record.name, record.offset, record.rows))
+        file_rows = {record.name: record.file_rows for record in self.pages.values()}
+        return [
+            (
+                name,
+                offset,
+                None if offset == 0 and file_rows[name] in (None, rows) else rows,
+            )
+            for name, offset, rows in parts
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "version": MANIFEST_VERSION,
+                "last_page": self.last_page,
+                "pages": {
+                    str(page): asdict(record)
+                    for page, record in sorted(self.pages.items())
+                },
+            }
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> "Manifest":
+        contents = json.loads(text)
+        if contents.get("version") != MANIFEST_VERSION:
+            raise ValueError(
+                f"Expected manifest version {MANIFEST_VERSION} but got {contents.get('version')}."
+            )
+        return cls(
+            pages={
+                int(page): PageRecord(**record)
+                for page, record in contents["pages"].items()
+            },
+            last_page=contents["last_page"],
+        )
+
+
+def manifest_path(fs, output_subdir: str) -> str:
+    return fs.sep.join([output_subdir, MANIFEST_NAME])
+
+
+def read_manifest(fs, output_subdir: str) -> Manifest | None:
+    """Reads a division's manifest, returning None if there isn't one or if it was
+    cut short, which could happen before manifests were written atomically."""
+    path = manifest_path(fs, output_subdir)
+    try:
+        text = fs.cat_file(path)
+    except FileNotFoundError:
+        return None
+    try:
+        return Manifest.from_json(text)
+    except json.JSONDecodeError:
+        warnings.warn(f"Ignoring the unreadable manifest {path}.")
+        return None
+
+
+def write_manifest(fs, output_subdir: str, manifest: Manifest) -> None:
+    write_atomic(fs, manifest_path(fs, output_subdir), manifest.to_json().encode())
+    return None
+
+
+def record_file(
+    fs, path: str, data: bytes, rows: int, sha256: str | None = None
+) -> PageRecord:
+    """Makes the record of a file that was just written. Its modification time and
+    etag are left out, since asking for them would cost a request for every file,
+    and are filled in by fill_versions."""
+    return PageRecord(
+        name=path.split(fs.sep)[-1],
+        size=len(data),
+        mtime=None,
+        etag=None,
+        rows=rows,
+        sha256=hashlib.sha256(data).hexdigest() if sha256 is None else sha256,
+    )
+
+
+def list_files(fs, output_subdir: str) -> dict[str, dict]:
+    """Lists a division directory once, with details, giving the details of each
+    file by name. A missing directory has no files."""
+    try:
+        listing = fs.ls(output_subdir, detail=True)
+    except FileNotFoundError:
+        return {}
+    return {
+        info["name"].rstrip(fs.sep).split(fs.sep)[-1]: info
+        for info in listing
+        if info["type"] == "file"
+    }
+
+
+def fill_versions(fs, output_subdir: str, manifest: Manifest, pages=None) -> None:
+    """Fills in the modification times and etags of pages, all of them unless given,
+    from a single listing of their directory."""
+    files = list_files(fs, output_subdir)
+    for page in manifest.pages if pages is None else pages:
+        record = manifest.pages[page]
+        if record.name in files:
+            mtime, etag = file_versions(files[record.name])
+            manifest.pages[page] = replace(record, mtime=mtime, etag=etag)
+    return None
+
+
+def parquet_bytes(df: pl.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.write_parquet(buffer)
+    return buffer.getvalue()
+
+
+def write_page(fs, output_subdir: str, page: int, df: pl.DataFrame) -> PageRecord:
+    """Writes a page's table like write_parquet and returns its manifest record."""
+    data = parquet_bytes(df)
+    path = fs.sep.join([output_subdir, page_name(page)])
+    write_atomic(fs, path, data)
+    return record_file(fs, path, data, len(df))
+
+
+class PageWriter:
+    """Writes a division's pages and records them in its manifest. With
+    chunk_pages or chunk_bytes set, pages are held in memory and packed into chunk
+    files of that many pages, or of about that many bytes of tables in memory,
+    whichever comes first, so that object stores see far fewer, larger objects.
+    The manifest says which chunk and rows hold each page, so pages can still be
+    skipped and replaced one at a time. Safe to use from several threads.
+
+    Files and the manifest are written atomically, and a page is only recorded
+    after its file is complete, so the manifest works as a checkpoint: a download
+    that is killed loses at most the pages written since the last save and never
+    trusts a partial file."""
+
+    def __init__(
+        self,
+        fs,
+        output_subdir: str,
+        manifest: Manifest,
+        *,
+        chunk_pages: int | None = None,
+        chunk_bytes: int | None = None,
+    ):
+        if chunk_pages is not None and chunk_pages < 1:
+            raise ValueError(
+                f"Chunks must hold at least one page but got {chunk_pages}."
+            )
+        self.fs = fs
+        self.output_subdir = output_subdir
+        self.manifest = manifest
+        self.chunk_pages = chunk_pages
+        self.chunk_bytes = chunk_bytes
+        self.files = 0
+        self._buffer = {}
+        self._buffered_bytes = 0
+        self._replaced = set()
+        self._written = set()
+        self._lock = threading.Lock()
+
+    @property
+    def chunked(self) -> bool:
+        return self.chunk_pages is not None or self.chunk_bytes is not None
+
+    def write(self, page: int, df: pl.DataFrame) -> None:
+        if not self.chunked:
+            record = write_page(self.fs, self.output_subdir, page, df)
+            with self._lock:
+                self._record(page, record)
+                self.files += 1
+            return None
+        with self._lock:
+            self._buffer[page] = df
+            self._buffered_bytes += df.estimated_size()
+            full = (
+                self.chunk_pages is not None and len(self._buffer) >= self.chunk_pages
+            ) or (
+                self.chunk_bytes is not None
+                and self._buffered_bytes >= self.chunk_bytes
+            )
+            if not full:
+                return None
+            pages, self._buffer = self._buffer, {}
+            self._buffered_bytes = 0
+        self._write_chunk(pages)
+        return None
+
+    def set_last_page(self, last_page: int) -> None:
+        """Records the division's last page, saving the manifest right away if it
+        changed so that a restarted download starts its search there."""
+        with self._lock:
+            changed = self.manifest.last_page != last_page
+            self.manifest.last_page = last_page
+        if changed:
+            self.save()
+        return None
+
+    def flush(self) -> None:
+        """Writes any buffered pages to a chunk."""
+        with self._lock:
+            pages, self._buffer = self._buffer, {}
+            self._buffered_bytes = 0
+        if pages:
+            self._write_chunk(pages)
+        return None
+
+    def close(self) -> None:
+        """Writes buffered pages, deletes files that no page points to anymore,
+        and saves the manifest."""
+        self.flush()
+        with self._lock:
+            names = {record.name for record in self.manifest.pages.values()}
+            orphans = self._replaced - names
+            self._replaced = set()
+        for name in orphans:
+            self.fs.rm_file(self.fs.sep.join([self.output_subdir, name]))
+        with self._lock:
+            written, self._written = self._written, set()
+        if written:
+            fill_versions(self.fs, self.output_subdir, self.manifest, written)
+        self.save()
+        return None
+
+    def save(self) -> None:
+        """Writes the manifest as it is, which can be done while pages are added."""
+        with self._lock:
+            text = self.manifest.to_json()
+        write_atomic(self.fs, manifest_path(self.fs, self.output_subdir), text.encode())
+        return None
+
+    def _record(self, page: int, record: PageRecord) -> None:
+        old = self.manifest.pages.get(page)
+        if old is not None and old.name != record.name:
+            self._replaced.add(old.name)
+        self.manifest.pages[page] = record
+        self._written.add(page)
+
+    def _write_chunk(self, tables: dict[int, pl.DataFrame]) -> None:
+        pages = sorted(tables)
+        chunk = pl.concat([tables[page] for page in pages], how="vertical")
+        data = parquet_bytes(chunk)
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.fs.sep.join([self.output_subdir, chunk_name(pages, sha256)])
+        write_atomic(self.fs, path, data)
+        whole = record_file(self.fs, path, data, len(chunk), sha256)
+        offset = 0
+        with self._lock:
+            for page in pages:
+                rows = len(tables[page])
+                record = replace(whole, rows=rows, offset=offset, file_rows=len(chunk))
+                self._record(page, record)
+                offset += rows
+            self.files += 1
+        return None
+
+
+def scan_pages(fs, output_subdir: str) -> Manifest:
+    """Makes a manifest from the page files in a division directory, for pages that
+    were written before there were manifests, with a single listing of the
+    directory. Object stores only show files that were completely uploaded, so the
+    listing is enough there. Local files could have been cut short by a crash, so
+    they are read too, and files that can't be read are left out so that their
+    pages are downloaded again."""
+    manifest = Manifest()
+    for name, info in list_files(fs, output_subdir).items():
+        if re.fullmatch(r"\d+\.parquet", name) is None or info["size"] == 0:
+            continue
+        mtime, etag = file_versions(info)
+        record = PageRecord(name, info["size"], mtime, etag, rows=None, sha256=None)
+        if is_local(fs):
+            data = fs.cat_file(info["name"])
+            try:
+                rows = pl.scan_parquet(io.BytesIO(data)).select(pl.len()).collect()
+            except pl.exceptions.ComputeError:
+                continue
+            record = replace(
+                record, rows=rows.item(), sha256=hashlib.sha256(data).hexdigest()
+            )
+        manifest.pages[page_number(name)] = record
+    return manifest
+
+
+def load_manifest(fs, output_subdir: str) -> Manifest:
+    """Reads a division's manifest or, if it doesn't have one yet, makes one from
+    the pages already present."""
+    manifest = read_manifest(fs, output_subdir)
+    if manifest is None:
+        manifest = scan_pages(fs, output_subdir)
+    return manifest
@@ -1,5 +1,14 @@
+import inspect
 import logging
+import multiprocessing
 import pathlib
+import resource
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import polars as pl
 from rich import print
 
 DIVISIONS = {
@@ -55,6 +64,17 @@ def get_division_name(division: int):
     return name
 
 
+def format_ranges(numbers: list[int]) -> str:
+    """Writes sorted integers compactly, like "1-3, 7, 9-12"."""
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
 def get_root_dir():
     return pathlib.Path(__file__).parent.parent
 
@@ -77,6 +97,62 @@ def get_workout_description(competition: str, year: int, number: int) -> str | N
     return description
 
 
+def peak_rss() -> int:
+    """Returns the peak resident set size of this process so far, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes but macOS reports bytes.
+    return peak if sys.platform == "darwin" else 1024 * peak
+
+
+def is_local(fs) -> bool:
+    return "file" in fs.protocol
+
+
+def temporary_path(fs, path: str) -> str:
+    """A hidden, unique path next to path, which globs for its extension miss."""
+    directory, name = path.rsplit(fs.sep, 1)
+    return fs.sep.join([directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp"])
+
+
+@contextmanager
+def atomic_open(fs, path: str):
+    """Opens a file for writing in binary mode such that, even if the process dies
+    part way, the path has either its old contents or all of the new ones. Local
+    files are written under a temporary name and then renamed, which replaces the
+    old file in one step. Object stores only make an object visible once its upload
+    is finished, so they're written directly."""
+    if not is_local(fs):
+        with fs.open(path, "wb") as f:
+            yield f
+        return None
+    temporary = temporary_path(fs, path)
+    try:
+        with fs.open(temporary, "wb") as f:
+            yield f
+        fs.mv(temporary, path)
+    finally:
+        if fs.exists(temporary):
+            fs.rm_file(temporary)
+    return None
+
+
+def write_atomic(fs, path: str, data: bytes) -> None:
+    """Writes a whole file like atomic_open, with a single request on object stores."""
+    if not is_local(fs):
+        fs.pipe_file(path, data)
+        return None
+    with atomic_open(fs, path) as f:
+        f.write(data)
+    return None
+
+
+def process_pool(workers: int | None = None) -> ProcessPoolExecutor:
+    """Makes a pool of worker processes, one for each core unless workers is given.
+    Processes are spawned instead of forked because Polars is multithreaded and can
+    hang in forked processes."""
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
 def initialize_logger(
     name: str, level: int = logging.INFO, *, filename: str | None = None
 ) -> logging.Logger:
@@ -97,3 +173,24 @@ def initialize_logger(
         logger.addHandler(handler)
 
     return logger
+
+
+def string_cache():
+    """Shares the categories of Categorical columns in a with block, so that frames
+    read from different files concatenate without encoding them again. Recent
+    versions of Polars always share categories and deprecate the cache, so nothing
+    is done with them."""
+    if hasattr(pl, "Categories"):
+        return nullcontext()
+    return pl.StringCache()
+
+
+def collect(lf: pl.LazyFrame, streaming: bool = False) -> pl.DataFrame:
+    """Collects a lazy frame, optionally with the streaming engine, which processes
+    the scans in batches instead of reading them whole. Older versions of Polars
+    take a streaming flag instead of an engine."""
+    if not streaming:
+        return lf.collect()
+    if "streaming" in inspect.signature(pl.LazyFrame.collect).parameters:
+        return lf.collect(streaming=True)
+    return lf.collect(engine="streaming")
@@ -2,93 +2,91 @@ import polars as pl
 import pymc as pm
 
 from .analysis import (
-    prepare_overall_open_games,
+    Boards,
+    collect_all,
+    merge_open_games_pairs,
+    open_games_pairs,
     prepare_overall_characteristics,
 )
+from .derived import DerivedCache, frame_fingerprint
 from .misc import get_division_name
 
 
+def split_groups(df: pl.DataFrame) -> dict[str, pl.DataFrame]:
+    """Splits a frame sorted by year and division into a frame for each, labeled
+    like "2024 Men"."""
+    return {
+        f"{year} {get_division_name(divisionId)}": group
+        for (year, divisionId), group in df.partition_by(
+            "year", "divisionId", as_dict=True, maintain_order=True
+        ).items()
+    }
+
+
 def create_open_games_groups(
-    boards: pl.DataFrame, divisionIds: list[int] | None = None
+    boards: pl.DataFrame,
+    divisionIds: list[int] | None = None,
+    cache: DerivedCache | None = None,
 ) -> dict:
     """Splits the consolidated frame into frames for each year and divison,
     including correct ordering between each Open-Games pair and transformed
-    overall rankings in all frames."""
+    overall rankings in all frames. Every group is prepared at once, see
+    analysis.open_games_pairs. With a derived cache, the groups of the same frame
+    and divisions are reused."""
+
+    if cache is not None:
+        params = {"boards": frame_fingerprint(boards), "divisionIds": divisionIds}
+        return cache.get(
+            create_open_games_groups,
+            params,
+            lambda: create_open_games_groups(boards, divisionIds),
+        )
 
-    if divisionIds is not None:
-        boards = boards.filter(pl.col("divisionId").is_in(divisionIds))
+    opn, gms = collect_all(*open_games_pairs(Boards(boards.lazy()), divisionIds))
+    if not (opn["competitorId"] == gms["competitorId"]).all():
+        raise ValueError(
+            "The competitor ids did not exactly match between Open and Games data frames."
+        )
     groups = dict()
-    for key, group in boards.group_by(["year", "divisionId"]):
-        opn, gms = prepare_overall_open_games(group)
-        if not (opn.is_empty() or gms.is_empty()):
-            if not (opn["competitorId"] == gms["competitorId"]).all():
-                raise ValueError(
-                    f"For {key=}, the competitor ids did not exactly match between Open and Games data frames."
-                )
-            year, divisionId = key
-            label = f"{year} {get_division_name(divisionId)}"
-            groups[label] = dict()
-            groups[label]["opn"] = opn
-            groups[label]["gms"] = gms
+    for label, group in split_groups(opn).items():
+        groups[label] = dict(opn=group)
+    for label, group in split_groups(gms).items():
+        groups[label]["gms"] = group
 
     return groups
 
 
 def merge_rank_columns(groups: dict) -> dict:
     """Merges data frames for the Open and Games, as stored in a dictionary. Renames
-    relevant columns with ...Open and ...Games as appropriate."""
-    difs = dict()
-    for label in groups:
-        # Make sure compeititor ids are identical.
-        opn = groups[label]["opn"].sort("competitorId")
-        gms = groups[label]["gms"].sort("competitorId")
-        if not (opn["competitorId"] == gms["competitorId"]).all():
-            raise ValueError("Mismatched competitorIds.")
-        # Select only the most relevant columns, if desired.
-        df = opn[
-            [
-                "competitorName",
-                "competitorId",
-                "year",
-                "divisionId",
-                "age",
-                "height",
-                "weight",
-            ]
-        ]
-        # Rename the original columns in each data frame before adding them to df.
-        for col in [
-            "overallRank",
-            "overallScore",
-            "overallRerank",
-            "inverseNormalTransform",
-            "normalizedRank",
-        ]:
-            df = df.with_columns(opn[col].alias(col + "Open"))
-            df = df.with_columns(gms[col].alias(col + "Games"))
-        # Add differences of ranking columns.
-        for col in [
-            "overallRank",
-            "overallRerank",
-            "inverseNormalTransform",
-            "normalizedRank",
-        ]:
-            df = df.with_columns(
-                (df[col + "Games"] - df[col + "Open"]).alias(col + "Difference")
-            )
-        # Finally, add this frame to the final dict.
-        difs[label] = df
-    return difs
+    relevant columns with ...Open and ...Games as appropriate. To merge every group
+    of a consolidated frame, analysis.merge_open_games does it in one query. The
+    merged groups keep the labels of the groups given."""
+    opn, gms = [
+        Boards(pl.concat([groups[label][side] for label in groups]).lazy())
+        for side in ["opn", "gms"]
+    ]
+    merged = (
+        merge_open_games_pairs(opn, gms)
+        .collect()
+        .partition_by("year", "divisionId", as_dict=True)
+    )
+    # Each group is one year and division, so its first row says which it is.
+    return {
+        label: merged[(group["opn"]["year"][0], group["opn"]["divisionId"][0])]
+        for label, group in groups.items()
+    }
 
 
 def setup_overall_open_games_regression(
-    boards: pl.DataFrame, divisionIds: list[int] | None = None
+    boards: pl.DataFrame,
+    divisionIds: list[int] | None = None,
+    cache: DerivedCache | None = None,
 ) -> tuple[list[str], dict[str], pm.Model]:
     """Sets up a hierarchical pymc model for regressions between transformed
     Open rankings and transformed Games rankings, indluding only specified
-    division numbers."""
+    division numbers. The groups are reused from a derived cache, if given."""
 
-    groups = create_open_games_groups(boards, divisionIds)
+    groups = create_open_games_groups(boards, divisionIds, cache)
 
     ngroup = len(groups)
     labels = sorted(groups.keys())
@@ -118,22 +116,18 @@ def create_physical_regression_groups(
     competitionType: str,
     divisionIds: list[int] | None = None,
     max_rank: int | None = None,
+    cache: DerivedCache | None = None,
 ) -> tuple[dict, tuple[pl.DataFrame, pl.DataFrame]]:
     """Splits a data frame into year-division sub frames, taking only
     Games results, and adds appropriate column transformations and
-    standardizations."""
+    standardizations, which are reused from a derived cache, if given."""
 
     if max_rank is not None:
         df = df.filter(pl.col("overallRank") <= max_rank)
     if divisionIds is not None:
         df = df.filter(pl.col("divisionId").is_in(divisionIds))
-    df, means, stds = prepare_overall_characteristics(df, competitionType)
-    groups = dict()
-    for key, group in df.group_by("year", "divisionId"):
-        year, divisionId = key
-        label = f"{year} {get_division_name(divisionId)}"
-        groups[label] = group
-    return groups, (means, stds)
+    df, means, stds = prepare_overall_characteristics(df, competitionType, cache)
+    return split_groups(df), (means, stds)
 
 
 def setup_overall_physical_regression(
@@ -142,6 +136,7 @@ def setup_overall_physical_regression(
     divisionIds: list[int] | None = None,
     max_rank: int | None = None,
     years: list[int] | None = None,
+    cache: DerivedCache | None = None,
 ) -> pm.Model:
     """Sets up hierarchical a pymc model for regressions of height, weight, and age
     against transformed rankings for all specified divisions and years. The model
@@ -152,7 +147,7 @@ def setup_overall_physical_regression(
 
     # Ignoring the standardization information for now.
     groups, _ = create_physical_regression_groups(
-        boards, competitionType, divisionIds, max_rank
+        boards, competitionType, divisionIds, max_rank, cache
     )
 
     ngroup = len(groups)
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep
+
+# Requests per second at the start of a download.
+DEFAULT_RATE = 10.0
+
+# Bounds on the request rate.
+DEFAULT_MIN_RATE = 0.1
+
+DEFAULT_MAX_RATE = 200.0
+
+# Response statuses that mean the server wants fewer requests.
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Converts the value of a Retry-After header, which is either a number of
+    seconds or an HTTP date, into a number of seconds to wait."""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass
+class RateCounts:
+    # Requests that were let through the limiter.
+    requests: int = 0
+    # Requests that succeeded.
+    successes: int = 0
+    # Responses asking for less traffic (429 or 5xx) and connection failures.
+    throttles: int = 0
+    # Requests that were repeated after a failure.
+    retries: int = 0
+
+
+class RateLimiter:
+    """A token bucket shared by every worker in a download, whether they are threads
+    or coroutines. The refill rate is adjusted by additive increase on success and
+    multiplicative decrease when the server pushes back, so throughput climbs to
+    whatever the server tolerates. A Retry-After header pauses all workers."""
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        *,
+        min_rate: float = DEFAULT_MIN_RATE,
+        max_rate: float = DEFAULT_MAX_RATE,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        burst: float = 1.0,
+        cooldown: float = 1.0,
+    ):
+        if not (0 < min_rate <= rate <= max_rate):
+            raise ValueError(
+                f"Rates must satisfy 0 < min_rate <= rate <= max_rate but got {min_rate=}, {rate=}, {max_rate=}."
+            )
+        if not (0 < decrease < 1):
+            raise ValueError(
+                f"The decrease factor must be in (0,1) but got {decrease}."
+            )
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        # Roughly the number of requests per second added to the rate per second.
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        # Minimum seconds between decreases, so that a burst of failures from
+        # requests that were already in flight only counts once.
+        self.cooldown = cooldown
+        self.counts = RateCounts()
+        self._tokens = burst
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._decreased = -float("inf")
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Takes a token, possibly going into debt, and returns the number of
+        seconds to wait before using it."""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            self.counts.requests += 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._paused_until - now)
+
+    def acquire(self) -> None:
+        """Blocks until a request may be sent."""
+        sleep(self._reserve())
+        return None
+
+    async def acquire_async(self) -> None:
+        """Waits, without blocking the event loop, until a request may be sent."""
+        await asyncio.sleep(self._reserve())
+        return None
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.counts.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+        return None
+
+    def throttled(self, retry_after: float | None = None) -> None:
+        """Cuts the rate for everyone and, if the server said how long to wait,
+        pauses everyone for that long."""
+        with self._lock:
+            now = monotonic()
+            self.counts.throttles += 1
+            if now - self._decreased > self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._decreased = now
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+        return None
+
+    def retried(self) -> None:
+        with self._lock:
+            self.counts.retries += 1
+        return None
+
+    def reset_counts(self) -> RateCounts:
+        """Returns the counts so far and starts new ones. The rate is kept."""
+        with self._lock:
+            counts, self.counts = self.counts, RateCounts()
+        return counts
+
+    def summary(self, counts: RateCounts | None = None) -> str:
+        if counts is None:
+            counts = self.counts
+        return (
+            f"Request rate is {self.rate:.2f}/s after {counts.requests} request(s), "
+            f"{counts.successes} success(es), {counts.throttles} throttled response(s), "
+            f"and {counts.retries} retry(ies)."
+        )
@@ -0,0 +1,480 @@
+import asyncio
+import heapq
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+
+import fsspec
+import humanize
+import numpy as np
+from rich.progress import Progress
+
+from . import fetch, misc, tabulate
+from .archive import ArchiveWriter, archive_subdir, check_codec
+from .download import (
+    BoardsConfig,
+    check_competition_years,
+    discover_last_pages_async,
+    downloaded_last_page,
+    fetch_and_sleep,
+    MANIFEST_SAVE_INTERVAL,
+)
+from .httpcache import HttpCache
+from .manifest import PageWriter, load_manifest
+from .ratelimit import RateLimiter
+
+# Most pages in one work item, so that big divisions are shared among workers.
+DEFAULT_ITEM_PAGES = 20
+
+# Seconds a division's lease lasts unless it is renewed.
+DEFAULT_LEASE_TTL = 300.0
+
+# Seconds to wait after writing a lease before reading it back, so that another
+# process writing at the same moment is noticed.
+LEASE_SETTLE = 1.0
+
+LEASE_NAME = "lease.json"
+
+# Seconds between attempts at a division leased by another process.
+LEASE_POLL = 30.0
+
+# Seconds between reports of overall progress in the log.
+REPORT_INTERVAL = 60.0
+
+
+@dataclass(order=True)
+class WorkItem:
+    # Items of the divisions with the most pages left are taken first, which keeps
+    # one big division from being left for the end. Items of the same priority are
+    # taken from their first pages on, then in order of the other fields.
+    priority: int
+    first_page: int
+    year: int
+    division: int
+    last_page: int
+
+    @property
+    def pages(self) -> int:
+        return self.last_page - self.first_page + 1
+
+
+def split_pages(pages: list[int], item_pages: int) -> list[tuple[int, int]]:
+    """Splits sorted page numbers into (first, last) ranges of neighboring pages,
+    each with at most item_pages pages."""
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1 and page - ranges[-1][0] < item_pages:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return [(first, last) for first, last in ranges]
+
+
+def plan_work(
+    manifests: dict, last_pages: dict, min_page: int, force: bool, item_pages: int
+) -> list[WorkItem]:
+    """Turns the last page of each (year, division) into work items covering the
+    pages that aren't in the division's manifest, or every page if forced. Items
+    are prioritized by the number of pages left in their division."""
+    items = []
+    for key, last_page in last_pages.items():
+        year, division = key
+        pages = [
+            page
+            for page in range(min_page, last_page + 1)
+            if force or page not in manifests[key].pages
+        ]
+        for first, last in split_pages(pages, item_pages):
+            items.append(WorkItem(-len(pages), first, year, division, last))
+    heapq.heapify(items)
+    return items
+
+
+class Leases:
+    """Leases on divisions, kept as small files next to their manifests, so that
+    several processes or machines sharing an output file system download different
+    divisions. Object stores don't offer compare-and-swap, so a lease is written and
+    then read back after a pause, and only counts if it still names this owner.
+    Leases expire unless renewed, so a process that dies doesn't hold its divisions
+    forever."""
+
+    def __init__(
+        self, fs, owner: str | None = None, ttl: float = DEFAULT_LEASE_TTL
+    ) -> None:
+        self.fs = fs
+        self.owner = (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+            if owner is None
+            else owner
+        )
+        self.ttl = ttl
+        self.held = set()
+        self._lock = threading.Lock()
+
+    def path(self, output_subdir: str) -> str:
+        return self.fs.sep.join([output_subdir, LEASE_NAME])
+
+    def read(self, output_subdir: str) -> dict | None:
+        try:
+            return json.loads(self.fs.cat_file(self.path(output_subdir)))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def write(self, output_subdir: str) -> None:
+        lease = {"owner": self.owner, "expires": time.time() + self.ttl}
+        self.fs.makedirs(output_subdir, exist_ok=True)
+        misc.write_atomic(self.fs, self.path(output_subdir), json.dumps(lease).encode())
+        return None
+
+    def acquire(self, output_subdir: str) -> bool:
+        """Takes the lease on a division unless another owner holds it."""
+        lease = self.read(output_subdir)
+        if lease is not None and lease["owner"] != self.owner:
+            if lease["expires"] > time.time():
+                return False
+        self.write(output_subdir)
+        time.sleep(LEASE_SETTLE)
+        lease = self.read(output_subdir)
+        if lease is None or lease["owner"] != self.owner:
+            return False
+        with self._lock:
+            self.held.add(output_subdir)
+        return True
+
+    def renew(self) -> None:
+        with self._lock:
+            held = list(self.held)
+        for output_subdir in held:
+            self.write(output_subdir)
+        return None
+
+    def release(self, output_subdir: str) -> None:
+        with self._lock:
+            self.held.discard(output_subdir)
+        lease = self.read(output_subdir)
+        if lease is not None and lease["owner"] == self.owner:
+            self.fs.rm_file(self.path(output_subdir))
+        return None
+
+
+@dataclass
+class DivisionState:
+    # Where the division's pages are written.
+    output_subdir: str
+    # Writes the division's pages and its manifest.
+    writer: PageWriter
+    # Keeps the division's raw boards, if archiving.
+    archive: ArchiveWriter | None
+    # Boards fetched while finding the last page, by page number.
+    boards: dict[int, dict]
+    # Work items of the division that haven't finished.
+    remaining: int
+
+
+@dataclass
+class Tally:
+    # Pages in all work items.
+    total: int = 0
+    # Pages downloaded, skipped because they were already present, and failed.
+    downloaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    start: float = field(default_factory=perf_counter)
+
+    @property
+    def done(self) -> int:
+        return self.downloaded + self.skipped + self.failed
+
+    def summary(self) -> str:
+        elapsed = perf_counter() - self.start
+        rate = self.done / max(elapsed, 1e-9)
+        eta = (
+            humanize.naturaldelta((self.total - self.done) / rate)
+            if rate > 0
+            else "unknown"
+        )
+        return (
+            f"{self.done} of {self.total} page(s) done ({self.downloaded} downloaded, "
+            f"{self.skipped} skipped, {self.failed} failed) at {rate:.1f}/s, "
+            f"with about {eta} left."
+        )
+
+
+def schedule_boards(
+    conf: BoardsConfig,
+    *,
+    item_pages: int = DEFAULT_ITEM_PAGES,
+    lease_ttl: float = DEFAULT_LEASE_TTL,
+    lease_poll: float = LEASE_POLL,
+    owner: str | None = None,
+) -> Tally:
+    """Downloads everything a BoardsConfig asks for through one queue of work items
+    covering every year and division, instead of one division at a time. The last
+    pages of all divisions are found first, then the missing pages are split into
+    items of at most item_pages pages and taken largest first by conf.max_in_flight
+    workers, each with its own connection and all sharing the rate limiter. Before
+    working on a division, a worker takes its lease, so other processes or machines
+    running this with the same output directory download other divisions, and
+    divisions leased elsewhere are tried again every lease_poll seconds until their
+    leases are released or expire. Progress and an estimate of the time left for
+    everything are shown and logged. conf.mode is not used, since every worker
+    already runs on its own."""
+    logger = misc.initialize_logger(
+        __name__, filename=f"schedule_boards_{conf.competition}.log"
+    )
+    years, divisions = conf.years, conf.divisions
+    if isinstance(years, int):
+        years = [years]
+    if divisions is None:
+        divisions = list(range(1, 11)) + list(range(12, 40))
+    check_competition_years(conf.competition, years)
+    if np.max(divisions) > 39:
+        raise ValueError(
+            f"The highest division number is 39 but got {np.max(divisions)}."
+        )
+    if conf.max_in_flight < 1:
+        raise ValueError(
+            f"At least one worker is needed but got max_in_flight={conf.max_in_flight}."
+        )
+    if item_pages < 1:
+        raise ValueError(f"Work items need at least one page but got {item_pages=}.")
+    if conf.archive is not None:
+        check_codec(conf.archive)
+
+    fs, url = fsspec.url_to_fs(conf.output_directory)
+    limiter = RateLimiter(conf.rate, max_rate=conf.max_rate)
+    leases = Leases(fs, owner, lease_ttl)
+    cache = (
+        None
+        if conf.http_cache is None
+        else HttpCache(conf.http_cache, conf.http_cache_ttl, conf.http_cache_bytes)
+    )
+    subdirs = {
+        (year, division): fs.sep.join(
+            [url, "boards", conf.competition, str(year), f"division-{division:02}"]
+        )
+        for year in years
+        for division in divisions
+    }
+
+    # Find every last page first, so that the whole queue is known.
+    with ThreadPoolExecutor() as executor:
+        manifests = dict(
+            zip(subdirs, executor.map(lambda d: load_manifest(fs, d), subdirs.values()))
+        )
+    discoveries = {}
+    for year in years:
+        starts = {
+            division: downloaded_last_page(manifests[year, division])
+            for division in divisions
+        }
+        with fetch.use_cache(cache):
+            found = asyncio.run(
+                discover_last_pages_async(
+                    conf.competition,
+                    year,
+                    starts,
+                    conf.min_page,
+                    conf.max_page,
+                    max_in_flight=conf.max_in_flight,
+                    root=conf.api_root,
+                    limiter=limiter,
+                )
+            )
+        discoveries |= {(year, division): found[division] for division in divisions}
+    logger.info(limiter.summary(limiter.reset_counts()))
+    items = plan_work(
+        manifests,
+        {key: discovery.last_page for key, discovery in discoveries.items()},
+        conf.min_page,
+        conf.force,
+        item_pages,
+    )
+    counts = {}
+    for item in items:
+        counts[item.year, item.division] = counts.get((item.year, item.division), 0) + 1
+    tally = Tally(total=sum(item.pages for item in items))
+    logger.info(
+        f"Planned {len(items)} work item(s) with {tally.total} page(s) in {len(counts)} division(s) for {conf.max_in_flight} worker(s), as {leases.owner}."
+    )
+
+    # Items of divisions leased by someone else wait here, by when to try again.
+    waiting = []
+    states = {}
+    queue_lock = threading.Lock()
+    # Signaled when items are requeued or finished, or when stopping.
+    available = threading.Condition(queue_lock)
+    # Items taken by workers and not yet finished or requeued. Workers only stop
+    # when nothing is queued and nothing is in flight, since items in flight can
+    # still be requeued.
+    in_flight = 0
+    division_locks = {key: threading.Lock() for key in counts}
+    stop = threading.Event()
+
+    def take() -> WorkItem | None:
+        nonlocal in_flight
+        with available:
+            while True:
+                if stop.is_set():
+                    return None
+                if items:
+                    in_flight += 1
+                    return heapq.heappop(items)
+                if waiting:
+                    retry, item = heapq.heappop(waiting)
+                    in_flight += 1
+                    break
+                if in_flight == 0:
+                    return None
+                available.wait()
+        # Everything left belongs to divisions leased elsewhere.
+        if stop.wait(max(0.0, retry - time.time())):
+            return None
+        return item
+
+    def finish(item: WorkItem, retry: float | None = None) -> None:
+        """Ends a taken item, putting it back to wait until retry if given."""
+        nonlocal in_flight
+        with available:
+            if retry is not None:
+                heapq.heappush(waiting, (retry, item))
+            in_flight -= 1
+            available.notify_all()
+        return None
+
+    def claim(key) -> DivisionState | None:
+        with division_locks[key]:
+            if key in states:
+                return states[key]
+            output_subdir = subdirs[key]
+            if not leases.acquire(output_subdir):
+                return None
+            # Read the manifest again, since another process may have added pages.
+            writer = PageWriter(
+                fs,
+                output_subdir,
+                load_manifest(fs, output_subdir),
+                chunk_pages=conf.chunk_pages,
+                chunk_bytes=conf.chunk_bytes,
+            )
+            writer.set_last_page(discoveries[key].last_page)
+            states[key] = DivisionState(
+                output_subdir,
+                writer,
+                (
+                    None
+                    if conf.archive is None
+                    else ArchiveWriter(
+                        fs,
+                        archive_subdir(fs, url, conf.competition, *key),
+                        conf.archive,
+                    )
+                ),
+                discoveries[key].boards,
+                counts[key],
+            )
+            logger.info(f"Started {conf.competition} {key[0]} division {key[1]}.")
+            return states[key]
+
+    def close(key) -> None:
+        state = states.pop(key)
+        state.writer.close()
+        if state.archive is not None:
+            state.archive.close()
+        leases.release(state.output_subdir)
+        return None
+
+    def run(item: WorkItem, state: DivisionState, progress, task) -> None:
+        for page in range(item.first_page, item.last_page + 1):
+            if stop.is_set():
+                return None
+            if not conf.force and page in state.writer.manifest.pages:
+                outcome = "skipped"
+            else:
+                board = state.boards.pop(page, None)
+                if board is None:
+                    board = fetch_and_sleep(
+                        conf.competition,
+                        item.year,
+                        item.division,
+                        page,
+                        ignore_failures=conf.ignore_failures,
+                        logger=logger,
+                        root=conf.api_root,
+                        limiter=limiter,
+                    )
+                if board is None:
+                    outcome = "failed"
+                else:
+                    if state.archive is not None:
+                        state.archive.write(page, board)
+                    state.writer.write(page, tabulate.tabulate_leaderboard(board))
+                    outcome = "downloaded"
+            with queue_lock:
+                setattr(tally, outcome, getattr(tally, outcome) + 1)
+                save = tally.downloaded % MANIFEST_SAVE_INTERVAL == 0
+            if outcome == "downloaded" and save:
+                state.writer.save()
+            progress.advance(task)
+        return None
+
+    def worker(progress, task) -> None:
+        try:
+            while (item := take()) is not None:
+                key = (item.year, item.division)
+                state = claim(key)
+                if state is None:
+                    finish(item, retry=time.time() + lease_poll)
+                    continue
+                run(item, state, progress, task)
+                with division_locks[key]:
+                    state.remaining -= 1
+                    if state.remaining == 0:
+                        close(key)
+                finish(item)
+        except BaseException:
+            stop.set()
+            with available:
+                available.notify_all()
+            raise
+
+    def monitor() -> None:
+        # Reports progress and keeps the leases alive until the workers finish.
+        interval = min(REPORT_INTERVAL, lease_ttl / 3)
+        while not finished.wait(interval):
+            leases.renew()
+            logger.info(tally.summary())
+
+    finished = threading.Event()
+    watcher = threading.Thread(target=monitor, daemon=True)
+    watcher.start()
+    try:
+        with (
+            Progress() as progress,
+            ThreadPoolExecutor(conf.max_in_flight) as threads,
+            fetch.use_cache(cache),
+        ):
+            task = progress.add_task("Downloading...", total=tally.total)
+            futures = [
+                threads.submit(worker, progress, task)
+                for _ in range(conf.max_in_flight)
+            ]
+        for future in futures:
+            future.result()
+    finally:
+        finished.set()
+        watcher.join()
+        # Keep whatever was written by divisions that didn't finish.
+        for key in list(states):
+            close(key)
+    logger.info(tally.summary())
+    logger.info(limiter.summary(limiter.reset_counts()))
+    if cache is not None:
+        logger.info(cache.summary())
+    return tally
@@ -0,0 +1,152 @@
+import functools
+import re
+
+import polars as pl
+
+from . import misc
+
+# Types of the parsed score columns.
+SCORE_SCHEMA = {
+    "workoutSeconds": pl.Float32,
+    "workoutReps": pl.Int32,
+    "workoutKilograms": pl.Float32,
+    "workoutCapped": pl.Boolean,
+}
+
+# Pounds to kilograms, the same factor as in clean.clean_weight.
+LB_TO_KG = 0.454
+
+# Score displays are a time, possibly followed by a cap and the reps that were left,
+# a cap on its own, reps, a load, or a bare number. Scaled scores end with " - s".
+SCORE_PATTERN = (
+    r"(?i)^\s*(?:"
+    r"(?:(?P<hours>\d+):)?(?P<minutes>\d+):(?P<seconds>\d+(?:\.\d+)?)"
+    r"(?:\s*-\s*cap\s*\+\s*(?P<timeCapReps>\d+))?"
+    r"|cap\s*\+\s*(?P<capReps>\d+)"
+    r"|(?P<reps>\d+)\s*reps?"
+    r"|(?P<load>\d+(?:\.\d+)?)\s*(?P<unit>lb|kg)s?\.?"
+    r"|(?P<bare>\d+)"
+    r")(?:\s*-\s*s)?\s*$"
+)
+
+# Phrases in workout descriptions that give away how a workout is scored, in order
+# of precedence when a description contains more than one.
+KIND_PHRASES = {
+    "load": [r"rep[- ]max", r"max(imum)? load", r"heaviest"],
+    "reps": [r"amrap", r"as many (rounds|reps)", r"as long as possible", r"max reps"],
+    "time": [r"for (total )?time", r"time cap"],
+}
+
+
+def infer_workout_kind(description: str | None) -> str | None:
+    """Guesses whether a workout is scored by time, reps, or load from its text
+    description, returning None if the text doesn't say."""
+    if description is None:
+        return None
+    description = description.lower()
+    for kind, phrases in KIND_PHRASES.items():
+        if any(re.search(phrase, description) for phrase in phrases):
+            return kind
+    return None
+
+
+@functools.cache
+def workout_kinds() -> dict[str, str]:
+    """Infers the kind of every workout with a description in the workouts
+    directory, keyed like workout_key."""
+    kinds = {}
+    for path in sorted((misc.get_root_dir() / "workouts").glob("*/*/*.txt")):
+        competition, year, number = re.fullmatch(
+            r"(\w+)_(\d+)_individual_workout_(\d+)", path.stem
+        ).groups()
+        kind = infer_workout_kind(path.read_text())
+        if kind is not None:
+            kinds[f"{competition}-{int(year)}-{int(number)}"] = kind
+    return kinds
+
+
+def workout_key() -> pl.Expr:
+    """Identifies the workout of each row of a leaderboard frame."""
+    return pl.concat_str(
+        pl.col("competitionType"),
+        pl.col("year"),
+        pl.col("workoutNumber"),
+        separator="-",
+    )
+
+
+def score_groups_expr(score: pl.Expr) -> pl.Expr:
+    """Matches a column of score display strings against SCORE_PATTERN, giving a
+    struct with a field for each group."""
+    return score.str.extract_groups(SCORE_PATTERN)
+
+
+def parse_score_exprs(
+    groups: pl.Expr, scored_by_reps: pl.Expr | None = None
+) -> dict[str, pl.Expr]:
+    """Expressions turning the struct column from score_groups_expr into the columns
+    of SCORE_SCHEMA. Times are in seconds and loads in kilograms. Capped scores have
+    the time cap in seconds, if it was shown, and the number of reps that were
+    left. Bare numbers are only read as reps where the boolean scored_by_reps
+    column says the workout was scored by reps. Anything else unrecognized is
+    null."""
+    field = groups.struct.field
+    seconds = (
+        field("hours").cast(pl.Float64).fill_null(0) * 3600
+        + field("minutes").cast(pl.Float64) * 60
+        + field("seconds").cast(pl.Float64)
+    )
+    cap_reps = pl.coalesce(field("timeCapReps"), field("capReps"))
+    # Every group is null where the pattern didn't match.
+    matched = pl.any_horizontal(
+        field(name).is_not_null() for name in re.compile(SCORE_PATTERN).groupindex
+    )
+    reps = field("reps")
+    if scored_by_reps is not None:
+        reps = reps.fill_null(pl.when(scored_by_reps).then(field("bare")))
+    kilograms = field("load").cast(pl.Float64) * (
+        pl.when(field("unit").str.to_lowercase() == "lb").then(LB_TO_KG).otherwise(1)
+    )
+    return {
+        "workoutSeconds": seconds.cast(pl.Float32),
+        "workoutReps": pl.coalesce(cap_reps, reps).cast(pl.Int32, strict=False),
+        "workoutKilograms": kilograms.cast(pl.Float32),
+        "workoutCapped": pl.when(matched).then(cap_reps.is_not_null()),
+    }
+
+
+def with_parsed_scores(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Adds the parsed score columns to a leaderboard frame, using the workout
+    descriptions to guide parsing of scores without units."""
+    # A membership test, unlike mapping every key to its kind, can be streamed.
+    reps_keys = [key for key, kind in workout_kinds().items() if kind == "reps"]
+    scored_by_reps = workout_key().is_in(reps_keys)
+    # Matching once into a temporary column keeps the regex from running again for
+    # every group that is used.
+    df = df.with_columns(_scoreGroups=score_groups_expr(pl.col("workoutScore")))
+    df = df.with_columns(**parse_score_exprs(pl.col("_scoreGroups"), scored_by_reps))
+    return df.drop("_scoreGroups")
+
+
+def parse_score(score: str | None, scored_by_reps: bool = False) -> dict:
+    """Parses a single score display string, like parse_score_exprs. This is much
+    slower than the expressions and only meant for checking them."""
+    parsed = dict.fromkeys(SCORE_SCHEMA)
+    if score is None or (m := re.match(SCORE_PATTERN, score)) is None:
+        return parsed
+    groups = m.groupdict()
+    if groups["minutes"] is not None:
+        parsed["workoutSeconds"] = (
+            float(groups["hours"] or 0) * 3600
+            + float(groups["minutes"]) * 60
+            + float(groups["seconds"])
+        )
+    cap_reps = groups["timeCapReps"] or groups["capReps"]
+    reps = groups["reps"] or (groups["bare"] if scored_by_reps else None)
+    if cap_reps or reps:
+        parsed["workoutReps"] = int(cap_reps or reps)
+    if groups["load"] is not None:
+        factor = LB_TO_KG if groups["unit"].lower() == "lb" else 1
+        parsed["workoutKilograms"] = float(groups["load"]) * factor
+    parsed["workoutCapped"] = cap_reps is not None
+    return parsed
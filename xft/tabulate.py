@@ -1,3 +1,4 @@
+import functools
 import polars as pl
 import numpy as np
 
@@ -26,6 +27,15 @@ COMPETITION_COLS = {
     "competitionType": str,
 }
 
+# Leaderboard score fields for each workout column.
+WORKOUT_COLS = {
+    "workoutNumber": "ordinal",
+    "workoutRank": "rank",
+    "workoutScore": "scoreDisplay",
+    "workoutValid": "valid",
+    "workoutScaled": "scaled",
+}
+
 CLEANING = {
     "height": clean.clean_height,
     "weight": clean.clean_weight,
@@ -37,6 +47,24 @@ CLEANING = {
     "workoutScaled": clean.clean_scaled,
 }
 
+# Polars equivalents of the numpy types used for parsing.
+POLARS_TYPES = {
+    np.int8: pl.Int8,
+    np.int16: pl.Int16,
+}
+
+# Vectorized counterparts of CLEANING, used on whole columns.
+CLEANING_EXPRS = {
+    "height": clean.clean_height_expr,
+    "weight": clean.clean_weight_expr,
+    "age": clean.clean_age_expr,
+    "gender": clean.clean_gender_expr,
+    "workoutRank": clean.clean_rank_expr,
+    "workoutScore": clean.clean_score_expr,
+    "workoutValid": clean.clean_valid_expr,
+    "workoutScaled": clean.clean_scaled_expr,
+}
+
 # Final types for all fields, using Polars classes.
 SCHEMA = {
     "competitorName": str,
@@ -64,6 +92,18 @@ SCHEMA = {
     "competitionType": str,
 }
 
+# Types for the repeated string columns of consolidated tables, which store each
+# distinct value once instead of once per row. Page files keep plain strings.
+CATEGORICAL_SCHEMA = {
+    "competitorName": pl.Categorical,
+    "status": pl.Categorical,
+    "countryOfOriginCode": pl.Categorical,
+    "countryOfOriginName": pl.Categorical,
+    "regionName": pl.Categorical,
+    "affiliateName": pl.Categorical,
+    "competitionType": pl.Enum(["games", "open"]),
+}
+
 
 def parse(value, target_type):
     try:
@@ -123,7 +163,9 @@ def tabulate_leaderboard_row(row: dict) -> pl.DataFrame:
     return pl.concat(map(pl.DataFrame, records), how="vertical_relaxed")
 
 
-def tabulate_leaderboard(board: dict) -> pl.DataFrame:
+def tabulate_leaderboard_rowwise(board: dict) -> pl.DataFrame:
+    """Tabulates a leaderboard one row, and one frame, at a time. This is slow but
+    simple and is kept as a reference for tabulate_leaderboard."""
     # Arrange the leaderboard into a table by concatenating individual rows.
     records = map(tabulate_leaderboard_row, board["leaderboardRows"])
     # Stack all the rows into one frame.
@@ -142,6 +184,105 @@ def tabulate_leaderboard(board: dict) -> pl.DataFrame:
     return df
 
 
+def parse_expr(column: pl.Expr, target_type) -> pl.Expr:
+    # Like parse, for a column of strings.
+    if target_type is str:
+        return column
+    column = column.str.strip_chars()
+    if target_type is int:
+        return column.cast(pl.Int64, strict=False)
+    return column.cast(POLARS_TYPES[target_type], strict=False)
+
+
+@functools.cache
+def leaderboard_exprs() -> dict[str, pl.Expr]:
+    """Parsing and cleaning expressions for the raw string columns of a leaderboard,
+    built once because constructing them costs about as much as running them."""
+    exprs = {}
+    for key, target_type in ENTRANT_COLS.items():
+        column = pl.col(key)
+        column = pl.when(column.is_in(["", "None"]).not_()).then(column)
+        exprs[key] = parse_expr(column, target_type)
+    for key in ("overallRank", "overallScore"):
+        exprs[key] = parse_expr(pl.col(key), int)
+    for key in WORKOUT_COLS:
+        exprs[key] = pl.col(key)
+    exprs["workoutNumber"] = parse_expr(exprs["workoutNumber"], np.int8)
+    for key, function in CLEANING_EXPRS.items():
+        exprs[key] = function(exprs[key])
+    return exprs
+
+
+def tabulate_leaderboard(board: dict) -> pl.DataFrame:
+    """Arranges a leaderboard into a table. The rows are walked once to fill a
+    buffer for each column, then whole columns are parsed and cleaned at once."""
+    columns = {
+        key: [] for key in [*ENTRANT_COLS, "overallRank", "overallScore", *WORKOUT_COLS]
+    }
+    entrant_buffers = [(key, columns[key]) for key in ENTRANT_COLS]
+    overall_buffers = [(key, columns[key]) for key in ("overallRank", "overallScore")]
+    workout_buffers = [(field, columns[key]) for key, field in WORKOUT_COLS.items()]
+    for row in board["leaderboardRows"]:
+        # Personal and overall information is repeated for each workout's results.
+        if "scores" in row:
+            scores = row["scores"]
+            n = len(scores)
+            for field, buffer in workout_buffers:
+                buffer.extend([score[field] for score in scores])
+        else:
+            # It's possible for this information to be missing...
+            n = 1
+            for _, buffer in workout_buffers:
+                buffer.append(None)
+        entrant = row["entrant"]
+        for key, buffer in entrant_buffers:
+            buffer.extend([entrant[key]] * n)
+        for key, buffer in overall_buffers:
+            buffer.extend([row[key]] * n)
+
+    # Everything starts as strings, as most values in the json are.
+    raw = pl.DataFrame(
+        [
+            pl.Series(key, values, dtype=pl.String, strict=False)
+            for key, values in columns.items()
+        ]
+    )
+
+    # Include some competition-wide columns as well.
+    competition = {
+        key: pl.lit(parse(board["competition"][key], target_type))
+        for key, target_type in COMPETITION_COLS.items()
+    }
+    exprs = leaderboard_exprs() | competition
+    df = raw.select(
+        exprs[key].cast(target_type).alias(key) for key, target_type in SCHEMA.items()
+    )
+
+    # Unknown units are null after cleaning, and an error just like with the
+    # scalar cleaning functions.
+    for key in ("height", "weight"):
+        unknown = raw[key].filter(df[key].is_null())
+        if len(unknown) > 0:
+            raise ValueError(
+                f"Not sure how to handle cleaning of {key} value '{unknown[0]}'."
+            )
+
+    return df
+
+
+def encode_categoricals(
+    df: pl.DataFrame | pl.LazyFrame,
+) -> pl.DataFrame | pl.LazyFrame:
+    """Casts the columns of CATEGORICAL_SCHEMA that a frame has to their
+    dictionary-encoded types."""
+    names = df.collect_schema().names()
+    return df.with_columns(
+        pl.col(key).cast(dtype)
+        for key, dtype in CATEGORICAL_SCHEMA.items()
+        if key in names
+    )
+
+
 def tabulate_leaderboards(boards: list[dict]) -> pl.DataFrame:
     # Simply stack together the boards for individual pages/sections.
     return pl.concat(map(tabulate_leaderboard, boards), how="vertical_relaxed")